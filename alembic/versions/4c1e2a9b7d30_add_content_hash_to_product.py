@@ -0,0 +1,28 @@
+"""Add content_hash to Product for incremental XML sync
+
+Revision ID: 4c1e2a9b7d30
+Revises: 19fa5f8d5a64
+Create Date: 2026-10-17 10:12:31.481207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1e2a9b7d30'
+down_revision: Union[str, Sequence[str], None] = '19fa5f8d5a64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'content_hash')
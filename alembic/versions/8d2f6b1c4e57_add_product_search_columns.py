@@ -0,0 +1,50 @@
+"""Add search_text (pg_trgm) and search_vector (full-text) to Product
+
+Revision ID: 8d2f6b1c4e57
+Revises: 4c1e2a9b7d30
+Create Date: 2026-10-17 13:40:08.215634
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f6b1c4e57'
+down_revision: Union[str, Sequence[str], None] = '4c1e2a9b7d30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('products', sa.Column('search_text', sa.Text(), nullable=True))
+    op.add_column('products', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('simple', coalesce(search_text, '')), 'A') || "
+            "setweight(to_tsvector('simple', translate(coalesce(description, ''), '''’ʼ`', '')), 'D')",
+            persisted=True
+        ),
+        nullable=True
+    ))
+    # Грубе заповнення до наступного імпорту; скидання content_hash змусить
+    # імпорт переписати всі картки з повною нормалізацією (search_normalizer).
+    op.execute("UPDATE products SET search_text = lower(name || ' ' || sku), content_hash = NULL")
+    op.create_index(
+        'ix_products_search_text_trgm', 'products', ['search_text'],
+        unique=False, postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}
+    )
+    op.create_index('ix_products_search_vector', 'products', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_search_vector', table_name='products', postgresql_using='gin')
+    op.drop_index('ix_products_search_text_trgm', table_name='products', postgresql_using='gin')
+    op.drop_column('products', 'search_vector')
+    op.drop_column('products', 'search_text')
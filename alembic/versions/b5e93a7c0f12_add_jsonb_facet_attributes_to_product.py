@@ -0,0 +1,51 @@
+"""Split Product.attributes into feed/AI JSONB sources with a GIN facet index
+
+Revision ID: b5e93a7c0f12
+Revises: 8d2f6b1c4e57
+Create Date: 2026-10-17 15:02:44.907163
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e93a7c0f12'
+down_revision: Union[str, Sequence[str], None] = '8d2f6b1c4e57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Стара колонка JSON завжди була порожня ({}), переносити нічого
+    op.execute("DROP INDEX IF EXISTS ix_products_attributes")
+    op.drop_column('products', 'attributes')
+    op.add_column('products', sa.Column('feed_attributes', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('products', sa.Column('ai_attributes', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('products', sa.Column(
+        'attributes', postgresql.JSONB(astext_type=sa.Text()),
+        sa.Computed(
+            "coalesce(ai_attributes, '{}'::jsonb) || coalesce(feed_attributes, '{}'::jsonb)",
+            persisted=True
+        ),
+        nullable=True
+    ))
+    op.create_index(
+        'ix_products_attributes_gin', 'products', ['attributes'],
+        unique=False, postgresql_using='gin', postgresql_ops={'attributes': 'jsonb_path_ops'}
+    )
+    # Наступний імпорт перепише всі картки і заповнить feed_attributes з <param>
+    op.execute("UPDATE products SET content_hash = NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_attributes_gin', table_name='products', postgresql_using='gin')
+    op.drop_column('products', 'attributes')
+    op.drop_column('products', 'ai_attributes')
+    op.drop_column('products', 'feed_attributes')
+    op.add_column('products', sa.Column('attributes', sa.JSON(), nullable=True))
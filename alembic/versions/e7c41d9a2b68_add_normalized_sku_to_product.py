@@ -0,0 +1,69 @@
+"""Add Product.sku_norm with unique (supplier_id, sku_norm) and lookup indexes
+
+Revision ID: e7c41d9a2b68
+Revises: b5e93a7c0f12
+Create Date: 2026-10-17 16:21:37.540218
+
+"""
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7c41d9a2b68'
+down_revision: Union[str, Sequence[str], None] = 'b5e93a7c0f12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Заморожена копія services.search_normalizer.normalize_sku_key на момент цієї ревізії:
+# міграція не імпортує код застосунку (він може змінитись після неї).
+_HOMOGLYPHS = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "є": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x",
+    "і": "i", "ї": "i", "ё": "e",
+})
+_LATIN_OR_DIGIT_RE = re.compile(r"[0-9a-z]")
+
+
+def _normalize_sku_key(sku):
+    if not sku:
+        return ""
+    key = " ".join(unicodedata.normalize("NFKC", sku).lower().split())
+    if _LATIN_OR_DIGIT_RE.search(key):
+        return key.translate(_HOMOGLYPHS)
+    return key
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('sku_norm', sa.String(length=100), nullable=True))
+
+    # Заповнюємо тією ж нормалізацією, що й імпорт (у SQL двійників кирилиці не повторити)
+    bind = op.get_bind()
+    rows = bind.execute(sa.text("SELECT id, sku FROM products")).all()
+    if rows:
+        bind.execute(
+            sa.text("UPDATE products SET sku_norm = :sku_norm WHERE id = :id"),
+            [{"id": product_id, "sku_norm": _normalize_sku_key(sku)} for product_id, sku in rows]
+        )
+
+    op.alter_column('products', 'sku_norm', nullable=False)
+    # Якщо тут впаде - у постачальника є артикули, що різняться лише регістром/двійниками:
+    # їх треба злити вручну перед міграцією.
+    op.create_index(
+        'uq_products_supplier_sku_norm', 'products', ['supplier_id', 'sku_norm'],
+        unique=True, postgresql_include=['id']
+    )
+    op.create_index('ix_products_sku_norm', 'products', ['sku_norm'], unique=False, postgresql_include=['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_sku_norm', table_name='products')
+    op.drop_index('uq_products_supplier_sku_norm', table_name='products')
+    op.drop_column('products', 'sku_norm')
@@ -0,0 +1,37 @@
+"""Add parent_order_number_seq for parent order UIDs
+
+Revision ID: f2a8c6d15e93
+Revises: e7c41d9a2b68
+Create Date: 2026-10-17 17:05:12.318846
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a8c6d15e93'
+down_revision: Union[str, Sequence[str], None] = 'e7c41d9a2b68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.schema.CreateSequence(sa.Sequence('parent_order_number_seq')))
+    # Продовжуємо після вже виданих номерів: старий алгоритм брав id останнього
+    # головного замовлення + 1, тож враховуємо і id, і номер з order_uid (TAV{n}...)
+    op.execute("""
+        SELECT setval('parent_order_number_seq', greatest(
+            (SELECT coalesce(max(id), 0) FROM orders WHERE parent_order_id IS NULL),
+            (SELECT coalesce(max(substring(order_uid FROM '^TAV([0-9]+)')::bigint), 0)
+               FROM orders WHERE parent_order_id IS NULL)
+        ) + 1, false)
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.schema.DropSequence(sa.Sequence('parent_order_number_seq')))
@@ -1,8 +1,8 @@
 # api_models.py
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, model_validator
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from database.models import SupplierType, SupplierStatus, OrderStatus, UserRole, PayoutMethod
+from database.models import SupplierType, SupplierStatus, OrderStatus, UserRole, PayoutMethod, PriceRuleType
 
 # --- МОДЕЛІ З `web_app.py` ---
 
@@ -23,12 +23,17 @@ class ProductVariantAPI(BaseModel):
     quantity: int
     is_available: bool
     option_value_ids: List[int] = Field(default_factory=list) 
+    @model_validator(mode="before")
     @classmethod
-    def from_orm(cls, obj: Any) -> 'ProductVariantAPI':
-        option_ids = [val.id for val in obj.option_values]
-        variant_api = super().from_orm(obj)
-        variant_api.option_value_ids = option_ids
-        return variant_api
+    def _collect_option_value_ids(cls, obj: Any) -> Any:
+        # ORM ProductVariant: id значень опцій беремо з option_values (мають бути підвантажені)
+        if isinstance(obj, dict) or not hasattr(obj, "option_values"):
+            return obj
+        return {
+            "id": obj.id, "supplier_offer_id": obj.supplier_offer_id,
+            "final_price": obj.final_price, "quantity": obj.quantity, "is_available": obj.is_available,
+            "option_value_ids": [val.id for val in obj.option_values],
+        }
 class ProductAPI(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     id: int
@@ -41,6 +46,18 @@ class ProductAPI(BaseModel):
     options: List[ProductOptionAPI] = []
     variants: List[ProductVariantAPI] = []
     
+class CatalogFacetValueAPI(BaseModel):
+    value: str
+    count: int
+class CatalogFacetAPI(BaseModel):
+    name: str # "Розмір", "Колір", "Бренд"...
+    values: List[CatalogFacetValueAPI] = []
+class CatalogPageAPI(BaseModel):
+    items: List[ProductAPI] = []
+    facets: List[CatalogFacetAPI] = []
+    total: int = 0
+    next_cursor: Optional[int] = None
+
 class CustomerDataAPI(BaseModel):
     pib: str = Field(..., min_length=5)
     phone: str = Field(..., min_length=10)
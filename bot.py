@@ -17,7 +17,8 @@ from aiogram.types import (
 
 from config_reader import config
 from database.db import init_db
-from services import telethon_service, scheduler_service
+from services import telethon_service, scheduler_service, product_cache, variant_cache, outbox_service, telegram_sender
+from services import order_service # noqa: F401 - реєструє обробники outbox
 from handlers import (
     user_commands,
     product_handlers,
@@ -86,6 +87,7 @@ async def main():
         token=config.bot_token.get_secret_value(),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    telegram_sender.install(bot) # Усі відправки - через спільний планувальник (ліміти, пріоритети)
     dp = Dispatcher(storage=storage)
 
     # Реєстрація роутерів
@@ -105,6 +107,9 @@ async def main():
     # Передаємо 'bot' у сервіси, яким він потрібен
     asyncio.create_task(telethon_service.start_telethon_client(bot))
     asyncio.create_task(scheduler_service.start_scheduler(bot))
+    asyncio.create_task(outbox_service.run_dispatcher(bot)) # Сповіщення про замовлення (і з web_app)
+    product_cache.start_product_cache()
+    variant_cache.start_variant_cache()
 
     try:
         await bot.delete_webhook(drop_pending_updates=True)
@@ -34,6 +34,8 @@ class Settings(BaseSettings):
     mydrop_api_key: SecretStr
     mydrop_export_url: AnyUrl
     mydrop_orders_url: AnyUrl
+    xml_cache_ttl_min: int = 30 # Як часто перевіряти XML-фіди постачальників
+    xml_import_concurrency: int = 3 # Скільки фідів імпортуємо одночасно
     
     # --- База даних та Redis ---
     database_url: AnyUrl
@@ -49,6 +51,7 @@ class Settings(BaseSettings):
     
     # --- Файли ---
     posted_ids_file_path: Path = Path("data/posted_ids.txt")
+    xml_cache_dir: Path = Path("data/xml_cache") # Останні успішні XML-фіди + ETag/Last-Modified
     
     # --- MiniApp ---
     webapp_url: Optional[AnyUrl] = None
@@ -2,8 +2,9 @@
 import enum
 from sqlalchemy import (
     Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float,
-    Enum, UniqueConstraint, JSON
+    Enum, UniqueConstraint, JSON, Index, Computed, Sequence
 )
+from sqlalchemy.dialects.postgresql import TSVECTOR, JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database.db import Base
@@ -131,11 +132,13 @@ class Product(Base):
     id = Column(Integer, primary_key=True)
     supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=False, index=True)
     sku = Column(String(100), nullable=False, index=True) # Головний SKU/Артикул
+    # Ключ точного пошуку SKU (services/search_normalizer.normalize_sku_key):
+    # регістр, пробіли, кирилиця-двійники латиниці. Пише catalog_writer.
+    sku_norm = Column(String(100), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
     pictures = Column(JSON) # Список URL: ["url1", "url2"]
     category_tag = Column(String(100), index=True) # Категорія (napr. 'shoes')
-    attributes = Column(JSON, index=True)
 
     # --- ДОДАЙ ЦЕЙ РЯДОК (ДЛЯ "ЧЕРГИ" ТОВАРІВ) ---
     last_posted_at = Column(DateTime(timezone=True), nullable=True, index=True)
@@ -143,12 +146,32 @@ class Product(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # JSONB поле для динамічних фільтрів (Твоя ідея!)
-    # Напр: {"brand": "Nike", "year": 2024, "material": "Leather"}
-    attributes = Column(JSON, index=True) 
+    # Значення - завжди списки: {"Бренд": ["Nike"], "Розмір": ["S", "M"]}
+    # (тоді фільтр будь-якого значення = `attributes @> {"Розмір": ["M"]}` по GIN-індексу)
+    feed_attributes = Column(JSONB, nullable=True) # З <param> фіду (переписує імпорт)
+    ai_attributes = Column(JSONB, nullable=True) # Від Gemini (NULL = ще не оброблено)
+    attributes = Column(JSONB, Computed(
+        "coalesce(ai_attributes, '{}'::jsonb) || coalesce(feed_attributes, '{}'::jsonb)",
+        persisted=True
+    )) # Фід важливіший за AI при збігу ключів
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_updated = Column(DateTime(timezone=True), onupdate=func.now())
-    
+
+    # Відбиток вмісту групи offers з XML (назва, опис, фото, параметри, ціна, залишки).
+    # Якщо не змінився - імпорт пропускає групу.
+    content_hash = Column(String(64), nullable=True)
+
+    # --- Пошук (див. services/search_service.py) ---
+    # Нормалізовані назва + SKU (services/search_normalizer.py), trigram-індекс
+    search_text = Column(Text, nullable=True)
+    # Full-text: search_text (вага A) + опис (вага D). Рахує сам Postgres.
+    search_vector = Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', coalesce(search_text, '')), 'A') || "
+        "setweight(to_tsvector('simple', translate(coalesce(description, ''), '''’ʼ`', '')), 'D')",
+        persisted=True
+    ))
+
     # Зв'язки
     supplier = relationship("Supplier", back_populates="products")
     options = relationship("ProductOption", back_populates="product")
@@ -157,6 +180,15 @@ class Product(Base):
     
     __table_args__ = (
         UniqueConstraint("supplier_id", "sku", name="uq_supplier_sku"),
+        # INCLUDE id - пошук по SKU обходиться index-only scan (services/product_lookup.py)
+        Index("uq_products_supplier_sku_norm", "supplier_id", "sku_norm", unique=True,
+              postgresql_include=["id"]),
+        Index("ix_products_sku_norm", "sku_norm", postgresql_include=["id"]),
+        Index("ix_products_search_text_trgm", "search_text", postgresql_using="gin",
+              postgresql_ops={"search_text": "gin_trgm_ops"}),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_products_attributes_gin", "attributes", postgresql_using="gin",
+              postgresql_ops={"attributes": "jsonb_path_ops"}),
     )
 
 class ProductOption(Base):
@@ -229,6 +261,10 @@ class ProductVariantOptionValue(Base):
 
 
 # --- Таблиці Замовлень ---
+# Номер головного замовлення (TAV{n}...). nextval не блокує і не відкочується -
+# паралельні оформлення не конфліктують (див. order_service.allocate_parent_order).
+parent_order_number_seq = Sequence("parent_order_number_seq", metadata=Base.metadata)
+
 class Order(Base):
     """(Оновлено для Плану 25)
     ...
@@ -386,4 +422,39 @@ class PriceRule(Base):
     rule_type = Column(Enum(PriceRuleType), nullable=False)
     value = Column(Float, nullable=False) # 33.0 (для %) або 100.0 (для фікс.)
     
-    is_active = Column(Boolean, default=True)
\ No newline at end of file
+    is_active = Column(Boolean, default=True)
+
+class OutboxStatus(str, enum.Enum):
+    pending = "pending" # Чекає відправки (або повтору)
+    sent = "sent"       # Доставлено
+    failed = "failed"   # Вичерпано спроби / помилка, яку повтор не виправить
+
+class OutboxMessage(Base):
+    """
+    Transactional outbox: побічні дії (сповіщення, пости) пишуться в одній
+    транзакції з замовленням, а відправляє їх `outbox_service` у фоні.
+    Нічого не губиться при падінні процесу і не затримує оформлення.
+    """
+    __tablename__ = "outbox_messages"
+    id = Column(Integer, primary_key=True)
+
+    kind = Column(String(50), nullable=False) # Обробник: "order.customer_notification", ...
+    destination = Column(String(20), nullable=False) # customer / supplier / admin / channel (ліміт паралельності)
+    payload = Column(JSONB, nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=True)
+
+    status = Column(Enum(OutboxStatus), default=OutboxStatus.pending, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Диспетчер вибирає лише pending за next_attempt_at - індекс не росте з історією
+        Index(
+            "ix_outbox_messages_pending", "next_attempt_at",
+            postgresql_where=(status == OutboxStatus.pending)
+        ),
+    )
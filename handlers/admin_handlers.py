@@ -1,12 +1,13 @@
 # handlers/admin_handlers.py
 import logging
 import asyncio
+from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, Body, status
 from aiogram import Bot
 from sqlalchemy.future import select
 from sqlalchemy import update, or_
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from database.db import get_db, AsyncSession
 from database.models import (
@@ -17,7 +18,7 @@ from config_reader import config
 from web_app import get_bot_instance
 # --- ОНОВЛЕНІ ІМПОРТИ (План 23) ---
 from services.auth_service import get_current_admin_user 
-from services import gemini_service, publisher_service, omnichannel_service
+from services import gemini_service, publisher_service, omnichannel_service, pricing_engine
 from api_models import * # (Ми це зробили в минулому кроці)
 
 logger = logging.getLogger(__name__)
@@ -199,14 +200,98 @@ async def create_price_rule(
     """
     (План 27G) "God Mode": Створити нове правило Націнки.
     """
-    new_rule = PriceRule(**rule_data.dict())
+    new_rule = PriceRule(**rule_data.model_dump())
     db.add(new_rule)
     await db.commit()
     await db.refresh(new_rule)
     logger.info(f"Адмін додав нове правило націнки: {new_rule.name}")
+    await _apply_price_rules_change()
     return new_rule
-    
-# TODO: Додати endpoints для /update-price-rule/{id} та /delete-price-rule/{id}
+
+@router.put("/price-rules/{rule_id}", response_model=PriceRuleResponse)
+async def update_price_rule(
+    rule_id: int,
+    rule_data: PriceRuleRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    (План 27G) "God Mode": Змінити правило Націнки (або вимкнути: is_active=False).
+    """
+    rule = await db.get(PriceRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Price rule not found")
+    for field, value in rule_data.model_dump().items():
+        setattr(rule, field, value)
+    await db.commit()
+    await db.refresh(rule)
+    logger.info(f"Адмін змінив правило націнки: {rule.name}")
+    await _apply_price_rules_change()
+    return rule
+
+@router.delete("/price-rules/{rule_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_price_rule(
+    rule_id: int,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    (План 27G) "God Mode": Видалити правило Націнки.
+    """
+    rule = await db.get(PriceRule, rule_id)
+    if not rule:
+        raise HTTPException(status_code=404, detail="Price rule not found")
+    rule_name = rule.name
+    await db.delete(rule)
+    await db.commit()
+    logger.info(f"Адмін видалив правило націнки: {rule_name}")
+    await _apply_price_rules_change()
+
+# Один перерахунок на процес: нова зміна правил скасовує попередній (він комітить
+# частинами, тож паралельні перерахунки за різними рушіями перетирали б один одного).
+_reprice_task: Optional[asyncio.Task] = None
+_last_reprice: Dict[str, Any] = {"status": "idle"}
+
+async def _run_reprice() -> Dict[str, Any]:
+    engine = await pricing_engine.get_engine() # Завжди найсвіжіші правила
+    _last_reprice.update(
+        status="running", rules_version=engine.version,
+        started_at=datetime.now(timezone.utc).isoformat(), finished_at=None, updated=None, duration_ms=None, error=None
+    )
+    return await pricing_engine.reprice_variants(engine)
+
+def _on_reprice_done(task: asyncio.Task) -> None:
+    finished_at = datetime.now(timezone.utc).isoformat()
+    if task.cancelled():
+        # Наступний перерахунок уже запущено - він і заповнить статус
+        logger.info("Перерахунок цін скасовано: правила змінились, запущено новий.")
+        return
+    error = task.exception()
+    if error is not None:
+        _last_reprice.update(status="failed", finished_at=finished_at, error=str(error))
+        logger.error(f"Перерахунок цін після зміни правил не вдався: {error}", exc_info=error)
+        return
+    result = task.result()
+    _last_reprice.update(status="done", finished_at=finished_at, **result)
+    logger.info(f"Перерахунок цін після зміни правил: змінено {result['updated']} варіантів за {result['duration_ms']} мс.")
+
+async def _apply_price_rules_change():
+    """Перебудовує рушій націнок і у фоні перераховує ціни всього каталогу (попередній перерахунок скасовується)."""
+    global _reprice_task
+    await pricing_engine.publish_rules_changed() # Нові ціни одразу в усіх процесах
+    previous = _reprice_task
+    if previous is not None and not previous.done():
+        previous.cancel()
+        # Чекаємо, поки відкотиться його поточна частина, щоб не писати паралельно
+        await asyncio.gather(previous, return_exceptions=True)
+    _reprice_task = asyncio.create_task(_run_reprice())
+    _reprice_task.add_done_callback(_on_reprice_done)
+
+@router.get("/price-rules/reprice-status", response_model=Dict[str, Any])
+async def get_reprice_status():
+    """
+    (План 27G) Стан останнього перерахунку цін після зміни правил:
+    status (idle/running/done/failed), updated, duration_ms, rules_version, час.
+    """
+    return _last_reprice
 
 @router.post("/force-sync-prom/{supplier_id}", response_model=Dict[str, str])
 async def force_sync_supplier_to_prom(
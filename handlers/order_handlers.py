@@ -166,19 +166,8 @@ async def handle_skip_note(cb: CallbackQuery, state: FSMContext):
     await show_confirmation_summary(cb.message, state) # Переходимо до підтвердження
     await cb.answer("Примітку пропущено.")
 
-async def show_confirmation_summary(msg: Message, state: FSMContext):
-    """
-    Показує фінальний екран підтвердження замовлення.
-    """
-    user_id = msg.chat.id
-    fsm_data = await state.get_data()
-    cart_items, total_price = await cart_service.get_cart_contents(user_id)
-    
-    if not cart_items:
-        await msg.answer("❌ Ваш кошик порожній. Неможливо оформити замовлення.")
-        await state.clear()
-        return
-
+def _render_confirmation_summary(fsm_data: dict, cart_items: list, total_price: int) -> str:
+    """Текст екрану підтвердження (товари + отримувач + доставка + оплата)."""
     # Формуємо текст
     summary_lines = ["🧾 <b>Перевірте Ваше замовлення:</b>\n"]
     
@@ -210,9 +199,23 @@ async def show_confirmation_summary(msg: Message, state: FSMContext):
         
     summary_lines.append("\n" + "—" * 20)
     summary_lines.append(f"🔥 <b>Загальна сума до сплати: {total_price} грн</b>")
+    return "\n".join(summary_lines)
+
+async def show_confirmation_summary(msg: Message, state: FSMContext):
+    """
+    Показує фінальний екран підтвердження замовлення.
+    """
+    user_id = msg.chat.id
+    fsm_data = await state.get_data()
+    cart_items, total_price = await cart_service.get_cart_contents(user_id)
     
+    if not cart_items:
+        await msg.answer("❌ Ваш кошик порожній. Неможливо оформити замовлення.")
+        await state.clear()
+        return
+
     await state.set_state(OrderFSM.awaiting_confirmation)
-    await msg.answer("\n".join(summary_lines), reply_markup=build_confirmation_kb())
+    await msg.answer(_render_confirmation_summary(fsm_data, cart_items, total_price), reply_markup=build_confirmation_kb())
 
 @router.callback_query(OrderFSM.awaiting_confirmation, F.data == "order:confirm")
 async def handle_order_confirm(cb: CallbackQuery, state: FSMContext, bot: Bot):
@@ -222,13 +225,38 @@ async def handle_order_confirm(cb: CallbackQuery, state: FSMContext, bot: Bot):
     """
     user_id = cb.from_user.id
     fsm_data = await state.get_data()
-    cart_items, total_price = await cart_service.get_cart_contents(user_id)
+    # Актуальні ціни/залишки з БД (знімок у кошику міг застаріти)
+    cart_items, total_price, cart_changes = await cart_service.revalidate_cart(user_id)
     
+    if cart_changes and not cart_items:
+        # Розкупили все - показуємо, що саме зникло, оформлювати нічого
+        await cb.message.edit_text(
+            "⚠️ <b>Поки Ви оформлювали замовлення, дещо змінилось:</b>\n\n"
+            f"{cart_service.format_cart_changes(cart_changes)}\n\n"
+            "Ваш кошик тепер порожній.",
+            reply_markup=None
+        )
+        await cb.answer()
+        await state.clear()
+        return
+
     if not cart_items:
         await cb.answer("Кошик порожній!", show_alert=True)
         await state.clear()
         return
 
+    if cart_changes:
+        # Дані оформлення лишаються - клієнт лише підтверджує оновлений кошик
+        await state.set_state(OrderFSM.awaiting_confirmation)
+        await cb.message.edit_text(
+            "⚠️ <b>Поки Ви оформлювали замовлення, дещо змінилось:</b>\n\n"
+            f"{cart_service.format_cart_changes(cart_changes)}\n\n"
+            f"{_render_confirmation_summary(fsm_data, cart_items, total_price)}",
+            reply_markup=build_confirmation_kb()
+        )
+        await cb.answer("Кошик оновлено. Перевірте та підтвердіть ще раз.")
+        return
+
     await cb.message.edit_text("⏳ <b>Обробляємо Ваше замовлення...</b>", reply_markup=None)
     
     try:
@@ -12,6 +12,7 @@ from sqlalchemy.orm import selectinload
 from database.db import AsyncSessionLocal
 from database.models import Order, OrderItem, OrderStatus, OrderItemStatus
 from config_reader import config
+from services import telegram_sender, order_status_service
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -20,70 +21,14 @@ router = Router()
 class SupplierCancelFSM(StatesGroup):
     awaiting_cancel_reason = State()
     
-# --- "Оживлюємо" кнопки ---
+# Відповіді постачальнику йдуть смугою постачальника (не клієнтською)
+@router.callback_query.middleware()
+@router.message.middleware()
+async def _supplier_send_lane(handler, event, data):
+    with telegram_sender.lane(telegram_sender.LANE_SUPPLIER):
+        return await handler(event, data)
 
-async def update_customer_message(bot: Bot, parent_order_id: int):
-    """
-    (План 25) Головна функція інтерактивності.
-    Перевіряє статуси всіх Child-замовлень і оновлює
-    головне повідомлення клієнта.
-    """
-    async with AsyncSessionLocal() as db:
-        # 1. Завантажуємо ParentOrder разом з дітьми
-        stmt = select(Order).where(Order.id == parent_order_id).options(selectinload(Order.children))
-        parent_order = (await db.execute(stmt)).scalar_one_or_none()
-        
-        if not parent_order or not parent_order.customer_message_id:
-            logger.warning(f"Не можу оновити статус клієнту: `customer_message_id` не збережено для ParentOrder {parent_order_id}.")
-            return
-
-        # 2. Аналізуємо статус дітей
-        total_children = len(parent_order.children)
-        confirmed_count = 0
-        cancelled_items_text = ""
-        
-        for child in parent_order.children:
-            if child.status == OrderStatus.confirmed:
-                confirmed_count += 1
-            elif child.status == OrderStatus.cancelled:
-                # Знаходимо скасовані товари (беремо перший, якщо їх декілька)
-                item_stmt = select(OrderItem).where(
-                    (OrderItem.order_id == child.id) &
-                    (OrderItem.status == OrderItemStatus.cancelled_supplier)
-                ).limit(1)
-                item = (await db.execute(item_stmt)).scalar_one_or_none()
-                
-                reason = item.cancel_reason if item and item.cancel_reason else "Причина не вказана"
-                item_name = item.product_name if item else f"Товар з {child.order_uid}"
-                cancelled_items_text += f"\n   - <b>{item_name}</b> (Скасовано: {reason})"
-        
-        waiting = total_children - confirmed_count - (len(cancelled_items_text.splitlines()))
-        
-        # 3. Формуємо текст статусу
-        base_text = f"✅ Дякуємо! Ваше замовлення <code>{parent_order.order_uid}</code> прийнято.\n"
-        status_text = f"\n--- СТАТУС ЗАМОВЛЕННЯ ---\n"
-        
-        if waiting > 0:
-            status_text += f"⏳ Очікуємо відповіді від постачальників: {waiting}/{total_children}\n"
-        if confirmed_count > 0:
-            status_text += f"✅ Підтверджено до відправки: {confirmed_count} посилк(и)\n"
-        if cancelled_items_text:
-            status_text += f"❌ Скасовано постачальниками: {cancelled_items_text}\n"
-        if waiting == 0:
-            status_text += "\n🏁 **Обробку завершено!** Очікуйте на ТТН."
-
-        # 4. Оновлюємо ОРИГІНАЛЬНЕ повідомлення клієнта
-        try:
-            await bot.edit_message_text(
-                text=base_text + status_text,
-                chat_id=parent_order.user_telegram_id,
-                message_id=parent_order.customer_message_id,
-                parse_mode="HTML"
-            )
-        except Exception as e:
-            # Помилка може бути, якщо текст не змінився, це нормально
-            if "message is not modified" not in str(e):
-                logger.warning(f"Не вдалося оновити повідомлення клієнта ({parent_order.customer_message_id}): {e}")
+# --- "Оживлюємо" кнопки ---
 
 @router.callback_query(F.data.startswith("supplier:confirm:"))
 async def handle_supplier_confirm(cb: CallbackQuery, bot: Bot):
@@ -133,9 +78,9 @@ async def handle_supplier_confirm(cb: CallbackQuery, bot: Bot):
     )
     await cb.answer("Замовлення підтверджено!")
     
-    # 5. Оновлюємо повідомлення Клієнта (Інтерактивність, План 25)
+    # 5. Оновлюємо повідомлення Клієнта (Інтерактивність, План 25) - з дебаунсом
     if parent_id:
-        await update_customer_message(bot, parent_id)
+        order_status_service.schedule_customer_update(bot, parent_id)
 
 @router.callback_query(F.data.startswith("supplier:cancel:"))
 async def handle_supplier_cancel(cb: CallbackQuery, state: FSMContext):
@@ -206,4 +151,4 @@ async def handle_supplier_cancel_reason(msg: Message, state: FSMContext, bot: Bo
     await msg.answer(f"Замовлення {child_order_uid} скасовано. Клієнт отримає сповіщення.")
     
     if parent_id:
-        await update_customer_message(bot, parent_id)
\ No newline at end of file
+        order_status_service.schedule_customer_update(bot, parent_id)
\ No newline at end of file
@@ -14,7 +14,7 @@ from collections import Counter
 from database.db import AsyncSessionLocal
 from database.models import Supplier, SupplierStatus, Channel, UserRole, Product
 from config_reader import config
-from services import gemini_service, notification_service
+from services import gemini_service, notification_service, product_lookup
 from handlers.supplier_handlers import get_or_create_topic # Імпортуємо наш хелпер
 from aiogram import Bot
 
@@ -73,10 +73,9 @@ async def check_for_duplicates(db: AsyncSession, product_name: str, sku: str) ->
     
     # 1. Перевірка по SKU
     if sku and sku != "0": # "0" - це часто заглушка
-        stmt = select(Product).where(Product.sku.ilike(sku))
-        existing = (await db.execute(stmt)).scalar_one_or_none()
-        if existing:
-            return True, f"Дублікат: Товар з SKU '{sku}' вже існує (ID: {existing.id})."
+        existing_id = await product_lookup.find_product_id_by_sku(db, sku)
+        if existing_id:
+            return True, f"Дублікат: Товар з SKU '{sku}' вже існує (ID: {existing_id})."
             
     # 2. Перевірка по Назві (проста)
     # (Ми беремо перші 20 символів назви)
@@ -8,8 +8,8 @@ from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
 from config_reader import config
-from services import xml_parser 
-from database.models import ProductVariant, ProductOptionValue, ProductOption
+from services import xml_parser, product_cache, variant_cache
+from database.models import Product, ProductVariant, ProductOptionValue, ProductOption
 from database.db import AsyncSessionLocal
 
 logger = logging.getLogger(__name__)
@@ -30,6 +30,206 @@ except Exception as e:
 def _get_cart_key(user_id: int) -> str:
     return f"cart:{user_id}"
 
+# ---
+# Формат позиції кошика в Redis (поле хешу = supplier_offer_id):
+#   v1: [1, variant_db_id, product_id, supplier_id, quantity, price, drop_price, max_quantity]
+# Лише посилання на варіант, кількість і знімок цін/залишку. Назва, SKU,
+# фото та опції беруться з кешу карток (product_cache) при читанні.
+# Старі JSON-словники читаються як є і переписуються у v1 при першому читанні.
+# ---
+_ITEM_FORMAT_VERSION = 1
+_ITEM_FIELDS = ("variant_db_id", "product_id", "supplier_id", "quantity", "price", "drop_price", "max_quantity")
+
+def _encode_item(item: Dict[str, Any]) -> str:
+    return json.dumps([_ITEM_FORMAT_VERSION, *(int(item[field]) for field in _ITEM_FIELDS)], separators=(",", ":"))
+
+def _decode_item(raw: str) -> Tuple[Dict[str, Any], bool]:
+    """-> (позиція, чи це старий JSON-формат). Невідомий формат -> ValueError."""
+    data = json.loads(raw)
+    if isinstance(data, list) and data and data[0] == _ITEM_FORMAT_VERSION and len(data) == len(_ITEM_FIELDS) + 1:
+        return dict(zip(_ITEM_FIELDS, data[1:])), False
+    if isinstance(data, dict):
+        return data, True
+    raise ValueError(f"Unknown cart item format: {raw!r}")
+
+# ---
+# Атомарні операції з кошиком (Lua): перевірка залишку, зміна, TTL і
+# перерахунок суми - один round trip, без гонок між вкладками.
+# Відповідь усіх скриптів: {статус, max_quantity, total_price, offer_id, item, offer_id, item...}
+# ---
+_CART_OK = 1
+_CART_ITEM_MISSING = 0
+_CART_NOT_ENOUGH = -1
+
+# Індекси полів v1 у Lua (з 1); старий формат - словник з тими ж іменами
+_LUA_CART_COMMON = """
+local QUANTITY, PRICE, MAX_QUANTITY = 5, 6, 8
+
+local function decode_item(raw)
+    local ok, item = pcall(cjson.decode, raw)
+    if ok and type(item) == 'table' then return item end
+    return nil
+end
+
+local function item_value(item, index, name)
+    if item[1] ~= nil then return tonumber(item[index]) or 0 end
+    return tonumber(item[name]) or 0
+end
+
+local function set_quantity(item, quantity)
+    if item[1] ~= nil then item[QUANTITY] = quantity else item.quantity = quantity end
+end
+
+local function cart_reply(key, status, max_quantity)
+    local reply = {status, max_quantity, 0}
+    local total = 0
+    local fields = redis.call('HGETALL', key)
+    for i = 1, #fields, 2 do
+        local item = decode_item(fields[i + 1])
+        if item then
+            total = total + item_value(item, QUANTITY, 'quantity') * item_value(item, PRICE, 'price')
+        end
+        reply[#reply + 1] = fields[i]
+        reply[#reply + 1] = fields[i + 1]
+    end
+    reply[3] = total
+    return reply
+end
+"""
+
+# KEYS[1] - кошик; ARGV: offer_id, item v1 (quantity = 0), +кількість, макс. залишок, TTL
+_LUA_CART_ADD = _LUA_CART_COMMON + """
+local current = 0
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+if raw then
+    local item = decode_item(raw)
+    if item then current = item_value(item, QUANTITY, 'quantity') end
+end
+local quantity = current + tonumber(ARGV[3])
+local max_quantity = tonumber(ARGV[4])
+if quantity > max_quantity then return cart_reply(KEYS[1], -1, max_quantity) end
+local item = cjson.decode(ARGV[2])
+item[QUANTITY] = quantity
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(item))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return cart_reply(KEYS[1], 1, max_quantity)
+"""
+
+# KEYS[1] - кошик; ARGV: offer_id, нова кількість, TTL. Ліміт - збережений max_quantity.
+_LUA_CART_SET_QUANTITY = _LUA_CART_COMMON + """
+local raw = redis.call('HGET', KEYS[1], ARGV[1])
+local item = raw and decode_item(raw)
+if not item then return cart_reply(KEYS[1], 0, 0) end
+local max_quantity = item_value(item, MAX_QUANTITY, 'max_quantity')
+local quantity = tonumber(ARGV[2])
+if quantity > max_quantity then return cart_reply(KEYS[1], -1, max_quantity) end
+set_quantity(item, quantity)
+redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(item))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return cart_reply(KEYS[1], 1, max_quantity)
+"""
+
+# KEYS[1] - кошик; ARGV: offer_id, TTL
+_LUA_CART_REMOVE = _LUA_CART_COMMON + """
+redis.call('HDEL', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return cart_reply(KEYS[1], 1, 0)
+"""
+
+# KEYS[1] - кошик; ARGV: offer_id, старе значення, нове значення, ...
+# Заміна лише якщо позицію тим часом не змінили; порожнє нове значення - видалити.
+# (міграція старого формату, ревалідація перед оформленням)
+_LUA_CART_REPLACE = """
+for i = 1, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        if ARGV[i + 2] == '' then
+            redis.call('HDEL', KEYS[1], ARGV[i])
+        else
+            redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        end
+    end
+end
+return 1
+"""
+
+if redis_client:
+    _cart_add_script = redis_client.register_script(_LUA_CART_ADD)
+    _cart_set_quantity_script = redis_client.register_script(_LUA_CART_SET_QUANTITY)
+    _cart_remove_script = redis_client.register_script(_LUA_CART_REMOVE)
+    _cart_replace_script = redis_client.register_script(_LUA_CART_REPLACE)
+
+def _options_text(card: Dict[str, Any], variant_db_id: int) -> str:
+    """'Розмір: L, Колір: Red' з картки товару (опції + option_value_ids варіанта)."""
+    value_names = {
+        value["id"]: f"{option['name']}: {value['value']}"
+        for option in card["options"] for value in option["values"]
+    }
+    for variant in card["variants"]:
+        if variant["id"] == variant_db_id:
+            names = [value_names[value_id] for value_id in variant["option_value_ids"] if value_id in value_names]
+            return ", ".join(names) or "N/A"
+    return "N/A"
+
+async def _build_cart(user_id: int, raw_items: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    {offer_id: item} з Redis -> позиції кошика у форматі API
+    (з назвою/SKU/фото/опціями з кешу карток). Старі JSON-позиції мігрує у v1.
+    """
+    decoded = []
+    migrations = []
+    for offer_id, raw in raw_items.items():
+        try:
+            item, is_legacy = _decode_item(raw)
+        except (ValueError, TypeError):
+            logger.warning(f"Не вдалося розпарсити дані кошика для user {user_id}: {raw}")
+            continue
+        if is_legacy:
+            try:
+                migrations.extend([offer_id, raw, _encode_item(item)])
+            except (KeyError, TypeError, ValueError):
+                pass # Неповна стара позиція - лишаємо як є
+        item["variant_offer_id"] = offer_id
+        decoded.append(item)
+
+    if migrations:
+        try:
+            await _cart_replace_script(keys=[_get_cart_key(user_id)], args=migrations)
+        except Exception as e:
+            logger.warning(f"Не вдалося мігрувати кошик user {user_id} у формат v{_ITEM_FORMAT_VERSION}: {e}")
+
+    cards = await product_cache.get_product_cards(item["product_id"] for item in decoded) if decoded else {}
+    cart_items = []
+    for item in decoded:
+        card = cards.get(item["product_id"])
+        if card:
+            item["name"] = card["name"]
+            item["sku"] = card["sku"]
+            item["image_url"] = card["pictures"][0] if card.get("pictures") else None
+            item["options_text"] = _options_text(card, item["variant_db_id"])
+        # Товар зник з каталогу: лишаємо, що збереглося (старі позиції мали назву/SKU)
+        item.setdefault("name", None)
+        item.setdefault("sku", None)
+        item.setdefault("image_url", None)
+        item.setdefault("options_text", "N/A")
+        item["total_item_price"] = int(item.get("price", 0)) * int(item.get("quantity", 0))
+        cart_items.append(item)
+    return cart_items
+
+async def _cart_response(user_id: int, reply: list, message: str) -> Tuple[bool, dict]:
+    """Відповідь Lua-скрипта -> (success, payload) у форматі API кошика."""
+    status, max_quantity, total_price = reply[0], reply[1], reply[2]
+    if status == _CART_ITEM_MISSING:
+        return False, {"message": "Item not in cart"}
+    if status == _CART_NOT_ENOUGH:
+        return False, {"message": f"Недостатньо товару (макс: {max_quantity})"}
+    raw_items = dict(zip(reply[3::2], reply[4::2]))
+    cart_items = await _build_cart(user_id, raw_items)
+    return True, {
+        "success": True,
+        "message": message,
+        "cart": {"items": cart_items, "total_price": total_price}
+    }
+
 async def add_item_to_cart(user_id: int, variant_offer_id: str, quantity: int) -> Tuple[bool, dict]:
     """
     (Оновлено для Фази 4.3)
@@ -40,91 +240,51 @@ async def add_item_to_cart(user_id: int, variant_offer_id: str, quantity: int) -
         
     key = _get_cart_key(user_id)
     
-    # 1. Отримуємо актуальні дані про товар з БД (включаючи продукт та постачальника)
-    variant: Optional[ProductVariant] = await xml_parser.get_variant_by_offer_id(variant_offer_id)
+    # 1. Дані варіанта (товар, постачальник, ціни, залишок) - з кешу варіантів
+    variant: Optional[variant_cache.CachedVariant] = await variant_cache.get_variant(variant_offer_id)
     
-    if not variant or not variant.product or not variant.product.supplier:
+    if not variant or not variant.supplier_id:
         logger.warning(f"Не вдалося додати в кошик: варіант {variant_offer_id} не знайдено в БД.")
         return False, {"message": "Variant not found"}
         
     if not variant.is_available:
         return False, {"message": "Товар не в наявності"}
     
-    # 2. Отримуємо існуючий кошик
-    current_quantity_in_cart = 0
-    if await redis_client.hexists(key, variant_offer_id):
-        try:
-            item_data_raw = await redis_client.hget(key, variant_offer_id)
-            current_quantity_in_cart = json.loads(item_data_raw).get("quantity", 0)
-        except Exception:
-            pass 
-
-    new_quantity = current_quantity_in_cart + quantity
-    
-    if new_quantity > variant.quantity:
+    if quantity > variant.quantity:
         return False, {"message": f"Недостатньо товару (макс: {variant.quantity})"}
 
-    # 3. Формуємо гнучкий опис опцій
-    full_variant: Optional[ProductVariant] = await xml_parser.get_variant_with_options(variant.id)
-    options_text = "N/A"
-    if full_variant and full_variant.option_values:
-        options_text = ", ".join(
-            f"{ov.option.name}: {ov.value}" for ov in full_variant.option_values
-        )
-    
-    # 4. Готуємо дані для збереження в Redis (з ДОДАНИМИ полями)
+    # 2. Позиція v1 (назву/фото/опції не зберігаємо - є в кеші карток).
+    # quantity (поточна в кошику + нова) рахує Lua-скрипт атомарно.
     item_data = {
-        "quantity": new_quantity,
-        "variant_offer_id": variant_offer_id,
-        "variant_db_id": variant.id, # <-- НОВЕ (Для зв'язку в БД)
+        "variant_db_id": variant.id, # Для зв'язку в БД
         "product_id": variant.product_id,
-        "supplier_id": variant.product.supplier_id, # <-- НОВЕ (Для "Spooler-а")
-        "name": variant.product.name,
-        "sku": variant.product.sku,
-        "options_text": options_text,
+        "supplier_id": variant.supplier_id, # Для "Spooler-а"
+        "quantity": 0,
         "price": variant.final_price, # Ціна клієнта (+33%)
-        "drop_price": int(variant.base_price), # <-- НОВЕ (Дроп-ціна для "Spooler-а")
-        "image_url": variant.product.pictures[0] if variant.product.pictures else None,
+        "drop_price": variant.base_price, # Дроп-ціна для "Spooler-а"
         "max_quantity": variant.quantity # Зберігаємо макс. кількість
     }
     
     try:
-        await redis_client.hset(key, variant_offer_id, json.dumps(item_data))
-        await redis_client.expire(key, CART_TTL_SECONDS)
-        
-        logger.info(f"Користувач {user_id}: додано/оновлено товар {variant_offer_id}")
-        
-        cart_items, total_price = await get_cart_contents(user_id)
-        return True, {
-            "success": True, 
-            "message": "Item added", 
-            "cart": {"items": cart_items, "total_price": total_price}
-        }
-        
+        reply = await _cart_add_script(
+            keys=[key],
+            args=[variant_offer_id, _encode_item(item_data), quantity, variant.quantity, CART_TTL_SECONDS]
+        )
     except Exception as e:
-        logger.error(f"Помилка Redis (hset/expire) для user {user_id}: {e}", exc_info=True)
+        logger.error(f"Помилка Redis (cart add) для user {user_id}: {e}", exc_info=True)
         return False, {"message": f"Redis error: {e}"}
 
-# ... (решта файлу: get_cart_contents, update_item_quantity, remove_item_from_cart, clear_cart) ...
-# ... (вони вже готові і будуть працювати з новими даними в JSON) ...
+    success, payload = await _cart_response(user_id, reply, "Item added")
+    if success:
+        logger.info(f"Користувач {user_id}: додано/оновлено товар {variant_offer_id}")
+    return success, payload
+
 async def get_cart_contents(user_id: int) -> Tuple[List[Dict[str, Any]], int]:
     if not redis_client: return [], 0
     key = _get_cart_key(user_id)
-    cart_items = []
-    total_price = 0
     try:
-        cart_data_raw = await redis_client.hgetall(key)
-        for item_json in cart_data_raw.values():
-            try:
-                item = json.loads(item_json)
-                item_quantity = int(item.get("quantity", 0))
-                item_price = int(item.get("price", 0))
-                item["total_item_price"] = item_price * item_quantity
-                cart_items.append(item)
-                total_price += item["total_item_price"]
-            except (json.JSONDecodeError, TypeError, ValueError):
-                logger.warning(f"Не вдалося розпарсити дані кошика для user {user_id}: {item_json}")
-        return cart_items, total_price
+        cart_items = await _build_cart(user_id, await redis_client.hgetall(key))
+        return cart_items, sum(item["total_item_price"] for item in cart_items)
     except Exception as e:
         logger.error(f"Помилка Redis (hgetall) для user {user_id}: {e}", exc_info=True)
         return [], 0
@@ -135,45 +295,24 @@ async def update_item_quantity(user_id: int, variant_offer_id: str, new_quantity
     if new_quantity <= 0:
         return await remove_item_from_cart(user_id, variant_offer_id)
     try:
-        item_data_raw = await redis_client.hget(key, variant_offer_id)
-        if not item_data_raw:
-            return False, {"message": "Item not in cart"}
-        item_data = json.loads(item_data_raw)
-        
-        max_quantity = item_data.get("max_quantity", 0) 
-        if new_quantity > max_quantity:
-            return False, {"message": f"Not enough stock (max: {max_quantity})"}
-            
-        item_data["quantity"] = new_quantity
-        
-        await redis_client.hset(key, variant_offer_id, json.dumps(item_data))
-        await redis_client.expire(key, CART_TTL_SECONDS)
-        
-        cart_items, total_price = await get_cart_contents(user_id)
-        return True, {
-            "success": True, 
-            "message": "Quantity updated", 
-            "cart": {"items": cart_items, "total_price": total_price}
-        }
+        reply = await _cart_set_quantity_script(
+            keys=[key], args=[variant_offer_id, new_quantity, CART_TTL_SECONDS]
+        )
     except Exception as e:
         logger.error(f"Помилка Redis (update_item_quantity) для user {user_id}: {e}", exc_info=True)
         return False, {"message": f"Redis error: {e}"}
+    return await _cart_response(user_id, reply, "Quantity updated")
 
 async def remove_item_from_cart(user_id: int, variant_offer_id: str) -> Tuple[bool, dict]:
     if not redis_client: return False, {"message": "Redis error"}
     key = _get_cart_key(user_id)
     try:
-        await redis_client.hdel(key, variant_offer_id)
-        logger.info(f"Користувач {user_id}: видалено товар {variant_offer_id} з кошика.")
-        cart_items, total_price = await get_cart_contents(user_id)
-        return True, {
-            "success": True, 
-            "message": "Item removed", 
-            "cart": {"items": cart_items, "total_price": total_price}
-        }
+        reply = await _cart_remove_script(keys=[key], args=[variant_offer_id, CART_TTL_SECONDS])
     except Exception as e:
-        logger.error(f"Помилка Redis (hdel) для user {user_id}: {e}", exc_info=True)
+        logger.error(f"Помилка Redis (cart remove) для user {user_id}: {e}", exc_info=True)
         return False, {"message": f"Redis error: {e}"}
+    logger.info(f"Користувач {user_id}: видалено товар {variant_offer_id} з кошика.")
+    return await _cart_response(user_id, reply, "Item removed")
 
 async def clear_cart(user_id: int) -> bool:
     if not redis_client: return False
@@ -184,4 +323,97 @@ async def clear_cart(user_id: int) -> bool:
         return True
     except Exception as e:
         logger.error(f"Помилка Redis (delete) для user {user_id}: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
+
+# ---
+# Ревалідація перед оформленням
+# ---
+CHANGE_PRICE = "price_changed"
+CHANGE_OUT_OF_STOCK = "out_of_stock"
+CHANGE_QUANTITY_REDUCED = "quantity_reduced"
+
+async def revalidate_cart(user_id: int) -> Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]:
+    """
+    Звіряє кошик з БД перед створенням замовлення (один IN-запит на всі позиції):
+    поточні final/drop ціни, наявність і залишок. Кошик у Redis виправляється.
+
+    Повертає (позиції, сума, зміни). Зміни - те, що бачить клієнт
+    (ціна, немає в наявності, зменшена кількість); якщо вони є,
+    замовлення створювати не можна, поки клієнт не погодиться з новим кошиком.
+    Зміна лише дроп-ціни застосовується мовчки.
+    """
+    if not redis_client: return [], 0, []
+    key = _get_cart_key(user_id)
+    raw_items = await redis_client.hgetall(key)
+    if not raw_items: return [], 0, []
+
+    decoded = {}
+    for offer_id, raw in raw_items.items():
+        try:
+            decoded[offer_id] = _decode_item(raw)[0]
+        except (ValueError, TypeError):
+            logger.warning(f"Не вдалося розпарсити дані кошика для user {user_id}: {raw}")
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(
+                ProductVariant.supplier_offer_id, ProductVariant.id, ProductVariant.product_id,
+                Product.supplier_id, ProductVariant.final_price, ProductVariant.base_price,
+                ProductVariant.quantity, ProductVariant.is_available
+            ).join(Product, ProductVariant.product_id == Product.id)
+            .where(ProductVariant.supplier_offer_id.in_(list(decoded)))
+        )
+        current = {row.supplier_offer_id: row for row in result.all()}
+
+    changes = []
+    replacements = []
+    for offer_id, item in decoded.items():
+        row = current.get(offer_id)
+        quantity = int(item.get("quantity", 0))
+        if row is None or not row.is_available or row.quantity <= 0:
+            changes.append({"variant_offer_id": offer_id, "change": CHANGE_OUT_OF_STOCK, "old_quantity": quantity, "new_quantity": 0})
+            replacements.extend([offer_id, raw_items[offer_id], ""])
+            continue
+        fresh = {
+            "variant_db_id": row.id, "product_id": row.product_id, "supplier_id": row.supplier_id,
+            "quantity": min(quantity, row.quantity), "price": row.final_price,
+            "drop_price": int(row.base_price), "max_quantity": row.quantity,
+        }
+        if fresh["price"] != item.get("price"):
+            changes.append({"variant_offer_id": offer_id, "change": CHANGE_PRICE, "old_price": item.get("price"), "new_price": fresh["price"]})
+        if fresh["quantity"] < quantity:
+            changes.append({"variant_offer_id": offer_id, "change": CHANGE_QUANTITY_REDUCED, "old_quantity": quantity, "new_quantity": fresh["quantity"]})
+        encoded = _encode_item(fresh)
+        if encoded != raw_items[offer_id]:
+            replacements.extend([offer_id, raw_items[offer_id], encoded])
+
+    if replacements:
+        await _cart_replace_script(keys=[key], args=replacements)
+        logger.info(f"Кошик user {user_id}: ревалідація змінила {len(replacements) // 3} позицій ({len(changes)} видимих змін).")
+
+    cart_items, total_price = await get_cart_contents(user_id)
+    if changes:
+        # Назви для повідомлення клієнту (в т.ч. прибраних позицій)
+        cards = await product_cache.get_product_cards(
+            item["product_id"] for item in decoded.values() if item.get("product_id")
+        )
+        for change in changes:
+            item = decoded[change["variant_offer_id"]]
+            card = cards.get(item.get("product_id")) or item
+            change["name"] = card.get("name")
+            change["sku"] = card.get("sku")
+    return cart_items, total_price, changes
+
+def format_cart_changes(changes: List[Dict[str, Any]]) -> str:
+    """Текст змін для клієнта (бот)."""
+    lines = []
+    for change in changes:
+        title = f"<b>{change.get('name') or change['variant_offer_id']}</b>"
+        if change["change"] == CHANGE_PRICE:
+            lines.append(f"• {title}: ціна змінилась {change['old_price']} → {change['new_price']} грн")
+        elif change["change"] == CHANGE_QUANTITY_REDUCED:
+            lines.append(f"• {title}: доступно лише {change['new_quantity']} шт. (було {change['old_quantity']})")
+        else:
+            lines.append(f"• {title}: більше немає в наявності (прибрано з кошика)")
+    return "\n".join(lines)
+
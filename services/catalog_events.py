@@ -0,0 +1,71 @@
+# services/catalog_events.py
+import logging
+import asyncio
+import json
+import redis.asyncio as aioredis
+from typing import Iterable, Callable, Awaitable, Optional, Set
+
+from config_reader import config
+
+logger = logging.getLogger(__name__)
+
+# Які товари змінились (імпорт XML, перерахунок цін). Слухають in-memory
+# кеші/індекси в інших процесах (web, бот), щоб оновити лише ці товари.
+_PRODUCTS_CHANNEL = "catalog:products_changed"
+_PUBLISH_CHUNK_SIZE = 5000 # id в одному повідомленні
+_LISTENER_RETRY_SECONDS = 5
+
+try:
+    redis_client = aioredis.from_url(
+        str(config.redis_url),
+        encoding="utf-8",
+        decode_responses=True
+    )
+except Exception as e:
+    logger.error(f"Не вдалося підключитися до Redis (події каталогу): {e}")
+    redis_client = None
+
+async def publish_products_changed(product_ids: Iterable[int]) -> None:
+    """Сповіщає всі процеси, що ці товари змінились у БД (викликати ПІСЛЯ commit)."""
+    ids = sorted(set(product_ids))
+    if not ids or not redis_client: return
+    try:
+        for i in range(0, len(ids), _PUBLISH_CHUNK_SIZE):
+            await redis_client.publish(_PRODUCTS_CHANNEL, json.dumps(ids[i:i + _PUBLISH_CHUNK_SIZE]))
+    except Exception as e:
+        logger.error(f"Не вдалося опублікувати зміни каталогу ({len(ids)} товарів): {e}")
+
+async def listen_products_changed(
+    on_changed: Callable[[Set[int]], Awaitable[None]],
+    on_subscribed: Optional[Callable[[], Awaitable[None]]] = None
+) -> None:
+    """
+    Нескінченний цикл підписки (запускати як фонову задачу).
+    `on_subscribed()` - після кожної (пере)підписки: повна синхронізація,
+    бо повідомлення до підписки загублені. Нові повідомлення тим часом
+    чекають у черзі й прийдуть у `on_changed(ids)` одразу після неї.
+    """
+    if not redis_client:
+        logger.warning("Redis недоступний: зміни каталогу не відстежуються.")
+        if on_subscribed:
+            await on_subscribed()
+        return
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(_PRODUCTS_CHANNEL)
+            if on_subscribed:
+                await on_subscribed()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await on_changed(set(json.loads(message["data"])))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Підписка на зміни каталогу обірвалась: {e}. Повтор через {_LISTENER_RETRY_SECONDS}с.")
+        finally:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(_LISTENER_RETRY_SECONDS)
@@ -0,0 +1,178 @@
+# services/catalog_service.py
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from sqlalchemy import func, case, and_, or_, true, literal, update, String
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from config_reader import config
+from database.db import AsyncSessionLocal
+from database.models import Product, ProductOption, ProductVariant
+from services import catalog_events, gemini_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+_MAX_FACET_VALUES = 50 # Значень одного фасету в панелі фільтрів
+_AI_BATCH_SIZE = 20 # Товарів на один запуск AI-збагачення (ліміти Gemini)
+
+def normalize_attributes(raw: Optional[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    {"Бренд": "Apple", "Розмір": ["S", "M"], "Рік": 2024} ->
+    {"Бренд": ["Apple"], "Розмір": ["M", "S"], "Рік": ["2024"]}
+    (формат `Product.attributes`: значення - завжди відсортовані списки рядків).
+    """
+    result = {}
+    for name, value in (raw or {}).items():
+        name = str(name).strip()
+        values = value if isinstance(value, list) else [value]
+        cleaned = sorted({str(v).strip() for v in values if v is not None and not isinstance(v, (dict, list))} - {""})
+        if name and cleaned:
+            result[name] = cleaned
+    return result
+
+def _has_filter_value(name: str, values: List[str]):
+    """attributes містить хоч одне зі значень (GIN jsonb_path_ops, оператор @>)."""
+    return or_(*(Product.attributes.contains({name: [value]}) for value in values))
+
+def _base_conditions(category_tag: Optional[str], only_available: bool) -> list:
+    conditions = []
+    if category_tag:
+        conditions.append(Product.category_tag == category_tag)
+    if only_available:
+        conditions.append(Product.variants.any(ProductVariant.is_available == True))
+    return conditions
+
+async def get_catalog_page(
+    category_tag: Optional[str] = None,
+    filters: Optional[Dict[str, List[str]]] = None,
+    only_available: bool = True,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Каталог з фільтрами по атрибутах/опціях і лічильниками фасетів.
+
+    `filters`: {"Розмір": ["M", "L"], "Колір": ["чорний"]} - значення одного
+    фасету через АБО, різні фасети через І.
+
+    Лічильники рахуються одним запитом для всіх фасетів. Фільтр фасету
+    не звужує його власні значення (можна обрати "M" і бачити, скільки "L").
+
+    Повертає {"items", "facets", "total", "next_cursor"}; курсор - id останнього товару.
+    """
+    filters = {name: values for name, values in (filters or {}).items() if values}
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    base_conditions = _base_conditions(category_tag, only_available)
+    filter_conditions = {name: _has_filter_value(name, values) for name, values in filters.items()}
+
+    # --- 1. Сторінка товарів (keyset по id) ---
+    items_stmt = select(Product).where(
+        *base_conditions, *filter_conditions.values()
+    ).options(
+        selectinload(Product.options).selectinload(ProductOption.values),
+        selectinload(Product.variants).selectinload(ProductVariant.option_values)
+    ).order_by(Product.id.desc()).limit(limit + 1)
+    if cursor:
+        items_stmt = items_stmt.where(Product.id < cursor)
+
+    # --- 2. Фасети + total одним запитом ---
+    attribute = func.jsonb_each(Product.attributes).table_valued("key", "value").lateral("attribute")
+    value_list = case(
+        (func.jsonb_typeof(attribute.c.value) == "array", attribute.c.value),
+        else_=func.jsonb_build_array(attribute.c.value)
+    )
+    attribute_value = func.jsonb_array_elements_text(value_list).table_valued("value").lateral("attribute_value")
+    if filter_conditions:
+        # Кожен фасет рахуємо з усіма фільтрами, КРІМ свого власного
+        facet_count = func.count().filter(and_(*(
+            or_(attribute.c.key == name, condition) for name, condition in filter_conditions.items()
+        )))
+    else:
+        facet_count = func.count()
+    facets_stmt = select(
+        attribute.c.key, attribute_value.c.value, facet_count.label("count")
+    ).select_from(Product).join(attribute, true()).join(attribute_value, true()).where(
+        *base_conditions
+    ).group_by(attribute.c.key, attribute_value.c.value)
+    total_stmt = select(
+        literal(None, String).label("key"), literal(None, String).label("value"), func.count().label("count")
+    ).select_from(Product).where(*base_conditions, *filter_conditions.values())
+
+    async with AsyncSessionLocal() as session:
+        products = (await session.execute(items_stmt)).scalars().all()
+        facet_rows = (await session.execute(facets_stmt.union_all(total_stmt))).all()
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = products[-1].id
+
+    total = 0
+    facet_values = defaultdict(list)
+    for key, value, count in facet_rows:
+        if key is None:
+            total = count
+        elif count:
+            facet_values[key].append({"value": value, "count": count})
+    facets = [
+        {"name": name, "values": sorted(values, key=lambda v: (-v["count"], v["value"]))[:_MAX_FACET_VALUES]}
+        for name, values in sorted(facet_values.items())
+    ]
+    return {"items": list(products), "facets": facets, "total": total, "next_cursor": next_cursor}
+
+# ---
+# AI-збагачення атрибутів (Gemini)
+# ---
+async def enrich_attributes_batch(batch_size: int = _AI_BATCH_SIZE) -> int:
+    """
+    Бере товари без AI-атрибутів (`ai_attributes IS NULL`) і просить Gemini
+    витягнути фільтри (Бренд, Матеріал...) з назви й опису.
+    Повертає к-сть оброблених товарів.
+    """
+    if not config.gemini_api_key:
+        return 0
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(Product.id, Product.name, Product.description, Product.category_tag)
+            .where(Product.ai_attributes.is_(None))
+            .order_by(Product.id).limit(batch_size)
+        )).all()
+    if not rows:
+        return 0
+
+    # Gemini - поза транзакцією: не тримаємо з'єднання й блокування рядків, поки чекаємо AI
+    ai_attributes = {}
+    for product_id, name, description, category_tag in rows:
+        ai_data = await gemini_service.extract_product_attributes_with_ai(
+            raw_text=f"{name}\n{description or ''}"[:4000],
+            category_hint=category_tag or "unknown"
+        )
+        if ai_data is None:
+            # Скоріше за все ліміт/збій Gemini - решту спробуємо наступного запуску
+            logger.warning(f"AI-атрибути: Gemini не відповів для Product ID {product_id}. Зупиняю батч.")
+            break
+        # {} = оброблено, нічого не знайшли
+        ai_attributes[product_id] = normalize_attributes(ai_data.get("attributes") if isinstance(ai_data, dict) else None)
+    if not ai_attributes:
+        return 0
+
+    # Усі результати - однією короткою транзакцією
+    enriched_ids = []
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            for product_id, attributes in ai_attributes.items():
+                result = await db.execute(
+                    update(Product).where(
+                        (Product.id == product_id) & Product.ai_attributes.is_(None)
+                    ).values(ai_attributes=attributes, last_updated=func.now())
+                )
+                if result.rowcount:
+                    enriched_ids.append(product_id)
+
+    await catalog_events.publish_products_changed(enriched_ids)
+    logger.info(f"AI-атрибути: збагачено {len(enriched_ids)} товарів.")
+    return len(enriched_ids)
@@ -0,0 +1,179 @@
+# services/catalog_snapshot.py
+import logging
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+import redis.asyncio as aioredis
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from config_reader import config
+from database.db import AsyncSessionLocal
+from database.models import Product, ProductVariant
+
+try:
+    import brotli
+except ImportError: # Без brotli віддаємо gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Знімок каталогу для MiniApp: один компактний JSON з усіма товарами в наявності
+# (мін. ціна + мініатюра). Будується після імпорту/перерахунку цін, зберігається
+# в Redis вже стиснутим; web_app віддає його з ETag = версія (хеш вмісту).
+_CURRENT_KEY = "catalog_snapshot:current"
+_SNAPSHOT_KEY = "catalog_snapshot:{}"
+_OLD_SNAPSHOT_TTL_SECONDS = 3600 # Попередня версія живе, поки її дочитують
+_VERSION_CHECK_SECONDS = 5 # Як часто web_app перевіряє, чи не з'явилась нова версія
+_FIELDS = ["id", "sku", "name", "category_tag", "min_price", "thumbnail"]
+
+IDENTITY = "identity"
+GZIP = "gzip"
+BROTLI = "br"
+
+try:
+    # Без decode_responses: тіла знімка - стиснуті байти
+    redis_client = aioredis.from_url(str(config.redis_url))
+except Exception as e:
+    logger.error(f"Не вдалося підключитися до Redis (знімок каталогу): {e}")
+    redis_client = None
+
+class CatalogSnapshot:
+    """Одна версія знімка: тіло в кожному кодуванні (готове до відправки)."""
+    __slots__ = ("version", "bodies")
+
+    def __init__(self, version: str, bodies: Dict[str, bytes]):
+        self.version = version
+        self.bodies = bodies
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+        for encoding in (BROTLI, GZIP):
+            if encoding in accepted and encoding in self.bodies:
+                return encoding
+        return IDENTITY
+
+    def etag(self, encoding: str) -> str:
+        # Strong ETag - окремий для кожного кодування (різні байти)
+        return f'"{self.version}"' if encoding == IDENTITY else f'"{self.version}-{encoding}"'
+
+    def is_not_modified(self, if_none_match: Optional[str]) -> bool:
+        """If-None-Match збігається з будь-яким кодуванням цієї версії."""
+        if not if_none_match: return False
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*": return True
+            tag = tag.removeprefix("W/").strip('"')
+            if tag.split("-", 1)[0] == self.version:
+                return True
+        return False
+
+_current: Optional[CatalogSnapshot] = None
+_checked_at = 0.0
+_build_lock = asyncio.Lock()
+
+# ---
+# Побудова
+# ---
+async def _load_rows() -> list:
+    """Товари з хоча б одним доступним варіантом - одним агрегуючим запитом."""
+    stmt = select(
+        Product.id, Product.sku, Product.name, Product.category_tag,
+        func.min(ProductVariant.final_price), Product.pictures[0].as_string()
+    ).join(ProductVariant, ProductVariant.product_id == Product.id).where(
+        (ProductVariant.is_available == True) & (ProductVariant.final_price > 0)
+    ).group_by(Product.id).order_by(Product.id)
+    async with AsyncSessionLocal() as session:
+        return [list(row) for row in (await session.execute(stmt)).all()]
+
+def _encode(rows: list) -> CatalogSnapshot:
+    products = json.dumps(rows, ensure_ascii=False, separators=(",", ":"))
+    version = hashlib.sha256(products.encode("utf-8")).hexdigest()[:16]
+    header = json.dumps({
+        "version": version,
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "fields": _FIELDS,
+    }, separators=(",", ":"))
+    # {"version":..., "generated_at":..., "fields":[...], "products":[[...], ...]}
+    body = f'{header[:-1]},"products":{products}}}'.encode("utf-8")
+    bodies = {IDENTITY: body, GZIP: gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        bodies[BROTLI] = brotli.compress(body, quality=11)
+    return CatalogSnapshot(version, bodies)
+
+async def _store(snapshot: CatalogSnapshot) -> None:
+    previous = await redis_client.get(_CURRENT_KEY)
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(_SNAPSHOT_KEY.format(snapshot.version), mapping=snapshot.bodies)
+        pipe.persist(_SNAPSHOT_KEY.format(snapshot.version))
+        pipe.set(_CURRENT_KEY, snapshot.version)
+        if previous and previous.decode() != snapshot.version:
+            pipe.expire(_SNAPSHOT_KEY.format(previous.decode()), _OLD_SNAPSHOT_TTL_SECONDS)
+        await pipe.execute()
+
+async def rebuild_snapshot() -> Optional[CatalogSnapshot]:
+    """
+    Будує знімок з БД. Якщо вміст не змінився - версія та сама,
+    клієнти нічого не перекачують.
+    """
+    global _current, _checked_at
+    async with _build_lock:
+        started = time.perf_counter()
+        rows = await _load_rows()
+        snapshot = await asyncio.to_thread(_encode, rows) # brotli q11 - не блокуємо event loop
+        if _current is not None and _current.version == snapshot.version:
+            return _current
+        if redis_client:
+            await _store(snapshot)
+        _current, _checked_at = snapshot, time.monotonic()
+    sizes = ", ".join(f"{encoding}={len(body) // 1024}КБ" for encoding, body in snapshot.bodies.items())
+    logger.info(
+        f"Знімок каталогу {snapshot.version}: {len(rows)} товарів ({sizes}) "
+        f"за {(time.perf_counter() - started) * 1000:.0f} мс."
+    )
+    return snapshot
+
+async def rebuild_snapshot_safe() -> None:
+    """Для виклику після імпорту: збій знімка не має ламати імпорт."""
+    try:
+        await rebuild_snapshot()
+    except Exception as e:
+        logger.error(f"Не вдалося побудувати знімок каталогу: {e}", exc_info=True)
+
+# ---
+# Читання (web_app)
+# ---
+async def _load_from_redis(version: str) -> Optional[CatalogSnapshot]:
+    bodies = await redis_client.hgetall(_SNAPSHOT_KEY.format(version))
+    if not bodies: return None
+    return CatalogSnapshot(version, {encoding.decode(): body for encoding, body in bodies.items()})
+
+async def get_snapshot() -> Optional[CatalogSnapshot]:
+    """
+    Поточний знімок з пам'яті процесу. Нову версію з Redis підтягуємо
+    не частіше ніж раз на _VERSION_CHECK_SECONDS; знімка ще немає - будуємо.
+    """
+    global _current, _checked_at
+    if _current is not None and (not redis_client or time.monotonic() - _checked_at < _VERSION_CHECK_SECONDS):
+        return _current
+    if redis_client:
+        try:
+            version = await redis_client.get(_CURRENT_KEY)
+            _checked_at = time.monotonic()
+            if version:
+                version = version.decode()
+                if _current is not None and _current.version == version:
+                    return _current
+                snapshot = await _load_from_redis(version)
+                if snapshot is not None:
+                    _current = snapshot
+                    return _current
+        except Exception as e:
+            logger.warning(f"Знімок каталогу: помилка читання з Redis: {e}")
+            if _current is not None:
+                return _current
+    return await rebuild_snapshot()
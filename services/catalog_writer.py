@@ -0,0 +1,274 @@
+# services/catalog_writer.py
+import logging
+from typing import Dict, Any, List, Tuple, Iterator, Sequence, Set
+from sqlalchemy import delete, update, func, bindparam, all_, any_, or_, String, Integer
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert, ARRAY
+
+from database.db import AsyncSessionLocal
+from services.search_normalizer import build_product_search_text, normalize_sku_key
+from database.models import (
+    Product, ProductVariant,
+    ProductOption, ProductOptionValue, ProductVariantOptionValue
+)
+
+logger = logging.getLogger(__name__)
+
+# asyncpg не приймає більше 32767 параметрів в одному запиті,
+# тому багаторядкові INSERT ріжемо на шматки з запасом.
+_MAX_BIND_PARAMS = 30000
+
+def _chunks(items: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _rows_per_statement(rows: List[Dict[str, Any]]) -> int:
+    return max(1, _MAX_BIND_PARAMS // max(1, len(rows[0])))
+
+# ---
+# [BULK UPSERT] Set-based запис каталогу (замість запитів на кожен offer)
+# ---
+async def _upsert_products(
+    session: AsyncSessionLocal,
+    supplier_id: int,
+    records: List[Dict[str, Any]]
+) -> Dict[str, int]:
+    """
+    Один multi-row INSERT ... ON CONFLICT для карток. Повертає {sku: product_id}.
+    Картка ідентифікується `sku_norm`: 'AB-1' і 'ab-1' у фіді - один товар.
+    """
+    rows_by_sku_norm = {}
+    for record in records:
+        # Якщо дві групи мають однаковий sku_norm, ON CONFLICT не дозволить
+        # оновити рядок двічі в одному запиті - лишаємо останню.
+        sku_norm = normalize_sku_key(record["sku"])
+        rows_by_sku_norm[sku_norm] = {
+            "supplier_id": supplier_id,
+            "sku": record["sku"],
+            "sku_norm": sku_norm,
+            "name": record["name"],
+            "description": record["description"],
+            "pictures": record["pictures"],
+            "category_tag": record["category_tag"],
+            "feed_attributes": record["attributes"], # AI-атрибути (Бренд, Рік...) пише окрема задача
+            "content_hash": record["content_hash"],
+            "search_text": build_product_search_text(record["name"], record["sku"]),
+        }
+    rows = [rows_by_sku_norm[key] for key in sorted(rows_by_sku_norm)] # Стабільний порядок = менше deadlock'ів
+
+    ids_by_sku_norm = {}
+    for chunk in _chunks(rows, _rows_per_statement(rows)):
+        stmt = pg_insert(Product).values(list(chunk))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['supplier_id', 'sku_norm'],
+            set_={
+                'sku': stmt.excluded.sku, 'name': stmt.excluded.name, 'description': stmt.excluded.description,
+                'pictures': stmt.excluded.pictures, 'category_tag': stmt.excluded.category_tag,
+                'feed_attributes': stmt.excluded.feed_attributes,
+                'content_hash': stmt.excluded.content_hash, 'search_text': stmt.excluded.search_text,
+                'last_updated': func.now()
+            }
+        ).returning(Product.id, Product.sku_norm)
+        for product_id, sku_norm in (await session.execute(stmt)).all():
+            ids_by_sku_norm[sku_norm] = product_id
+    return {record["sku"]: ids_by_sku_norm[normalize_sku_key(record["sku"])] for record in records}
+
+async def _upsert_option_values(
+    session: AsyncSessionLocal,
+    records: List[Dict[str, Any]],
+    product_ids: Dict[str, int]
+) -> Dict[Tuple[int, str, str], int]:
+    """
+    Створює ProductOption та ProductOptionValue для всього батчу.
+    Повертає map: {(product_id, 'Розмір', 'S'): 123, ...}
+    """
+    option_rows = set()
+    value_keys = set()
+    for record in records:
+        product_id = product_ids[record["sku"]]
+        for option_name, values_set in record["options"].items():
+            values = [v for v in values_set if v]
+            if not values: continue
+            option_rows.add((product_id, option_name))
+            value_keys.update((product_id, option_name, v) for v in values)
+    if not option_rows:
+        return {}
+
+    # 1. Get-or-create ProductOption (напр. "Розмір") - INSERT + один SELECT
+    rows = [{"product_id": p, "name": n} for p, n in sorted(option_rows)]
+    for chunk in _chunks(rows, _rows_per_statement(rows)):
+        await session.execute(
+            pg_insert(ProductOption).values(list(chunk))
+            .on_conflict_do_nothing(index_elements=['product_id', 'name'])
+        )
+    option_ids = {}
+    touched_products = sorted({p for p, _ in option_rows})
+    for chunk in _chunks(touched_products, _MAX_BIND_PARAMS):
+        result = await session.execute(
+            select(ProductOption.id, ProductOption.product_id, ProductOption.name)
+            .where(ProductOption.product_id.in_(chunk))
+        )
+        for option_id, product_id, name in result.all():
+            option_ids[(product_id, name)] = option_id
+
+    # 2. Get-or-create ProductOptionValue (напр. "S", "M", "L")
+    rows = sorted(
+        ({"option_id": option_ids[(p, n)], "value": v} for p, n, v in value_keys),
+        key=lambda r: (r["option_id"], r["value"])
+    )
+    for chunk in _chunks(rows, _rows_per_statement(rows)):
+        await session.execute(
+            pg_insert(ProductOptionValue).values(list(chunk))
+            .on_conflict_do_nothing(index_elements=['option_id', 'value'])
+        )
+    option_keys = {option_id: key for key, option_id in option_ids.items()}
+    value_ids = {}
+    for chunk in _chunks(sorted(option_keys), _MAX_BIND_PARAMS):
+        result = await session.execute(
+            select(ProductOptionValue.id, ProductOptionValue.option_id, ProductOptionValue.value)
+            .where(ProductOptionValue.option_id.in_(chunk))
+        )
+        for value_id, option_id, value in result.all():
+            product_id, option_name = option_keys[option_id]
+            value_ids[(product_id, option_name, value)] = value_id
+    return value_ids
+
+async def _upsert_variants(
+    session: AsyncSessionLocal,
+    records: List[Dict[str, Any]],
+    product_ids: Dict[str, int]
+) -> Dict[str, int]:
+    """Multi-row upsert ProductVariant. Повертає {supplier_offer_id: variant_id}."""
+    rows_by_offer = {}
+    for record in records:
+        product_id = product_ids[record["sku"]]
+        for variant in record["variants"]:
+            rows_by_offer[variant["offer_id"]] = {
+                "product_id": product_id,
+                "supplier_offer_id": variant["offer_id"],
+                "base_price": variant["base_price"],
+                "final_price": variant["final_price"],
+                "quantity": variant["quantity"],
+                "is_available": variant["is_available"],
+            }
+    if not rows_by_offer:
+        return {}
+    rows = [rows_by_offer[offer_id] for offer_id in sorted(rows_by_offer)]
+
+    variant_ids = {}
+    for chunk in _chunks(rows, _rows_per_statement(rows)):
+        stmt = pg_insert(ProductVariant).values(list(chunk))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['supplier_offer_id'],
+            set_={
+                'base_price': stmt.excluded.base_price, 'final_price': stmt.excluded.final_price,
+                'quantity': stmt.excluded.quantity, 'is_available': stmt.excluded.is_available,
+                'last_updated': func.now()
+            }
+        ).returning(ProductVariant.id, ProductVariant.supplier_offer_id)
+        for variant_id, offer_id in (await session.execute(stmt)).all():
+            variant_ids[offer_id] = variant_id
+    return variant_ids
+
+async def _replace_variant_links(
+    session: AsyncSessionLocal,
+    records: List[Dict[str, Any]],
+    product_ids: Dict[str, int],
+    variant_ids: Dict[str, int],
+    value_ids: Dict[Tuple[int, str, str], int]
+) -> None:
+    """Зв'язки Variant <-> OptionValue: один DELETE + multi-row INSERT на батч."""
+    links = set()
+    for record in records:
+        product_id = product_ids[record["sku"]]
+        for variant in record["variants"]:
+            variant_id = variant_ids.get(variant["offer_id"])
+            if variant_id is None: continue
+            for option_name, value in variant["option_keys"]:
+                value_id = value_ids.get((product_id, option_name, value))
+                if value_id is not None:
+                    links.add((variant_id, value_id))
+
+    for chunk in _chunks(sorted(variant_ids.values()), _MAX_BIND_PARAMS):
+        await session.execute(
+            delete(ProductVariantOptionValue).where(ProductVariantOptionValue.variant_id.in_(chunk))
+        )
+    if not links:
+        return
+    rows = [{"variant_id": v, "value_id": o} for v, o in sorted(links)]
+    for chunk in _chunks(rows, _rows_per_statement(rows)):
+        await session.execute(pg_insert(ProductVariantOptionValue).values(list(chunk)))
+
+async def bulk_upsert_groups(
+    session: AsyncSessionLocal,
+    supplier_id: int,
+    records: List[Dict[str, Any]]
+) -> Dict[str, Dict]:
+    """
+    Записує батч розібраних груп (див. `xml_parser._build_group_record`)
+    кількома multi-row запитами замість тисяч окремих.
+
+    Повертає id-мапи для наступних кроків:
+    {
+        "products": {sku: product_id},
+        "variants": {supplier_offer_id: variant_id},
+        "option_values": {(product_id, option_name, value): value_id},
+    }
+    """
+    if not records:
+        return {"products": {}, "variants": {}, "option_values": {}}
+
+    product_ids = await _upsert_products(session, supplier_id, records)
+    value_ids = await _upsert_option_values(session, records, product_ids)
+    variant_ids = await _upsert_variants(session, records, product_ids)
+    await _replace_variant_links(session, records, product_ids, variant_ids, value_ids)
+
+    return {"products": product_ids, "variants": variant_ids, "option_values": value_ids}
+
+# ---
+# [INCREMENTAL SYNC] Відбитки груп та "зниклі" варіанти
+# ---
+async def load_content_hashes(session: AsyncSessionLocal, supplier_id: int) -> Dict[str, str]:
+    """Повертає {sku: content_hash} для всіх карток постачальника (один запит)."""
+    result = await session.execute(
+        select(Product.sku, Product.content_hash).where(
+            (Product.supplier_id == supplier_id) & Product.content_hash.is_not(None)
+        )
+    )
+    return {sku: content_hash for sku, content_hash in result.all()}
+
+async def mark_missing_variants(
+    session: AsyncSessionLocal,
+    supplier_id: int,
+    seen_offer_ids: Set[str]
+) -> Tuple[int, Set[int]]:
+    """
+    Одним UPDATE позначає недоступними варіанти постачальника, яких
+    немає в новому фіді. Повертає (к-сть змінених варіантів, id їхніх карток).
+
+    Відбиток їхніх карток скидаємо, щоб група, яка повернеться у фід
+    з тим самим вмістом, знову була записана (і стала доступною).
+    """
+    stmt = update(ProductVariant).where(
+        ProductVariant.product_id.in_(
+            select(Product.id).where(Product.supplier_id == supplier_id)
+        ),
+        ProductVariant.supplier_offer_id != all_(
+            bindparam("seen_offer_ids", sorted(seen_offer_ids), type_=ARRAY(String))
+        ),
+        or_(ProductVariant.is_available == True, ProductVariant.quantity != 0)
+    ).values(
+        is_available=False, quantity=0, last_updated=func.now()
+    ).returning(ProductVariant.product_id)
+
+    rows = (await session.execute(stmt)).all()
+    if not rows:
+        return 0, set()
+    product_ids = {product_id for (product_id,) in rows}
+
+    await session.execute(
+        update(Product).where(
+            Product.id == any_(bindparam("stale_product_ids", sorted(product_ids), type_=ARRAY(Integer)))
+        ).values(content_hash=None)
+    )
+    return len(rows), product_ids
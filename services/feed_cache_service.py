@@ -0,0 +1,144 @@
+# services/feed_cache_service.py
+import logging
+import asyncio
+import hashlib
+import json
+import os
+import re
+import aiohttp
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, AsyncIterator
+
+from config_reader import config
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+
+# Статуси завантаження фіду
+FEED_UPDATED = "updated"           # Новий вміст, треба парсити
+FEED_NOT_MODIFIED = "not_modified" # Сервер відповів 304
+FEED_UNCHANGED = "unchanged"       # 200, але тіло побайтово те саме (хеш)
+
+def _safe_key(supplier_key: str) -> str:
+    return re.sub(r'[^\w.-]', '_', supplier_key)
+
+def _cache_dir() -> Path:
+    cache_dir = Path(config.xml_cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def get_cached_feed_path(supplier_key: str) -> Path:
+    """Шлях до останнього успішно імпортованого фіду постачальника."""
+    return _cache_dir() / f"{_safe_key(supplier_key)}.xml"
+
+def _pending_feed_path(supplier_key: str) -> Path:
+    """Завантажений, але ще не імпортований фід."""
+    return _cache_dir() / f"{_safe_key(supplier_key)}.xml.new"
+
+def _meta_path(supplier_key: str) -> Path:
+    return _cache_dir() / f"{_safe_key(supplier_key)}.meta.json"
+
+def load_feed_meta(supplier_key: str) -> Dict[str, Any]:
+    """ETag / Last-Modified / sha256 останнього успішного імпорту (або {})."""
+    try:
+        return json.loads(_meta_path(supplier_key).read_text(encoding='utf-8'))
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as e:
+        logger.warning(f"Feed cache: не вдалося прочитати meta для '{supplier_key}': {e}")
+        return {}
+
+def save_feed_meta(supplier_key: str, meta: Dict[str, Any]) -> None:
+    """
+    Зберігає meta фіду. Викликати ТІЛЬКИ після успішного імпорту в БД,
+    інакше наступний запуск вирішить, що "нічого не змінилось".
+    """
+    path = _meta_path(supplier_key)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(meta, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp_path, path)
+
+async def download_feed(supplier_key: str, url: str) -> Tuple[Optional[str], Optional[Path], Dict[str, Any]]:
+    """
+    Умовне завантаження фіду (If-None-Match / If-Modified-Since, gzip/deflate).
+    Тіло пишеться потоково на диск з підрахунком sha256.
+
+    Повертає (статус, шлях до фіду на диску, нова meta).
+    Статус None = помилка завантаження.
+    Новий фід (FEED_UPDATED) лежить окремо від імпортованого: після успішного
+    імпорту його треба закріпити `promote_feed`, після невдалого - `discard_feed`.
+    """
+    old_meta = load_feed_meta(supplier_key)
+    feed_path = get_cached_feed_path(supplier_key)
+    has_cached_feed = feed_path.exists()
+
+    headers = {"Accept-Encoding": "gzip, deflate"}
+    if has_cached_feed:
+        if old_meta.get("etag"):
+            headers["If-None-Match"] = old_meta["etag"]
+        if old_meta.get("last_modified"):
+            headers["If-Modified-Since"] = old_meta["last_modified"]
+
+    part_path = feed_path.with_suffix(".xml.part")
+    try:
+        async with aiohttp.ClientSession() as http_session:
+            async with http_session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=600)) as response:
+                if response.status == 304:
+                    logger.info(f"Feed cache: '{supplier_key}' не змінився (304 Not Modified).")
+                    return FEED_NOT_MODIFIED, feed_path, old_meta
+                response.raise_for_status()
+
+                # aiohttp сам розпаковує gzip/deflate (auto_decompress)
+                digest = hashlib.sha256()
+                size = 0
+                fh = await asyncio.to_thread(open, part_path, "wb")
+                try:
+                    async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                        digest.update(chunk)
+                        await asyncio.to_thread(fh.write, chunk) # Диск не блокує event loop
+                        size += len(chunk)
+                finally:
+                    await asyncio.to_thread(fh.close)
+
+                new_meta = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "sha256": digest.hexdigest(),
+                    "size": size,
+                    "downloaded_at": datetime.now(timezone.utc).isoformat(),
+                }
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        logger.error(f"Помилка завантаження XML {supplier_key}: {e}")
+        part_path.unlink(missing_ok=True)
+        return None, None, old_meta
+
+    if has_cached_feed and new_meta["sha256"] == old_meta.get("sha256"):
+        part_path.unlink(missing_ok=True)
+        logger.info(f"Feed cache: '{supplier_key}' завантажено, але вміст ідентичний (sha256).")
+        return FEED_UNCHANGED, feed_path, new_meta
+
+    # Імпортований фід не чіпаємо, поки новий не ляже в БД
+    pending_path = _pending_feed_path(supplier_key)
+    os.replace(part_path, pending_path)
+    logger.info(f"Feed cache: '{supplier_key}' оновлено ({new_meta['size'] // 1024} KB).")
+    return FEED_UPDATED, pending_path, new_meta
+
+def promote_feed(supplier_key: str, pending_path: Path, meta: Dict[str, Any]) -> None:
+    """Новий фід імпортовано: він стає "останнім успішним" разом зі своєю meta."""
+    os.replace(pending_path, get_cached_feed_path(supplier_key))
+    save_feed_meta(supplier_key, meta)
+
+def discard_feed(pending_path: Path) -> None:
+    """Імпорт нового фіду не вдався - лишаємо попередній (наступний запуск завантажить заново)."""
+    pending_path.unlink(missing_ok=True)
+
+async def iter_feed_chunks(path: Path) -> AsyncIterator[bytes]:
+    """Читає фід з диска шматками, не блокуючи event loop."""
+    fh = await asyncio.to_thread(open, path, "rb")
+    try:
+        while chunk := await asyncio.to_thread(fh.read, _CHUNK_SIZE):
+            yield chunk
+    finally:
+        fh.close()
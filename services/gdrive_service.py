@@ -1,123 +1,225 @@
 # services/gdrive_service.py
 import logging
+import asyncio
+import io
 import json
-import tempfile
-import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import MediaIoBaseUpload
 from googleapiclient.errors import HttpError
 
 from config_reader import config
 
 logger = logging.getLogger(__name__)
 
-_gdrive_service = None
+# Синхронізація з Google Drive. Синхронний googleapiclient працює лише у
+# власному пулі потоків (клієнт не потокобезпечний - свій на кожен потік).
+# Завантаження накопичуються в черзі й відправляються пачками: папка
+# визначається один раз (кеш id папок), файли йдуть з пам'яті, паралельно
+# не більше _UPLOAD_WORKERS.
+_UPLOAD_WORKERS = 4
+_FLUSH_INTERVAL_SECONDS = 1.0 # Скільки збираємо пачку після першого файлу
+_MAX_BATCH_SIZE = 20
+_FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
 
-def _get_gdrive_service():
-    """Ініціалізує та кешує GDrive service."""
-    global _gdrive_service
-    if _gdrive_service:
-        return _gdrive_service
+_executor = ThreadPoolExecutor(max_workers=_UPLOAD_WORKERS, thread_name_prefix="gdrive")
+_thread_local = threading.local()
+_credentials: Optional[Credentials] = None
+_credentials_lock = threading.Lock()
+_folder_ids: Dict[Tuple[str, str], str] = {} # (parent_id, назва) -> id папки
+_folder_lock = threading.Lock()
+
+_queue: Optional[asyncio.Queue] = None
+_flusher_task: Optional[asyncio.Task] = None
+
+def is_configured() -> bool:
+    return bool(config.service_account_json and config.gdrive_folder_id)
+
+# ---
+# Синхронна частина (лише в потоках _executor)
+# ---
+def _get_credentials() -> Optional[Credentials]:
+    global _credentials
+    with _credentials_lock:
+        if _credentials is not None:
+            return _credentials
+        if not config.service_account_json:
+            logger.error("SERVICE_ACCOUNT_JSON не налаштовано. Google Drive не працюватиме.")
+            return None
+        try:
+            info = json.loads(config.service_account_json)
+            _credentials = Credentials.from_service_account_info(
+                info,
+                scopes=["https://www.googleapis.com/auth/drive.file"]
+            )
+            return _credentials
+        except json.JSONDecodeError:
+            logger.error("SERVICE_ACCOUNT_JSON має невірний JSON формат.")
+            return None
 
-    if not config.service_account_json:
-        logger.error("SERVICE_ACCOUNT_JSON не налаштовано. Google Drive не працюватиме.")
+def _get_gdrive_service():
+    """GDrive service поточного потоку (створюється один раз на потік)."""
+    service = getattr(_thread_local, "service", None)
+    if service is not None:
+        return service
+    creds = _get_credentials()
+    if creds is None:
         return None
-        
     try:
-        info = json.loads(config.service_account_json)
-        creds = Credentials.from_service_account_info(
-            info, 
-            scopes=["https://www.googleapis.com/auth/drive.file"]
-        )
-        _gdrive_service = build("drive", "v3", credentials=creds, cache_discovery=False)
-        logger.info("Сервіс Google Drive успішно ініціалізовано.")
-        return _gdrive_service
-    except json.JSONDecodeError:
-        logger.error("SERVICE_ACCOUNT_JSON має невірний JSON формат.")
-        return None
+        service = build("drive", "v3", credentials=creds, cache_discovery=False)
     except Exception as e:
         logger.error(f"Помилка ініціалізації GDrive: {e}", exc_info=True)
         return None
+    _thread_local.service = service
+    logger.info(f"Сервіс Google Drive ініціалізовано ({threading.current_thread().name}).")
+    return service
 
 def _find_or_create_folder(service, folder_name: str, parent_folder_id: str) -> Optional[str]:
-    """Знаходить або створює папку та повертає її ID."""
-    try:
-        query = (
-            f"'{parent_folder_id}' in parents and "
-            f"name = '{folder_name}' and "
-            f"mimeType = 'application/vnd.google-apps.folder' and "
-            f"trashed = false"
-        )
-        response = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
-        files = response.get('files', [])
-        
-        if files:
-            return files[0].get('id')
-
-        logger.info(f"GDrive: Папку '{folder_name}' не знайдено. Створюю нову...")
-        folder_metadata = {
-            'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder',
-            'parents': [parent_folder_id]
-        }
-        folder = service.files().create(body=folder_metadata, fields='id').execute()
-        return folder.get('id')
-    except HttpError as e:
-        logger.error(f"Помилка GDrive API під час пошуку/створення папки '{folder_name}': {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Неочікувана помилка GDrive (folder): {e}", exc_info=True)
-        return None
+    """Знаходить або створює папку та повертає її ID (з кешу - без запиту до Drive)."""
+    cache_key = (parent_folder_id, folder_name)
+    with _folder_lock: # Інакше паралельні потоки створили б дублікати папки
+        folder_id = _folder_ids.get(cache_key)
+        if folder_id:
+            return folder_id
+        try:
+            escaped_name = folder_name.replace("\\", "\\\\").replace("'", "\\'")
+            query = (
+                f"'{parent_folder_id}' in parents and "
+                f"name = '{escaped_name}' and "
+                f"mimeType = '{_FOLDER_MIME_TYPE}' and "
+                f"trashed = false"
+            )
+            response = service.files().list(q=query, spaces='drive', fields='files(id)').execute()
+            files = response.get('files', [])
 
-async def upload_order_to_gdrive(order_uid: str, order_data: dict) -> bool:
-    """
-    Головна функція. Завантажує словник `order_data` як JSON файл на GDrive.
-    """
+            if files:
+                folder_id = files[0].get('id')
+            else:
+                logger.info(f"GDrive: Папку '{folder_name}' не знайдено. Створюю нову...")
+                folder_metadata = {
+                    'name': folder_name,
+                    'mimeType': _FOLDER_MIME_TYPE,
+                    'parents': [parent_folder_id]
+                }
+                folder_id = service.files().create(body=folder_metadata, fields='id').execute().get('id')
+        except HttpError as e:
+            logger.error(f"Помилка GDrive API під час пошуку/створення папки '{folder_name}': {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Неочікувана помилка GDrive (folder): {e}", exc_info=True)
+            return None
+        if folder_id:
+            _folder_ids[cache_key] = folder_id
+        return folder_id
+
+def _forget_folder(folder_id: str) -> None:
+    with _folder_lock:
+        for cache_key in [key for key, value in _folder_ids.items() if value == folder_id]:
+            del _folder_ids[cache_key]
+
+def _orders_folder_id() -> Optional[str]:
     service = _get_gdrive_service()
     if not service or not config.gdrive_folder_id:
-        logger.warning("GDrive service не налаштований. Завантаження замовлення пропущено.")
-        return False
+        return None
+    # Папка для замовлень (напр. "ZamovLandLiz")
+    return _find_or_create_folder(service, config.gdrive_orders_folder_name, config.gdrive_folder_id)
 
+def _upload_sync(folder_id: str, file_name: str, content: bytes, mimetype: str) -> bool:
+    """Завантажує файл з пам'яті (без тимчасових файлів на диску)."""
+    service = _get_gdrive_service()
+    if not service:
+        return False
     try:
-        # 1. Знаходимо/створюємо папку для замовлень (напр. "ZamovLandLiz")
-        orders_parent_folder_id = _find_or_create_folder(
-            service, 
-            config.gdrive_orders_folder_name, 
-            config.gdrive_folder_id
-        )
-        
-        if not orders_parent_folder_id:
-            logger.error("Не вдалося знайти або створити головну папку для замовлень GDrive.")
-            return False
-
-        # 2. Конвертуємо dict в JSON-рядок
-        order_json_str = json.dumps(order_data, ensure_ascii=False, indent=4)
-        
-        # 3. Створюємо тимчасовий файл для завантаження
-        # (GDrive API v3 вимагає завантаження з файлу)
-        with tempfile.NamedTemporaryFile(delete=False, mode='w', encoding='utf-8', suffix=".json") as tmp_file:
-            tmp_file.write(order_json_str)
-            tmp_filepath = tmp_file.name
-
-        file_name = f"{order_uid}.json"
-        
-        # 4. Завантажуємо файл
-        file_metadata = {'name': file_name, 'parents': [orders_parent_folder_id]}
-        media = MediaFileUpload(tmp_filepath, mimetype='application/json')
-        
+        file_metadata = {'name': file_name, 'parents': [folder_id]}
+        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mimetype, resumable=False)
         service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-        
-        logger.info(f"Замовлення {order_uid} успішно завантажено на Google Drive.")
         return True
-        
     except HttpError as e:
+        if e.resp.status == 404:
+            # Папку видалили вручну - наступна пачка знайде/створить її заново
+            _forget_folder(folder_id)
         logger.error(f"Помилка GDrive API під час завантаження файлу '{file_name}': {e}")
         return False
     except Exception as e:
-        logger.error(f"Неочікувана помилка GDrive (upload): {e}", exc_info=True)
+        logger.error(f"Неочікувана помилка GDrive (upload '{file_name}'): {e}", exc_info=True)
         return False
-    finally:
-        # 5. Гарантовано видаляємо тимчасовий файл
-        if 'tmp_filepath' in locals() and os.path.exists(tmp_filepath):
-            os.remove(tmp_filepath)
\ No newline at end of file
+
+# ---
+# Асинхронна черга завантажень
+# ---
+class _Upload:
+    __slots__ = ("file_name", "content", "mimetype", "future")
+
+    def __init__(self, file_name: str, content: bytes, mimetype: str, future: asyncio.Future):
+        self.file_name = file_name
+        self.content = content
+        self.mimetype = mimetype
+        self.future = future
+
+async def _flush(batch: List[_Upload]) -> None:
+    loop = asyncio.get_running_loop()
+    folder_id = await loop.run_in_executor(_executor, _orders_folder_id)
+    if not folder_id:
+        logger.error("Не вдалося знайти або створити головну папку для замовлень GDrive.")
+        results = [False] * len(batch)
+    else:
+        # Паралельність обмежена розміром _executor
+        results = await asyncio.gather(*(
+            loop.run_in_executor(_executor, _upload_sync, folder_id, upload.file_name, upload.content, upload.mimetype)
+            for upload in batch
+        ), return_exceptions=True)
+    uploaded = 0
+    for upload, result in zip(batch, results):
+        ok = result is True
+        uploaded += ok
+        if not upload.future.done():
+            upload.future.set_result(ok)
+    logger.info(f"GDrive: пачка {len(batch)} файл(ів), завантажено {uploaded}.")
+
+async def _run_flusher() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _queue.get()]
+        deadline = loop.time() + _FLUSH_INTERVAL_SECONDS
+        while len(batch) < _MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await _flush(batch)
+        except Exception as e:
+            logger.error(f"GDrive: помилка пачки завантажень: {e}", exc_info=True)
+            for upload in batch:
+                if not upload.future.done():
+                    upload.future.set_result(False)
+
+async def upload_file(file_name: str, content: bytes, mimetype: str) -> bool:
+    """Ставить файл у чергу на завантаження в папку замовлень і чекає результат своєї пачки."""
+    global _queue, _flusher_task
+    if not is_configured():
+        logger.warning("GDrive service не налаштований. Завантаження пропущено.")
+        return False
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = asyncio.get_running_loop().create_task(_run_flusher())
+    future = asyncio.get_running_loop().create_future()
+    await _queue.put(_Upload(file_name, content, mimetype, future))
+    return await future
+
+async def upload_order_to_gdrive(order_uid: str, order_json: str) -> bool:
+    """
+    Головна функція. Завантажує вже відрендерений JSON замовлення
+    (`order_documents.ADMIN_JSON`) на GDrive, не блокуючи event loop.
+    """
+    ok = await upload_file(f"{order_uid}.json", order_json.encode("utf-8"), "application/json")
+    if ok:
+        logger.info(f"Замовлення {order_uid} успішно завантажено на Google Drive.")
+    return ok
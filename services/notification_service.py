@@ -7,6 +7,7 @@ from database.models import Supplier, Order # <-- НОВИЙ ІМПОРТ
 from database.db import AsyncSessionLocal # <-- НОВИЙ ІМПОРТ
 from sqlalchemy import update # <-- НОВИЙ ІМПОРТ
 from typing import Optional # <-- НОВИЙ ІМПОРТ
+from services import telegram_sender
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +25,7 @@ async def notify_admin_of_new_order(bot: Bot, order_summary: str, order_data_jso
         )
     except Exception as e:
         logger.error(f"Не вдалося надіслати сповіщення адміну {config.test_channel}: {e}")
+        raise # Повторить outbox
 
 # ... (код _get_supplier_order_keyboard залишається без змін) ...
 def _get_supplier_order_keyboard(child_order_uid: str, mydrop_link: Optional[str] = None) -> InlineKeyboardMarkup:
@@ -76,6 +78,7 @@ async def notify_customer_of_new_order(
         
     except Exception as e:
         logger.error(f"Не вдалося надіслати сповіщення КЛІЄНТУ {user_id}: {e}")
+        raise # Повторить outbox
 
 async def notify_supplier_of_new_order(
     bot: Bot, 
@@ -96,8 +99,10 @@ async def notify_supplier_of_new_order(
         mydrop_link = None 
         keyboard = _get_supplier_order_keyboard(child_order_uid=child_order_uid, mydrop_link=mydrop_link)
         
-        await bot.send_message(target_chat_id, summary_text, reply_markup=keyboard)
-        await bot.send_document(target_chat_id, document=txt_file)
+        with telegram_sender.lane(telegram_sender.LANE_SUPPLIER):
+            await bot.send_message(target_chat_id, summary_text, reply_markup=keyboard)
+            await bot.send_document(target_chat_id, document=txt_file)
         
     except Exception as e:
-        logger.error(f"Не вдалося надіслати сповіщення ПОСТАЧАЛЬНИКУ {supplier.name} (TG ID: {target_chat_id}): {e}")
\ No newline at end of file
+        logger.error(f"Не вдалося надіслати сповіщення ПОСТАЧАЛЬНИКУ {supplier.name} (TG ID: {target_chat_id}): {e}")
+        raise # Повторить outbox
@@ -0,0 +1,181 @@
+# services/order_documents.py
+import logging
+import asyncio
+import html
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Документи замовлення (.txt клієнту/постачальникам, зведення та JSON для адміна)
+# рендеряться в окремому пулі потоків, а не в event loop бота/web_app.
+# Готові тексти їдуть у payload повідомлень outbox - повтори їх не перераховують.
+CUSTOMER_TXT = "customer_txt"
+CUSTOMER_FILENAME = "customer_filename"
+ADMIN_SUMMARY = "admin_summary"
+ADMIN_JSON = "admin_json"
+_SUPPLIER_TXT = "supplier_txt:{}"
+_RENDER_WORKERS = 2
+
+_executor = ThreadPoolExecutor(max_workers=_RENDER_WORKERS, thread_name_prefix="order-docs")
+
+def supplier_txt(child_order_uid: str) -> str:
+    """Назва .txt документа постачальника для Child-замовлення."""
+    return _SUPPLIER_TXT.format(child_order_uid)
+
+def supplier_filename(child_order_uid: str) -> str:
+    return f"order_{child_order_uid}.txt"
+
+def _format_customer_txt_summary(
+    order_uid: str, 
+    fsm_data: dict, 
+    cart_items: list, 
+    total_price: int, 
+    supplier_count: int
+) -> str:
+    """
+    (План 25) Форматує .txt файл, який бачить КЛІЄНТ.
+    (Включає ВСІ товари та ЗАГАЛЬНУ (з націнкою) ціну).
+    """
+    payment_map = {"cod": "Накладений платіж", "prepaid": "Повна передоплата", "partial": "Часткова передоплата"}
+    items_str = ""
+    for i, item in enumerate(cart_items, 1):
+        items_str += (
+            f"\n{i}. {item.get('name')} (Арт: {item.get('sku')})\n"
+            f"   Опції: {item.get('options_text', '-')}\n"
+            f"   К-сть: {item.get('quantity')} шт. x {item.get('price')} грн\n"
+            f"   Сума: {item.get('total_item_price')} грн\n"
+        )
+    
+    delivery_warning = f"(Замовлення буде розділено на {supplier_count} посилк(и))\n\n" \
+                       if supplier_count > 1 else "\n"
+    
+    summary = (
+        f"--- ДЯКУЄМО ЗА ЗАМОВЛЕННЯ В TAVERNAGROUP! ---\n\n"
+        f"Номер вашого замовлення: {order_uid}\n"
+        f"Статус: Очікує підтвердження від постачальників...\n"
+        f"{delivery_warning}"
+        f"--- ДАНІ ОТРИМУВАЧА ---\n"
+        f"ПІБ: {fsm_data.get('pib')}\n"
+        f"Телефон: {fsm_data.get('phone')}\n"
+        f"Доставка: {fsm_data.get('delivery_service')} / {fsm_data.get('address')}\n"
+        f"Оплата: {payment_map.get(fsm_data.get('payment_type'))}\n"
+        f"Примітка: {fsm_data.get('note', 'Немає')}\n\n"
+        f"--- СКЛАД ЗАМОВЛЕННЯ ---\n"
+        f"{items_str}\n"
+        f"----------------------------------------\n"
+        f"ЗАГАЛЬНА СУМА: {total_price} грн\n"
+    )
+    return summary
+
+def _format_supplier_txt_summary(
+    child_order_uid: str, 
+    fsm_data: dict, 
+    supplier_items: list, 
+    supplier_total_drop_price: int,
+    payment_type: str
+) -> str:
+    """
+    (План 25) Форматує .txt файл, який бачить ПОСТАЧАЛЬНИК.
+    (Включає ТІЛЬКИ його товари та ТІЛЬКИ дроп-ціну).
+    """
+    items_str = ""
+    for i, item in enumerate(supplier_items, 1):
+        items_str += (
+            f"\n{i}. {item.get('name')} (Арт: {item.get('sku')})\n"
+            f"   Опції: {item.get('options_text', '-')}\n"
+            f"   К-сть: {item.get('quantity')} шт. x {item.get('drop_price')} грн\n"
+        )
+    
+    payment_info = ""
+    if payment_type == "prepaid":
+        payment_info = "ОПЛАЧЕНО КЛІЄНТОМ (Повна передоплата).\nКошти (дроп-ціна) будуть автоматично переведені на ваш IBAN."
+    elif payment_type == "cod":
+        payment_info = f"НАКЛАДЕНИЙ ПЛАТІЖ (COD).\nСума до отримання з клієнта (дроп-ціна): {supplier_total_drop_price} грн."
+    elif payment_type == "partial": # (Твій План 25)
+        payment_info = f"ЧАСТКОВА ПЕРЕДОПЛАТА (Націнку отримано).\nСума до отримання з клієнта (дроп-ціна): {supplier_total_drop_price} грн."
+
+    summary = (
+        f"--- НОВЕ ЗАМОВЛЕННЯ ВІД TAVERNAGROUP ---\n\n"
+        f"Номер замовлення: {child_order_uid}\n"
+        f"Статус: Очікує на ваше підтвердження.\n\n"
+        f"--- ІНФОРМАЦІЯ ПРО ОПЛАТУ ---\n"
+        f"!!! {payment_info} !!!\n\n"
+        f"--- ДАНІ ОТРИМУВАЧА (для ТТН) ---\n"
+        f"ПІБ: {fsm_data.get('pib')}\n"
+        f"Телефон: {fsm_data.get('phone')}\n"
+        f"Доставка: {fsm_data.get('delivery_service')}\n"
+        f"Адреса: {fsm_data.get('address')}\n"
+        f"Ref Міста: {fsm_data.get('city_ref')}\n"
+        f"Ref Відділення: {fsm_data.get('address_ref')}\n"
+        f"Примітка: {fsm_data.get('note', 'Немає')}\n\n"
+        f"--- СКЛАД ЗАМОВЛЕННЯ ---\n"
+        f"{items_str}\n"
+        f"----------------------------------------\n"
+        f"ЗАГАЛЬНА ДРОП-СУМА: {supplier_total_drop_price} грн\n"
+    )
+    return summary
+
+def _format_admin_summary(fsm_data: dict, cart_items: list, total_price: int) -> str:
+    """Коротке зведення для тест-каналу адміна (повні дані - у JSON-файлі)."""
+    esc = lambda value: html.escape(str(value)) # Надсилається з parse_mode=HTML
+    items_str = "\n".join(
+        f"• {esc(item.get('name'))} ({esc(item.get('options_text', '-'))}) x{item.get('quantity')} = "
+        f"{item.get('total_item_price', item.get('price', 0) * item.get('quantity', 0))} грн"
+        for item in cart_items
+    )
+    return (
+        f"👤 {esc(fsm_data.get('pib'))} / {esc(fsm_data.get('phone'))}\n"
+        f"🚚 {esc(fsm_data.get('delivery_service'))}: {esc(fsm_data.get('address'))}\n"
+        f"💳 {esc(fsm_data.get('payment_type'))}\n\n"
+        f"{items_str}\n\n"
+        f"<b>Разом: {total_price} грн</b>"
+    )
+
+def _render(
+    order_uid: str,
+    fsm_data: dict,
+    cart_items: list,
+    total_price: int,
+    supplier_count: int,
+    children: List[Tuple[str, list, int]],
+    payment_type: Optional[str]
+) -> Dict[str, str]:
+    full_order_data = {
+        "order_uid": order_uid,
+        "customer": fsm_data,
+        "items": cart_items,
+        "total_price": total_price,
+        "suppliers": [child_uid for child_uid, _, _ in children],
+    }
+    documents = {
+        CUSTOMER_TXT: _format_customer_txt_summary(order_uid, fsm_data, cart_items, total_price, supplier_count),
+        CUSTOMER_FILENAME: f"{((fsm_data.get('pib') or '').split() or ['order'])[0]}_{order_uid}.txt",
+        ADMIN_SUMMARY: _format_admin_summary(fsm_data, cart_items, total_price),
+        ADMIN_JSON: json.dumps(full_order_data, ensure_ascii=False, indent=4, default=str),
+    }
+    for child_uid, items, drop_total in children:
+        documents[supplier_txt(child_uid)] = _format_supplier_txt_summary(
+            child_uid, fsm_data, items, drop_total, payment_type
+        )
+    return documents
+
+async def render_documents(
+    order_uid: str,
+    fsm_data: dict,
+    cart_items: list,
+    total_price: int,
+    supplier_count: int,
+    children: List[Tuple[str, list, int]],
+    payment_type: Optional[str]
+) -> Dict[str, str]:
+    """
+    Усі документи замовлення: {CUSTOMER_TXT, CUSTOMER_FILENAME, ADMIN_SUMMARY,
+    ADMIN_JSON, supplier_txt(child_uid)...}. `children` - (child_uid, items, drop_total).
+    Рендер - у пулі `_executor`, event loop не чекає.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor, partial(
+        _render, order_uid, fsm_data, cart_items, total_price, supplier_count, children, payment_type
+    ))
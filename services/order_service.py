@@ -5,9 +5,11 @@ import uuid
 import asyncio
 from datetime import datetime, timezone
 from aiogram import Bot
+from sqlalchemy import insert, text
 from sqlalchemy.future import select
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Tuple, Optional
 from collections import defaultdict
 
@@ -16,7 +18,7 @@ from database.models import (
     Order, OrderItem, Channel, Supplier, ProductVariant,
     OrderStatus, PaymentStatus, PayoutMethod, OrderItemStatus
 )
-from services import mydrop_service, gdrive_service, notification_service, xml_parser, delivery_service
+from services import mydrop_service, gdrive_service, notification_service, xml_parser, delivery_service, outbox_service, order_documents
 from config_reader import config
 
 logger = logging.getLogger(__name__)
@@ -24,21 +26,27 @@ logger = logging.getLogger(__name__)
 # ---
 # [ПЛАН 25] Новий "Розумний" Order UID
 # ---
-async def _generate_order_uid(db: AsyncSession, user_id: int, cart_items: List[Dict], fsm_data: dict, supplier_count: int) -> Tuple[str, int]:
+async def allocate_parent_order(db: AsyncSession, orders_count: int) -> Tuple[int, List[int]]:
+    """
+    Номер головного замовлення (послідовність `parent_order_number_seq`) та
+    `orders_count` id для Parent + Child - одним запитом.
+    Без сканування `orders` і без колізій між паралельними оформленнями
+    (номери, видані відкоченій транзакції, просто пропускаються).
+    """
+    order_num, order_ids = (await db.execute(
+        text(
+            "SELECT nextval('parent_order_number_seq'), "
+            "ARRAY(SELECT nextval(pg_get_serial_sequence('orders', 'id')) FROM generate_series(1, :count))"
+        ),
+        {"count": orders_count}
+    )).one()
+    return order_num, list(order_ids)
+
+def _generate_order_uid(new_order_num: int, cart_items: List[Dict], fsm_data: dict, supplier_count: int) -> str:
     """
     (План 25) Генерує ID замовлення (напр. ...tav1.2.6.4.np.n)
     """
-    # 1. Отримуємо наступний номер замовлення
-    last_order_q = await db.execute(
-        select(Order.id)
-        .where(Order.parent_order_id.is_(None)) # Тільки головні замовлення
-        .order_by(Order.id.desc())
-        .limit(1)
-    )
-    last_order_id = last_order_q.scalar_one_or_none()
-    new_order_num = (last_order_id + 1) if last_order_id else 1
-    
-    # 2. Збираємо частини
+    # Збираємо частини
     items_count = sum(i['quantity'] for i in cart_items) # 6
     unique_items_count = len(cart_items) # 2
     suppliers_count = supplier_count # 4
@@ -48,98 +56,7 @@ async def _generate_order_uid(db: AsyncSession, user_id: int, cart_items: List[D
     
     # Формат: tav[Num].[UniqItems].[TotalItems].[Suppliers].[Delivery].[Payment]
     parent_uid = f"TAV{new_order_num}.{unique_items_count}.{items_count}.{suppliers_count}.{delivery_code}.{payment_code}"
-    return parent_uid, new_order_num
-
-
-def _format_customer_txt_summary(
-    order_uid: str, 
-    fsm_data: dict, 
-    cart_items: list, 
-    total_price: int, 
-    supplier_count: int
-) -> str:
-    """
-    (План 25) Форматує .txt файл, який бачить КЛІЄНТ.
-    (Включає ВСІ товари та ЗАГАЛЬНУ (з націнкою) ціну).
-    """
-    payment_map = {"cod": "Накладений платіж", "prepaid": "Повна передоплата", "partial": "Часткова передоплата"}
-    items_str = ""
-    for i, item in enumerate(cart_items, 1):
-        items_str += (
-            f"\n{i}. {item.get('name')} (Арт: {item.get('sku')})\n"
-            f"   Опції: {item.get('options_text', '-')}\n"
-            f"   К-сть: {item.get('quantity')} шт. x {item.get('price')} грн\n"
-            f"   Сума: {item.get('total_item_price')} грн\n"
-        )
-    
-    delivery_warning = f"(Замовлення буде розділено на {supplier_count} посилк(и))\n\n" \
-                       if supplier_count > 1 else "\n"
-    
-    summary = (
-        f"--- ДЯКУЄМО ЗА ЗАМОВЛЕННЯ В TAVERNAGROUP! ---\n\n"
-        f"Номер вашого замовлення: {order_uid}\n"
-        f"Статус: Очікує підтвердження від постачальників...\n"
-        f"{delivery_warning}"
-        f"--- ДАНІ ОТРИМУВАЧА ---\n"
-        f"ПІБ: {fsm_data.get('pib')}\n"
-        f"Телефон: {fsm_data.get('phone')}\n"
-        f"Доставка: {fsm_data.get('delivery_service')} / {fsm_data.get('address')}\n"
-        f"Оплата: {payment_map.get(fsm_data.get('payment_type'))}\n"
-        f"Примітка: {fsm_data.get('note', 'Немає')}\n\n"
-        f"--- СКЛАД ЗАМОВЛЕННЯ ---\n"
-        f"{items_str}\n"
-        f"----------------------------------------\n"
-        f"ЗАГАЛЬНА СУМА: {total_price} грн\n"
-    )
-    return summary
-
-def _format_supplier_txt_summary(
-    child_order_uid: str, 
-    fsm_data: dict, 
-    supplier_items: list, 
-    supplier_total_drop_price: int,
-    payment_type: str
-) -> str:
-    """
-    (План 25) Форматує .txt файл, який бачить ПОСТАЧАЛЬНИК.
-    (Включає ТІЛЬКИ його товари та ТІЛЬКИ дроп-ціну).
-    """
-    items_str = ""
-    for i, item in enumerate(supplier_items, 1):
-        items_str += (
-            f"\n{i}. {item.get('name')} (Арт: {item.get('sku')})\n"
-            f"   Опції: {item.get('options_text', '-')}\n"
-            f"   К-сть: {item.get('quantity')} шт. x {item.get('drop_price')} грн\n"
-        )
-    
-    payment_info = ""
-    if payment_type == "prepaid":
-        payment_info = "ОПЛАЧЕНО КЛІЄНТОМ (Повна передоплата).\nКошти (дроп-ціна) будуть автоматично переведені на ваш IBAN."
-    elif payment_type == "cod":
-        payment_info = f"НАКЛАДЕНИЙ ПЛАТІЖ (COD).\nСума до отримання з клієнта (дроп-ціна): {supplier_total_drop_price} грн."
-    elif payment_type == "partial": # (Твій План 25)
-        payment_info = f"ЧАСТКОВА ПЕРЕДОПЛАТА (Націнку отримано).\nСума до отримання з клієнта (дроп-ціна): {supplier_total_drop_price} грн."
-
-    summary = (
-        f"--- НОВЕ ЗАМОВЛЕННЯ ВІД TAVERNAGROUP ---\n\n"
-        f"Номер замовлення: {child_order_uid}\n"
-        f"Статус: Очікує на ваше підтвердження.\n\n"
-        f"--- ІНФОРМАЦІЯ ПРО ОПЛАТУ ---\n"
-        f"!!! {payment_info} !!!\n\n"
-        f"--- ДАНІ ОТРИМУВАЧА (для ТТН) ---\n"
-        f"ПІБ: {fsm_data.get('pib')}\n"
-        f"Телефон: {fsm_data.get('phone')}\n"
-        f"Доставка: {fsm_data.get('delivery_service')}\n"
-        f"Адреса: {fsm_data.get('address')}\n"
-        f"Ref Міста: {fsm_data.get('city_ref')}\n"
-        f"Ref Відділення: {fsm_data.get('address_ref')}\n"
-        f"Примітка: {fsm_data.get('note', 'Немає')}\n\n"
-        f"--- СКЛАД ЗАМОВЛЕННЯ ---\n"
-        f"{items_str}\n"
-        f"----------------------------------------\n"
-        f"ЗАГАЛЬНА ДРОП-СУМА: {supplier_total_drop_price} грн\n"
-    )
-    return summary
+    return parent_uid
 
 
 # ---
@@ -161,7 +78,6 @@ async def create_order(
     # 1. Розділяємо кошик по постачальниках
     # { 1: [itemA, itemB], 2: [itemC] }
     supplier_cart_map = defaultdict(list)
-    supplier_db_map = {} # { 1: Supplier(id=1, name=...), 2: ... }
     
     # Переконуємося, що в кошику є supplier_id та drop_price
     # (Ми додали їх у `cart_service` в Кроці 3)
@@ -193,128 +109,124 @@ async def create_order(
     
     supplier_count = len(supplier_cart_map)
     parent_uid = "" # Визначаємо
-    parent_order = None # Визначаємо
+    payment_type = fsm_data.get("payment_type")
 
     async with AsyncSessionLocal() as db:
         try:
+            # 2. Постачальники + номер замовлення та id для Parent і всіх Child - коротка
+            # окрема транзакція (номери з послідовностей при відкаті все одно пропускаються)
             async with db.begin():
-                
-                # 2. Створюємо ParentOrder (для Клієнта)
-                parent_uid, order_num = await _generate_order_uid(db, user_id, cart_items, fsm_data, supplier_count)
-                
-                payment_type = fsm_data.get("payment_type")
-                payment_status = PaymentStatus.pending
-                if payment_type == "prepaid":
-                    payment_status = PaymentStatus.paid # Вважаємо оплаченим, чекаємо callback
-                elif payment_type == "partial":
-                    payment_status = PaymentStatus.partial # Вважаємо оплаченим, чекаємо callback
-                elif payment_type == "cod":
-                    payment_status = PaymentStatus.cod
-
-                parent_order = Order(
-                    order_uid=parent_uid,
-                    user_telegram_id=user_id,
-                    status=OrderStatus.new,
-                    payment_status=payment_status,
-                    total_price=total_price, # Повна ціна
-                    customer_name=fsm_data.get("pib"),
-                    customer_phone=fsm_data.get("phone"),
-                    delivery_service=fsm_data.get("delivery_service"),
-                    delivery_address=fsm_data.get("address"),
-                    address_ref=fsm_data.get("address_ref"),
-                    city_ref=fsm_data.get("city_ref"),
-                    payment_type=payment_type,
-                    note=fsm_data.get("note")
-                )
-                db.add(parent_order)
-                await db.flush() # Отримуємо parent_order.id
-
-                # 3. Створюємо ChildOrders (для кожного Постачальника)
-                child_orders_to_notify = [] # (supplier, child_uid, items, drop_total)
-                
-                supplier_index = 1 # (для ...4_1, ...4_2)
-                for supplier_id, items_list in supplier_cart_map.items():
-                    
-                    supplier = supplier_db_map.get(supplier_id)
-                    if not supplier: # Завантажуємо, якщо його немає
-                        supplier = await db.get(Supplier, supplier_id, options=[selectinload(Supplier.user)])
-                        if not supplier:
-                            logger.error(f"Критична помилка: Не можу знайти Supplier ID {supplier_id}")
-                            continue
-                        supplier_db_map[supplier_id] = supplier
-                    
-                    # Розраховуємо дроп-суму *тільки* для цього постачальника
-                    supplier_total_drop_price = sum(item['drop_price'] * item['quantity'] for item in items_list)
-                    
-                    # ID (План 25) - ...4_1, ...4_2
-                    child_uid = f"{parent_uid}_{supplier_index}" 
-                    supplier_index += 1
-                    
-                    child_order = Order(
-                        parent_order_id=parent_order.id, # <-- Прив'язка
-                        order_uid=child_uid,
-                        user_telegram_id=user_id,
-                        status=OrderStatus.confirmed if is_fulfillment_order else OrderStatus.new, # Фулфілмент = авто-підтверджено
-                        payment_status=parent_order.payment_status,
-                        total_price=supplier_total_drop_price, # <-- Дроп-ціна!
-                        supplier_id=supplier_id, # <-- Прив'язка
-                        
-                        # Копіюємо дані клієнта
-                        customer_name=parent_order.customer_name,
-                        customer_phone=parent_order.customer_phone,
-                        delivery_service=parent_order.delivery_service,
-                        delivery_address=parent_order.delivery_address,
-                        address_ref=parent_order.address_ref,
-                        city_ref=parent_order.city_ref,
-                        payment_type=parent_order.payment_type,
-                        note=parent_order.note
+                known_supplier_ids = set((await db.execute(
+                    select(Supplier.id).where(Supplier.id.in_(list(supplier_cart_map)))
+                )).scalars().all())
+                for supplier_id in supplier_cart_map.keys() - known_supplier_ids:
+                    logger.error(f"Критична помилка: Не можу знайти Supplier ID {supplier_id}")
+                    del supplier_cart_map[supplier_id]
+                order_num, order_ids = await allocate_parent_order(db, 1 + len(supplier_cart_map))
+            parent_order_id = order_ids[0]
+            parent_uid = _generate_order_uid(order_num, cart_items, fsm_data, supplier_count)
+
+            payment_status = PaymentStatus.pending
+            if payment_type == "prepaid":
+                payment_status = PaymentStatus.paid # Вважаємо оплаченим, чекаємо callback
+            elif payment_type == "partial":
+                payment_status = PaymentStatus.partial # Вважаємо оплаченим, чекаємо callback
+            elif payment_type == "cod":
+                payment_status = PaymentStatus.cod
+
+            # Дані клієнта - однакові для Parent та всіх Child
+            customer_fields = {
+                "user_telegram_id": user_id,
+                "payment_status": payment_status,
+                "customer_name": fsm_data.get("pib"),
+                "customer_phone": fsm_data.get("phone"),
+                "delivery_service": fsm_data.get("delivery_service"),
+                "delivery_address": fsm_data.get("address"),
+                "address_ref": fsm_data.get("address_ref"),
+                "city_ref": fsm_data.get("city_ref"),
+                "payment_type": payment_type,
+                "note": fsm_data.get("note"),
+            }
+
+            # 3. ParentOrder (для Клієнта) + ChildOrders (для кожного Постачальника)
+            order_rows = [{
+                "id": parent_order_id,
+                "parent_order_id": None,
+                "order_uid": parent_uid,
+                "status": OrderStatus.new,
+                "total_price": total_price, # Повна ціна
+                "supplier_id": None,
+                **customer_fields
+            }]
+            item_rows = []
+            child_orders_to_notify = [] # (supplier_id, child_uid, items, drop_total)
+            item_status = OrderItemStatus.confirmed if is_fulfillment_order else OrderItemStatus.pending
+
+            for supplier_index, ((supplier_id, items_list), child_order_id) in enumerate(
+                zip(supplier_cart_map.items(), order_ids[1:]), start=1
+            ):
+                # Розраховуємо дроп-суму *тільки* для цього постачальника
+                supplier_total_drop_price = sum(item['drop_price'] * item['quantity'] for item in items_list)
+
+                # ID (План 25) - ...4_1, ...4_2
+                child_uid = f"{parent_uid}_{supplier_index}" 
+                order_rows.append({
+                    "id": child_order_id,
+                    "parent_order_id": parent_order_id, # <-- Прив'язка
+                    "order_uid": child_uid,
+                    "status": OrderStatus.confirmed if is_fulfillment_order else OrderStatus.new, # Фулфілмент = авто-підтверджено
+                    "total_price": supplier_total_drop_price, # <-- Дроп-ціна!
+                    "supplier_id": supplier_id, # <-- Прив'язка
+                    **customer_fields
+                })
+
+                # 4. OrderItems: для Parent (final_price) та для Child (drop_price)
+                for item in items_list:
+                    for order_id, price_per_item in (
+                        (parent_order_id, item.get("price")), # Final Price
+                        (child_order_id, item.get("drop_price")), # <-- Дроп-ціна!
+                    ):
+                        item_rows.append({
+                            "order_id": order_id,
+                            "supplier_id": supplier_id,
+                            "product_id": item.get("product_id"),
+                            "variant_id": item.get("variant_db_id"),
+                            "product_name": item.get("name"),
+                            "sku": item.get("sku"),
+                            "options_text": item.get("options_text"),
+                            "quantity": item.get("quantity"),
+                            "price_per_item": price_per_item,
+                            "drop_price_per_item": item.get("drop_price"),
+                            "supplier_offer_id": item.get("variant_offer_id"),
+                            "status": item_status
+                        })
+
+                # Додаємо в чергу на сповіщення (ТІЛЬКИ якщо це НЕ фулфілмент)
+                if not is_fulfillment_order:
+                    child_orders_to_notify.append(
+                        (supplier_id, child_uid, items_list, supplier_total_drop_price)
                     )
-                    db.add(child_order)
-                    await db.flush() # Отримуємо child_order.id
-                    
-                    # 4. Створюємо OrderItems (для Parent та Child)
-                    for item in items_list:
-                        item_status = OrderItemStatus.confirmed if is_fulfillment_order else OrderItemStatus.pending
-                        
-                        # Створюємо Item для ParentOrder (з final_price)
-                        db.add(OrderItem(
-                            order_id=parent_order.id,
-                            supplier_id=supplier_id,
-                            product_id=item.get("product_id"),
-                            variant_id=item.get("variant_db_id"),
-                            product_name=item.get("name"),
-                            sku=item.get("sku"),
-                            options_text=item.get("options_text"), 
-                            quantity=item.get("quantity"),
-                            price_per_item=item.get("price"), # Final Price
-                            drop_price_per_item=item.get("drop_price"), # Drop Price
-                            supplier_offer_id=item.get("variant_offer_id"),
-                            status=item_status
-                        ))
-                        # Створюємо Item для ChildOrder (з drop_price)
-                        db.add(OrderItem(
-                            order_id=child_order.id,
-                            supplier_id=supplier_id,
-                            product_id=item.get("product_id"),
-                            variant_id=item.get("variant_db_id"),
-                            product_name=item.get("name"),
-                            sku=item.get("sku"),
-                            options_text=item.get("options_text"), 
-                            quantity=item.get("quantity"),
-                            price_per_item=item.get("drop_price"), # <-- Дроп-ціна!
-                            drop_price_per_item=item.get("drop_price"),
-                            supplier_offer_id=item.get("variant_offer_id"),
-                            status=item_status
-                        ))
-                    
-                    # Додаємо в чергу на сповіщення (ТІЛЬКИ якщо це НЕ фулфілмент)
-                    if not is_fulfillment_order:
-                        child_orders_to_notify.append(
-                            (supplier, child_uid, items_list, supplier_total_drop_price)
-                        )
-
-            # Коммітимо ВСЕ (Parent, 4 Child, 8 Items) однією транзакцією
-            await db.commit()
+
+            # 5. Документи - до транзакції запису: рендер у пулі потоків не тримає з'єднання й блокування
+            documents = await order_documents.render_documents(
+                parent_uid, fsm_data, cart_items, total_price, supplier_count,
+                [(child_uid, items, drop_total) for _, child_uid, items, drop_total in child_orders_to_notify],
+                payment_type
+            )
+
+            # Усе (Parent, Child, позиції, сповіщення в outbox) - однією короткою транзакцією
+            async with db.begin():
+                # Усі замовлення - один multi-row INSERT (id вже виділені, тож Child
+                # посилаються на Parent в тому ж запиті), усі позиції - один executemany
+                await db.execute(insert(Order).values(order_rows))
+                if item_rows:
+                    await db.execute(insert(OrderItem), item_rows)
+
+                await outbox_service.add_messages(db, _build_order_messages(
+                    parent_order_id, parent_uid, user_id, fsm_data, cart_items, total_price,
+                    supplier_count, is_fulfillment_order, child_orders_to_notify, documents
+                ))
+
             logger.info(f"Order Spooler: Успішно створено ParentOrder {parent_uid} та {supplier_count} ChildOrders.")
             
         except SQLAlchemyError as e:
@@ -326,50 +238,9 @@ async def create_order(
             logger.error(f"Неочікувана помилка при 'Order Spooling': {e}", exc_info=True)
             return False, None
 
-    # --- 5. Фонові Завдання (Сповіщення) ---
-    
-    # 5.1. Сповіщення Клієнту (План 25)
-    customer_txt_name = f"{fsm_data.get('pib', 'order').split()[0]}_{parent_uid}.txt"
-    customer_txt = _format_customer_txt_summary(
-        parent_uid, fsm_data, cart_items, total_price, supplier_count
-    )
-    
-    customer_summary = f"✅ Дякуємо! Ваше замовлення <code>{parent_uid}</code> прийнято.\n"
-    if is_fulfillment_order:
-        customer_summary += "Всі товари будуть відправлені однією посилкою."
-    else:
-        customer_summary += f"Очікуємо підтвердження від {supplier_count} постачальник(ів)..."
-        
-    asyncio.create_task(
-        notification_service.notify_customer_of_new_order(
-            bot=bot,
-            user_id=user_id,
-            order_uid=parent_uid, # <-- Передаємо Parent UID
-            summary_text=customer_summary,
-            order_txt_content=customer_txt,
-            order_filename=customer_txt_name
-        )
-    )
+    outbox_service.wake()
 
-    # 5.2. Сповіщення Постачальникам (План 25)
-    for supplier, child_uid, items, drop_total in child_orders_to_notify:
-        supplier_txt_name = f"order_{child_uid}.txt"
-        supplier_txt = _format_supplier_txt_summary(
-            child_uid, fsm_data, items, drop_total, parent_order.payment_type
-        )
-        asyncio.create_task(
-            notification_service.notify_supplier_of_new_order(
-                bot=bot,
-                supplier=supplier, # Об'єкт Supplier (з `user`)
-                summary_text=f"🔥 **Нове Замовлення!** <code>{child_uid}</code>\n"
-                             f"На суму (дроп): {drop_total} грн. Натисніть 'Підтвердити'.",
-                order_txt_content=supplier_txt,
-                order_filename=supplier_txt_name,
-                child_order_uid=child_uid # Передаємо UID для кнопок
-            )
-        )
-        
-    # 5.3. Якщо це Фулфілмент - запускаємо API НП
+    # Якщо це Фулфілмент - запускаємо API НП
     if is_fulfillment_order:
         logger.info(f"Order Spooler: Сценарій А. Відправляю запит на Фулфілмент-Хаб НП...")
         # TODO: Сформатувати `order_data` для `create_update_orders`
@@ -378,30 +249,116 @@ async def create_order(
         # )
         pass
 
-    # 5.4. Сповіщення Адміну (в тест-канал)
-    order_summary_text = _format_order_summary(fsm_data, cart_items, total_price)
-    full_order_json_str = json.dumps(full_order_data, ensure_ascii=False, indent=4)
-    asyncio.create_task(
-        notification_service.notify_admin_of_new_order(
-            bot=bot,
-            order_summary=order_summary_text,
-            order_data_json=full_order_json_str,
-            order_uid=parent_uid
-        )
-    )
+    return True, parent_uid
 
-    # 5.5. --- [ФАЗА 3.7] Постинг у "Live" гілку (Твій План 17.1) ---
-    asyncio.create_task(
-        post_to_live_feed(
-            bot=bot,
-            fsm_data=fsm_data,
-            total_price=total_price,
-            items_count=len(cart_items)
-        )
+# ---
+# Сповіщення про нове замовлення (через outbox)
+# ---
+OUTBOX_CUSTOMER_NEW_ORDER = "order.customer_new_order"
+OUTBOX_SUPPLIER_NEW_ORDER = "order.supplier_new_order"
+OUTBOX_ADMIN_NEW_ORDER = "order.admin_new_order"
+OUTBOX_LIVE_FEED = "order.live_feed"
+OUTBOX_GDRIVE_UPLOAD = "order.gdrive_upload"
+
+def _build_order_messages(
+    parent_order_id: int,
+    parent_uid: str,
+    user_id: int,
+    fsm_data: dict,
+    cart_items: List[Dict[str, Any]],
+    total_price: int,
+    supplier_count: int,
+    is_fulfillment_order: bool,
+    child_orders_to_notify: list,
+    documents: Dict[str, str]
+) -> List[Dict[str, Any]]:
+    """Тексти/файли вже відрендерені (`order_documents`): у payload лише JSON (Supplier - за id)."""
+    messages = []
+
+    # 5.1. Сповіщення Клієнту (План 25)
+    customer_summary = f"✅ Дякуємо! Ваше замовлення <code>{parent_uid}</code> прийнято.\n"
+    if is_fulfillment_order:
+        customer_summary += "Всі товари будуть відправлені однією посилкою."
+    else:
+        customer_summary += f"Очікуємо підтвердження від {supplier_count} постачальник(ів)..."
+    messages.append(outbox_service.message(OUTBOX_CUSTOMER_NEW_ORDER, outbox_service.DESTINATION_CUSTOMER, {
+        "user_id": user_id,
+        "order_uid": parent_uid, # <-- Parent UID
+        "summary_text": customer_summary,
+        "order_txt_content": documents[order_documents.CUSTOMER_TXT],
+        "order_filename": documents[order_documents.CUSTOMER_FILENAME],
+    }, order_id=parent_order_id))
+
+    # 5.2. Сповіщення Постачальникам (План 25)
+    for supplier_id, child_uid, items, drop_total in child_orders_to_notify:
+        messages.append(outbox_service.message(OUTBOX_SUPPLIER_NEW_ORDER, outbox_service.DESTINATION_SUPPLIER, {
+            "supplier_id": supplier_id,
+            "summary_text": f"🔥 **Нове Замовлення!** <code>{child_uid}</code>\n"
+                            f"На суму (дроп): {drop_total} грн. Натисніть 'Підтвердити'.",
+            "order_txt_content": documents[order_documents.supplier_txt(child_uid)],
+            "order_filename": order_documents.supplier_filename(child_uid),
+            "child_order_uid": child_uid, # UID для кнопок
+        }, order_id=parent_order_id))
+
+    # 5.3. Сповіщення Адміну (в тест-канал)
+    messages.append(outbox_service.message(OUTBOX_ADMIN_NEW_ORDER, outbox_service.DESTINATION_ADMIN, {
+        "order_summary": documents[order_documents.ADMIN_SUMMARY],
+        "order_data_json": documents[order_documents.ADMIN_JSON],
+        "order_uid": parent_uid,
+    }, order_id=parent_order_id))
+
+    # 5.4. --- [ФАЗА 3.7] Постинг у "Live" гілку (Твій План 17.1) ---
+    messages.append(outbox_service.message(OUTBOX_LIVE_FEED, outbox_service.DESTINATION_CHANNEL, {
+        "pib": fsm_data.get("pib"),
+        "total_price": total_price,
+        "items_count": len(cart_items),
+    }, order_id=parent_order_id))
+
+    # 5.5. Копія замовлення на Google Drive
+    if gdrive_service.is_configured():
+        messages.append(outbox_service.message(OUTBOX_GDRIVE_UPLOAD, outbox_service.DESTINATION_GDRIVE, {
+            "order_uid": parent_uid,
+            "order_json": documents[order_documents.ADMIN_JSON],
+        }, order_id=parent_order_id))
+    return messages
+
+@outbox_service.handler(OUTBOX_CUSTOMER_NEW_ORDER)
+async def _send_customer_new_order(bot: Bot, payload: Dict[str, Any]):
+    await notification_service.notify_customer_of_new_order(bot=bot, **payload)
+
+@outbox_service.handler(OUTBOX_SUPPLIER_NEW_ORDER)
+async def _send_supplier_new_order(bot: Bot, payload: Dict[str, Any]):
+    payload = dict(payload)
+    async with AsyncSessionLocal() as db:
+        supplier = (await db.execute(
+            select(Supplier).where(Supplier.id == payload.pop("supplier_id")).options(selectinload(Supplier.user))
+        )).scalar_one_or_none()
+    if supplier is None:
+        logger.error(f"Outbox: постачальника для замовлення {payload['child_order_uid']} більше немає.")
+        return
+    await notification_service.notify_supplier_of_new_order(bot=bot, supplier=supplier, **payload)
+
+@outbox_service.handler(OUTBOX_ADMIN_NEW_ORDER)
+async def _send_admin_new_order(bot: Bot, payload: Dict[str, Any]):
+    await notification_service.notify_admin_of_new_order(bot=bot, **payload)
+
+@outbox_service.handler(OUTBOX_GDRIVE_UPLOAD)
+async def _upload_order_to_gdrive(bot: Bot, payload: Dict[str, Any]):
+    if not gdrive_service.is_configured():
+        # Поставлене до зміни конфігурації - повтори нічого не дадуть
+        logger.warning(f"Outbox: GDrive не налаштовано, замовлення {payload['order_uid']} не завантажено.")
+        return
+    if not await gdrive_service.upload_order_to_gdrive(payload["order_uid"], payload["order_json"]):
+        raise RuntimeError(f"GDrive: не вдалося завантажити замовлення {payload['order_uid']}") # Повторить outbox
+
+@outbox_service.handler(OUTBOX_LIVE_FEED)
+async def _send_live_feed(bot: Bot, payload: Dict[str, Any]):
+    await post_to_live_feed(
+        bot=bot,
+        fsm_data={"pib": payload["pib"] or "Клієнт"},
+        total_price=payload["total_price"],
+        items_count=payload["items_count"]
     )
-    # ---
-    
-    return True, parent_uid
 
 async def post_to_live_feed(bot: Bot, fsm_data: dict, total_price: int, items_count: int):
     # ... (код без змін, з `TavernaBot_8.rar`) ...
@@ -434,4 +391,5 @@ async def post_to_live_feed(bot: Bot, fsm_data: dict, total_price: int, items_co
             message_thread_id=live_topic_id
         )
     except Exception as e:
-        logger.error(f"Помилка постингу в 'Live' Feed: {e}", exc_info=True)
\ No newline at end of file
+        logger.error(f"Помилка постингу в 'Live' Feed: {e}")
+        raise # Повторить outbox
\ No newline at end of file
@@ -0,0 +1,126 @@
+# services/order_status_service.py
+import logging
+import asyncio
+from collections import OrderedDict
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.future import select
+from typing import Dict, List, Set
+
+from database.db import AsyncSessionLocal
+from database.models import Order, OrderItem, OrderStatus, OrderItemStatus
+from services import telegram_sender
+
+logger = logging.getLogger(__name__)
+
+# Статус замовлення в повідомленні клієнта (План 25, "інтерактивність").
+# Відповіді постачальників, що прийшли в межах вікна, зливаються в одне
+# редагування на ParentOrder; стан дітей - одним запитом.
+_DEBOUNCE_SECONDS = 3.0
+_LAST_TEXT_MAX_SIZE = 1000 # Скільки останніх відрендерених статусів пам'ятаємо (пропуск однакових edit)
+
+_pending: Dict[int, asyncio.Task] = {}
+_tasks: Set[asyncio.Task] = set()
+_last_text: "OrderedDict[int, str]" = OrderedDict()
+
+def schedule_customer_update(bot: Bot, parent_order_id: int) -> None:
+    """
+    Оновити повідомлення клієнта "незабаром". Якщо оновлення цього ParentOrder
+    вже чекає - нічого не робимо: воно прочитає свіжий стан з БД.
+    """
+    if parent_order_id in _pending: return
+    task = asyncio.get_running_loop().create_task(_debounced_update(bot, parent_order_id))
+    _pending[parent_order_id] = task
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+async def _debounced_update(bot: Bot, parent_order_id: int) -> None:
+    try:
+        await asyncio.sleep(_DEBOUNCE_SECONDS)
+    finally:
+        # Зміни після цього моменту заплануються наступним оновленням
+        _pending.pop(parent_order_id, None)
+    try:
+        await update_customer_message(bot, parent_order_id)
+    except Exception as e:
+        logger.error(f"Не вдалося оновити статус клієнту (ParentOrder {parent_order_id}): {e}", exc_info=True)
+
+async def _load_status_rows(parent_order_id: int) -> list:
+    """
+    Parent + всі Child одним запитом; для скасованих Child - перша скасована
+    позиція (LATERAL ... LIMIT 1 по індексу order_items.order_id).
+    """
+    cancelled_item = select(
+        OrderItem.product_name, OrderItem.cancel_reason
+    ).where(
+        (OrderItem.order_id == Order.id) &
+        (OrderItem.status == OrderItemStatus.cancelled_supplier)
+    ).order_by(OrderItem.id).limit(1).lateral("cancelled_item")
+    stmt = select(
+        Order.id, Order.parent_order_id, Order.order_uid, Order.status,
+        Order.user_telegram_id, Order.customer_message_id,
+        cancelled_item.c.product_name, cancelled_item.c.cancel_reason
+    ).outerjoin(
+        cancelled_item, Order.status == OrderStatus.cancelled
+    ).where(
+        (Order.id == parent_order_id) | (Order.parent_order_id == parent_order_id)
+    ).order_by(Order.id)
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(stmt)).all()
+
+def _render_status(order_uid: str, children: list) -> str:
+    total_children = len(children)
+    confirmed_count = 0
+    cancelled_lines: List[str] = []
+    for child in children:
+        if child.status == OrderStatus.confirmed:
+            confirmed_count += 1
+        elif child.status == OrderStatus.cancelled:
+            reason = child.cancel_reason or "Причина не вказана"
+            item_name = child.product_name or f"Товар з {child.order_uid}"
+            cancelled_lines.append(f"\n   - <b>{item_name}</b> (Скасовано: {reason})")
+    waiting = total_children - confirmed_count - len(cancelled_lines)
+
+    base_text = f"✅ Дякуємо! Ваше замовлення <code>{order_uid}</code> прийнято.\n"
+    status_text = f"\n--- СТАТУС ЗАМОВЛЕННЯ ---\n"
+    if waiting > 0:
+        status_text += f"⏳ Очікуємо відповіді від постачальників: {waiting}/{total_children}\n"
+    if confirmed_count > 0:
+        status_text += f"✅ Підтверджено до відправки: {confirmed_count} посилк(и)\n"
+    if cancelled_lines:
+        status_text += f"❌ Скасовано постачальниками: {''.join(cancelled_lines)}\n"
+    if waiting == 0:
+        status_text += "\n🏁 **Обробку завершено!** Очікуйте на ТТН."
+    return base_text + status_text
+
+async def update_customer_message(bot: Bot, parent_order_id: int) -> None:
+    """
+    Перечитує статуси всіх Child-замовлень і редагує головне повідомлення
+    клієнта (лише якщо текст змінився). Зазвичай викликається через
+    `schedule_customer_update`.
+    """
+    rows = await _load_status_rows(parent_order_id)
+    parent = next((row for row in rows if row.id == parent_order_id), None)
+    if parent is None or not parent.customer_message_id:
+        logger.warning(f"Не можу оновити статус клієнту: `customer_message_id` не збережено для ParentOrder {parent_order_id}.")
+        return
+
+    text = _render_status(parent.order_uid, [row for row in rows if row.parent_order_id == parent_order_id])
+    if _last_text.get(parent_order_id) == text: return
+    try:
+        with telegram_sender.lane(telegram_sender.LANE_CUSTOMER):
+            await bot.edit_message_text(
+                text=text,
+                chat_id=parent.user_telegram_id,
+                message_id=parent.customer_message_id,
+                parse_mode="HTML"
+            )
+    except TelegramBadRequest as e:
+        # Помилка може бути, якщо текст не змінився (напр. після рестарту), це нормально
+        if "message is not modified" not in str(e):
+            logger.warning(f"Не вдалося оновити повідомлення клієнта ({parent.customer_message_id}): {e}")
+            return
+    _last_text[parent_order_id] = text
+    _last_text.move_to_end(parent_order_id)
+    while len(_last_text) > _LAST_TEXT_MAX_SIZE:
+        _last_text.popitem(last=False)
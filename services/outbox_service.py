@@ -0,0 +1,242 @@
+# services/outbox_service.py
+import logging
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import insert, update, delete, func
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from database.db import AsyncSessionLocal
+from database.models import OutboxMessage, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+# Transactional outbox. Продюсер (create_order) пише рядки `outbox_messages`
+# у своїй транзакції; диспетчер у процесі бота забирає їх пачками
+# (FOR UPDATE SKIP LOCKED + "оренда" через next_attempt_at), виконує обробники
+# з обмеженням паралельності на кожен destination і повторює збої з backoff.
+# Доставки йдуть безперервно: звільнилось місце - забираємо ще, повільний
+# destination не тримає решту (його рядки просто не беремо, поки він зайнятий).
+# Доставка "at-least-once": після падіння посеред відправки повідомлення повториться.
+DESTINATION_CUSTOMER = "customer"
+DESTINATION_SUPPLIER = "supplier"
+DESTINATION_ADMIN = "admin"
+DESTINATION_CHANNEL = "channel"
+DESTINATION_GDRIVE = "gdrive"
+
+_CONCURRENCY = {
+    DESTINATION_CUSTOMER: 8,
+    DESTINATION_SUPPLIER: 4,
+    DESTINATION_ADMIN: 1,
+    DESTINATION_CHANNEL: 1,
+    DESTINATION_GDRIVE: 20, # gdrive_service сам збирає їх у пачки
+}
+_DEFAULT_CONCURRENCY = 2
+_QUEUE_PER_SLOT = 4 # Скільки доставок на destination може чекати на семафор (на 1 слот паралельності)
+_BATCH_SIZE = 50
+_MAX_IN_FLIGHT = 200 # Усього доставок у роботі (включно з тими, що чекають семафор)
+_MIN_CLAIM = 10 # Менше вільних місць - не смикаємо БД на кожне завершення
+_LEASE_SECONDS = 300 # Стільки рядок "наш"; процес упав - після оренди його візьме інший
+_IDLE_POLL_SECONDS = 1.0
+_MAX_ATTEMPTS = 8
+_BACKOFF_BASE_SECONDS = 5
+_BACKOFF_MAX_SECONDS = 3600
+_KEEP_SENT_DAYS = 7
+_PURGE_INTERVAL_SECONDS = 3600
+
+Handler = Callable[[Bot, Dict[str, Any]], Awaitable[None]]
+_handlers: Dict[str, Handler] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_wakeup = asyncio.Event()
+
+def handler(kind: str) -> Callable[[Handler], Handler]:
+    """Реєструє обробник повідомлень типу `kind`: async def (bot, payload)."""
+    def register(callback: Handler) -> Handler:
+        _handlers[kind] = callback
+        return callback
+    return register
+
+def message(kind: str, destination: str, payload: Dict[str, Any], order_id: Optional[int] = None) -> Dict[str, Any]:
+    """Рядок для `add_messages` (payload - лише JSON-сумісні значення)."""
+    return {
+        "kind": kind,
+        "destination": destination,
+        "payload": payload,
+        "order_id": order_id,
+        "status": OutboxStatus.pending,
+        "attempts": 0,
+    }
+
+async def add_messages(db: AsyncSession, messages: Iterable[Dict[str, Any]]) -> None:
+    """Пише повідомлення в поточній транзакції `db` (одним executemany)."""
+    messages = list(messages)
+    if messages:
+        await db.execute(insert(OutboxMessage), messages)
+
+def wake() -> None:
+    """Після commit: диспетчер цього процесу не чекає наступного опитування."""
+    _wakeup.set()
+
+# ---
+# Диспетчер
+# ---
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), _BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+async def _claim_batch(limit: int, busy_destinations: Iterable[str] = ()) -> list:
+    """
+    Забирає до `limit` готових повідомлень і "орендує" їх (attempts + 1, next_attempt_at = now + оренда).
+    Destination з `busy_destinations` пропускаються - їм вистачає вже взятої роботи.
+    """
+    conditions = (OutboxMessage.status == OutboxStatus.pending) & (OutboxMessage.next_attempt_at <= func.now())
+    busy_destinations = list(busy_destinations)
+    if busy_destinations:
+        conditions &= OutboxMessage.destination.not_in(busy_destinations)
+    claimable = select(OutboxMessage.id).where(
+        conditions
+    ).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(limit).with_for_update(skip_locked=True)
+    stmt = update(OutboxMessage).where(
+        OutboxMessage.id.in_(claimable.scalar_subquery())
+    ).values(
+        attempts=OutboxMessage.attempts + 1,
+        next_attempt_at=func.now() + timedelta(seconds=_LEASE_SECONDS)
+    ).returning(
+        OutboxMessage.id, OutboxMessage.kind, OutboxMessage.destination,
+        OutboxMessage.payload, OutboxMessage.attempts
+    )
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            return (await db.execute(stmt)).all()
+
+async def _deliver(bot: Bot, row) -> Dict[str, Any]:
+    """Виконує обробник; повертає зміни для рядка (id + нові status/next_attempt_at/...)."""
+    message_id, kind, destination, payload, attempts = row
+    now = datetime.now(timezone.utc)
+    handle = _handlers.get(kind)
+    if handle is None:
+        # Обробник ще не зареєстрований (напр. старий процес) - не губимо, відкладаємо
+        error = f"Немає обробника для '{kind}'"
+        delay = _backoff_seconds(attempts)
+    else:
+        semaphore = _semaphores.setdefault(destination, asyncio.Semaphore(_CONCURRENCY.get(destination, _DEFAULT_CONCURRENCY)))
+        try:
+            async with semaphore:
+                await handle(bot, payload)
+            return {"id": message_id, "status": OutboxStatus.sent, "processed_at": now, "last_error": None}
+        except TelegramRetryAfter as e:
+            error, delay = str(e), e.retry_after
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокований / чат не існує - повтор не допоможе
+            logger.warning(f"Outbox #{message_id} ({kind}): {e}. Не повторюю.")
+            return {"id": message_id, "status": OutboxStatus.failed, "processed_at": now, "last_error": str(e)}
+        except Exception as e:
+            logger.error(f"Outbox #{message_id} ({kind}): спроба {attempts} невдала: {e}", exc_info=True)
+            error, delay = str(e), _backoff_seconds(attempts)
+
+    if attempts >= _MAX_ATTEMPTS:
+        logger.error(f"Outbox #{message_id} ({kind}): вичерпано {_MAX_ATTEMPTS} спроб. Остання помилка: {error}")
+        return {"id": message_id, "status": OutboxStatus.failed, "processed_at": now, "last_error": error}
+    return {"id": message_id, "next_attempt_at": now + timedelta(seconds=delay), "last_error": error}
+
+async def _save_results(results: List[Dict[str, Any]]) -> None:
+    """Один bulk UPDATE за первинним ключем для всіх завершених доставок."""
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            await db.execute(update(OutboxMessage), results)
+    failed = sum(1 for result in results if result.get("status") != OutboxStatus.sent)
+    if failed:
+        logger.info(f"Outbox: завершено {len(results)}, не доставлено {failed}.")
+
+class _Dispatcher:
+    """Пул доставок: тримає до _MAX_IN_FLIGHT у роботі, результати зберігає пачками."""
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.in_flight: Set[asyncio.Task] = set()
+        self.per_destination: Dict[str, int] = defaultdict(int)
+        self.results: List[Dict[str, Any]] = []
+
+    def _busy_destinations(self) -> List[str]:
+        return [
+            destination for destination, count in self.per_destination.items()
+            if count >= _CONCURRENCY.get(destination, _DEFAULT_CONCURRENCY) * _QUEUE_PER_SLOT
+        ]
+
+    def _start(self, row) -> None:
+        destination = row[2]
+        self.per_destination[destination] += 1
+        task = asyncio.create_task(_deliver(self.bot, row))
+        self.in_flight.add(task)
+        task.add_done_callback(lambda done, destination=destination: self._on_done(done, destination))
+
+    def _on_done(self, task: asyncio.Task, destination: str) -> None:
+        self.in_flight.discard(task)
+        self.per_destination[destination] -= 1
+        if not self.per_destination[destination]:
+            del self.per_destination[destination]
+        if not task.cancelled() and task.exception() is None:
+            self.results.append(task.result())
+        # (Інакше рядок повернеться в роботу після закінчення оренди)
+        _wakeup.set()
+
+    async def claim(self) -> bool:
+        """Забирає нову роботу, якщо є місце. True - черга, ймовірно, ще не порожня."""
+        free = _MAX_IN_FLIGHT - len(self.in_flight)
+        if free < _MIN_CLAIM and self.in_flight:
+            return False
+        limit = min(free, _BATCH_SIZE)
+        rows = await _claim_batch(limit, self._busy_destinations())
+        for row in rows:
+            self._start(row)
+        return len(rows) == limit
+
+    async def flush(self) -> None:
+        if not self.results: return
+        results, self.results = self.results, []
+        try:
+            await _save_results(results)
+        except Exception:
+            self.results[:0] = results # Спробуємо в наступному циклі
+            raise
+
+async def _purge_sent() -> None:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=_KEEP_SENT_DAYS)
+    async with AsyncSessionLocal() as db:
+        async with db.begin():
+            result = await db.execute(
+                delete(OutboxMessage).where(
+                    (OutboxMessage.status == OutboxStatus.sent) & (OutboxMessage.processed_at < cutoff)
+                )
+            )
+    if result.rowcount:
+        logger.info(f"Outbox: видалено {result.rowcount} доставлених повідомлень старших за {_KEEP_SENT_DAYS} дн.")
+
+async def run_dispatcher(bot: Bot) -> None:
+    """Фоновий цикл диспетчера (запускається з bot.py)."""
+    logger.info("Outbox-диспетчер запущено.")
+    dispatcher = _Dispatcher(bot)
+    purged_at = 0.0
+    while True:
+        _wakeup.clear()
+        has_more = False
+        try:
+            has_more = await dispatcher.claim()
+            await dispatcher.flush()
+            if time.monotonic() - purged_at > _PURGE_INTERVAL_SECONDS:
+                await _purge_sent()
+                purged_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Outbox-диспетчер: помилка циклу: {e}", exc_info=True)
+        if not has_more:
+            # Черга спорожніла або пул зайнятий - чекаємо нових (wake()), завершення доставки чи опитування
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=_IDLE_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,382 @@
+# services/pricing_engine.py
+import logging
+import asyncio
+import time
+from bisect import bisect_right
+from decimal import Decimal, ROUND_UP, InvalidOperation
+import redis.asyncio as aioredis
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple, Iterable, Sequence
+from sqlalchemy import update, case, func, cast, and_, true, Integer, Numeric
+from sqlalchemy.future import select
+
+from config_reader import config
+from database.db import AsyncSessionLocal
+from services import catalog_events, catalog_snapshot
+from database.models import PriceRule, PriceRuleType, Product, ProductVariant
+
+logger = logging.getLogger(__name__)
+
+# Версія правил спільна для всіх процесів (web, бот, планувальник)
+_RULES_VERSION_KEY = "price_rules:version"
+_RULES_CHANNEL = "price_rules:changed"
+_LISTENER_RETRY_SECONDS = 5
+
+try:
+    redis_client = aioredis.from_url(
+        str(config.redis_url), 
+        encoding="utf-8", 
+        decode_responses=True
+    )
+except Exception as e:
+    logger.error(f"Не вдалося підключитися до Redis (версії правил націнок): {e}")
+    redis_client = None
+
+DEFAULT_MARKUP = Decimal('1.33') # +33%, якщо жодне правило не підійшло (План 23)
+_ENGINE_TTL = timedelta(minutes=1) # Лише якщо Redis недоступний (інакше - по версії)
+_REPRICE_CHUNK_SIZE = 20000 # Варіантів (по діапазону id) на одну транзакцію перерахунку
+
+_NEG_INF = float('-inf')
+_POS_INF = float('inf')
+
+class CompiledRule:
+    """Незмінний "знімок" PriceRule (без прив'язки до сесії SQLAlchemy)."""
+    __slots__ = ("id", "name", "position", "category_tag", "supplier_id",
+                 "min_price", "max_price", "rule_type", "value")
+
+    def __init__(self, rule: PriceRule, position: int):
+        self.id = rule.id
+        self.name = rule.name
+        self.position = position # Місце в порядку пріоритету (менше = важливіше)
+        self.category_tag = rule.category_tag
+        self.supplier_id = rule.supplier_id
+        self.min_price = rule.min_price
+        self.max_price = rule.max_price
+        self.rule_type = rule.rule_type
+        self.value = Decimal(str(rule.value))
+
+    def apply(self, base_price: Decimal) -> Decimal:
+        if self.rule_type == PriceRuleType.percentage:
+            return base_price * (Decimal('1.0') + self.value / Decimal('100.0'))
+        return base_price + self.value
+
+class _PriceBrackets:
+    """
+    Правила одного кошика (supplier_id, category_tag), розкладені на
+    неперетинні інтервали цін. Для кожного інтервалу переможець
+    (найвищий пріоритет) порахований заздалегідь, тож пошук = один bisect.
+
+    Межі - кортежі (ціна, 0) = "рівно ціна", (ціна, 1) = "одразу після ціни",
+    тому правило [min, max] (включно) = [(min, 0), (max, 1)).
+    """
+    __slots__ = ("bounds", "winners")
+
+    def __init__(self, rules: Sequence[CompiledRule]):
+        spans = []
+        for rule in rules:
+            start = (rule.min_price, 0) if rule.min_price is not None else (_NEG_INF, 0)
+            end = (rule.max_price, 1) if rule.max_price is not None else (_POS_INF, 1)
+            if start < end:
+                spans.append((start, end, rule))
+
+        self.bounds = sorted({point for start, end, _ in spans for point in (start, end)})
+        self.winners: List[Optional[CompiledRule]] = []
+        for i, left in enumerate(self.bounds):
+            right = self.bounds[i + 1] if i + 1 < len(self.bounds) else None
+            best = None
+            if right is not None:
+                for start, end, rule in spans:
+                    if start <= left and right <= end and (best is None or rule.position < best.position):
+                        best = rule
+            self.winners.append(best)
+
+    def find(self, base_price: Decimal) -> Optional[CompiledRule]:
+        i = bisect_right(self.bounds, (base_price, 0)) - 1
+        return self.winners[i] if i >= 0 else None
+
+class PricingEngine:
+    """
+    Скомпільований індекс правил націнки.
+
+    Правила розкладені по кошиках (supplier_id, category_tag), де None = "будь-який".
+    Для товару перевіряються лише 4 кошики (точний, лише постачальник,
+    лише категорія, загальний) - замість проходу по всьому списку правил.
+    Рушій незмінний: при зміні правил будується новий і підміняється цілком.
+    """
+    __slots__ = ("rules", "_buckets", "built_at", "version")
+
+    def __init__(self, rules: Sequence[PriceRule], version: int = 0):
+        compiled = [CompiledRule(rule, position) for position, rule in enumerate(rules)]
+        grouped: Dict[Tuple[Optional[int], Optional[str]], List[CompiledRule]] = {}
+        for rule in compiled:
+            grouped.setdefault((rule.supplier_id, rule.category_tag), []).append(rule)
+
+        self.rules: Tuple[CompiledRule, ...] = tuple(compiled)
+        self._buckets = {key: _PriceBrackets(bucket) for key, bucket in grouped.items()}
+        self.built_at = datetime.now(timezone.utc)
+        self.version = version # Версія правил (з Redis), з якої зібрано рушій
+
+    def find_rule(
+        self,
+        base_price: Decimal,
+        category_tag: Optional[str] = None,
+        supplier_id: Optional[int] = None
+    ) -> Optional[CompiledRule]:
+        """Правило з найвищим пріоритетом, що підходить під товар (або None)."""
+        best = None
+        for key in ((supplier_id, category_tag), (supplier_id, None), (None, category_tag), (None, None)):
+            brackets = self._buckets.get(key)
+            if brackets is None:
+                continue
+            rule = brackets.find(base_price)
+            if rule is not None and (best is None or rule.position < best.position):
+                best = rule
+        return best
+
+    def price(
+        self,
+        base_price: Decimal,
+        category_tag: Optional[str] = None,
+        supplier_id: Optional[int] = None
+    ) -> int:
+        """Фінальна (округлена) ціна для вже розпарсеної дроп-ціни."""
+        if base_price <= 0: return 0
+        rule = self.find_rule(base_price, category_tag, supplier_id)
+        final_price = rule.apply(base_price) if rule else base_price * DEFAULT_MARKUP
+        return aggressive_rounding(final_price)
+
+    def price_from_str(
+        self,
+        base_price_str: Optional[str],
+        category_tag: Optional[str] = None,
+        supplier_id: Optional[int] = None
+    ) -> int:
+        """Те саме, але приймає "сиру" ціну з фіду. Некоректна ціна = 0."""
+        base_price = parse_price(base_price_str)
+        if base_price is None: return 0
+        return self.price(base_price, category_tag, supplier_id)
+
+    def price_batch(
+        self,
+        items: Iterable[Tuple[Optional[str], Optional[str], Optional[int]]]
+    ) -> List[int]:
+        """Ціни для батчу (base_price_str, category_tag, supplier_id) одним викликом."""
+        price_from_str = self.price_from_str
+        return [price_from_str(price, category_tag, supplier_id) for price, category_tag, supplier_id in items]
+
+    def sql_final_price(self, base_price, category_tag, supplier_id):
+        """
+        Та сама логіка у вигляді SQL-виразу (CASE по правилах у порядку пріоритету
+        + агресивне округлення), для set-based перерахунку цін у БД.
+        """
+        whens = []
+        for rule in self.rules:
+            conditions = []
+            if rule.min_price is not None: conditions.append(base_price >= rule.min_price)
+            if rule.max_price is not None: conditions.append(base_price <= rule.max_price)
+            if rule.category_tag is not None: conditions.append(category_tag == rule.category_tag)
+            if rule.supplier_id is not None: conditions.append(supplier_id == rule.supplier_id)
+            if rule.rule_type == PriceRuleType.percentage:
+                marked_up = base_price * (Decimal('1.0') + rule.value / Decimal('100.0'))
+            else:
+                marked_up = base_price + rule.value
+            whens.append((and_(true(), *conditions), marked_up))
+
+        default_price = base_price * DEFAULT_MARKUP
+        raw_price = case(*whens, else_=default_price) if whens else default_price
+        price_int = func.ceil(raw_price)
+        rounded = case(
+            (price_int < 100, func.ceil(price_int / 5) * 5),
+            else_=func.ceil(price_int / 10) * 10
+        )
+        return cast(case((base_price <= 0, 0), else_=rounded), Integer)
+
+def parse_price(base_price_str: Optional[str]) -> Optional[Decimal]:
+    """'1 299,50' -> Decimal('1299.50'). None, якщо ціни немає або вона бита."""
+    if base_price_str is None: return None
+    try:
+        cleaned_price_str = base_price_str.strip().replace(' ', '').replace(',', '.')
+        if not cleaned_price_str: return None
+        return Decimal(cleaned_price_str)
+    except (InvalidOperation, ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"Помилка розрахунку ціни для '{base_price_str}': {e}")
+        return None
+
+def aggressive_rounding(price: Decimal) -> int:
+    """Вгору до цілого, далі до кратного 5 (до 100 грн) або 10."""
+    try:
+        price_int = int(price.to_integral_value(rounding=ROUND_UP))
+        if price_int < 100:
+            remainder = price_int % 5
+            return price_int + (5 - remainder) if remainder != 0 else price_int
+        remainder = price_int % 10
+        if remainder == 0: return price_int
+        return price_int + (10 - remainder)
+    except Exception:
+        logger.error(f"Помилка агресивного округлення для ціни {price}", exc_info=True)
+        return 0
+
+# ---
+# Глобальний рушій (атомарна підміна + версія через Redis pub/sub)
+# ---
+_engine: Optional[PricingEngine] = None
+_rebuild_lock = asyncio.Lock()
+_listener_task: Optional[asyncio.Task] = None
+_listener_ready = False # True, поки ми підписані на зміни (тоді TTL не потрібен)
+
+async def _get_rules_version() -> int:
+    if not redis_client: return 0
+    try:
+        return int(await redis_client.get(_RULES_VERSION_KEY) or 0)
+    except Exception as e:
+        logger.warning(f"Не вдалося прочитати версію правил націнок з Redis: {e}")
+        return 0
+
+async def rebuild_engine() -> PricingEngine:
+    """
+    Перечитує активні правила з БД і атомарно підміняє рушій.
+    Після зміни PriceRule викликайте `publish_rules_changed` (перебудує всі процеси).
+    """
+    global _engine
+    async with _rebuild_lock:
+        # Версію читаємо ДО правил: якщо її піднімуть під час запиту,
+        # ми отримаємо ще одне повідомлення і перебудуємось ще раз.
+        version = await _get_rules_version()
+        async with AsyncSessionLocal() as db:
+            stmt = select(PriceRule).where(
+                PriceRule.is_active == True
+            ).order_by(PriceRule.priority.asc().nullslast(), PriceRule.id.asc())
+            rules = (await db.execute(stmt)).scalars().all()
+
+        engine = PricingEngine(rules, version=version)
+        _engine = engine # Одне присвоєння - читачі бачать або старий, або новий рушій
+
+    if not rules:
+        logger.warning("Не знайдено ЖОДНОГО 'PriceRule'. Буде використано націнку +33% за замовчуванням.")
+    logger.info(f"Рушій націнок перебудовано: {len(engine.rules)} правил (версія {version}).")
+    return engine
+
+async def _rebuild_if_stale(version: int):
+    engine = _engine
+    if engine is None or engine.version != version:
+        await rebuild_engine()
+
+async def _listen_for_rule_changes():
+    """Фонова задача процесу: перебудовує рушій, коли хтось піднімає версію правил."""
+    global _listener_ready
+    while True:
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(_RULES_CHANNEL)
+            # Поки ми не були підписані, повідомлення могли загубитись
+            await _rebuild_if_stale(await _get_rules_version())
+            _listener_ready = True
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    await _rebuild_if_stale(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Підписка на зміни правил націнок обірвалась: {e}. Повтор через {_LISTENER_RETRY_SECONDS}с.")
+        finally:
+            _listener_ready = False
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+        await asyncio.sleep(_LISTENER_RETRY_SECONDS)
+
+def _ensure_listener():
+    global _listener_task
+    if redis_client and (_listener_task is None or _listener_task.done()):
+        _listener_task = asyncio.create_task(_listen_for_rule_changes())
+
+async def publish_rules_changed() -> PricingEngine:
+    """
+    Викликати після будь-якої зміни PriceRule (адмінка).
+    Піднімає версію в Redis, сповіщає всі процеси і перебудовує локальний рушій.
+    """
+    if redis_client:
+        try:
+            version = await redis_client.incr(_RULES_VERSION_KEY)
+            await redis_client.publish(_RULES_CHANNEL, version)
+        except Exception as e:
+            logger.error(f"Не вдалося опублікувати нову версію правил націнок: {e}")
+    return await rebuild_engine()
+
+async def get_engine() -> PricingEngine:
+    """
+    Поточний рушій. Без запитів до БД: перебудовується лише при зміні версії
+    (через pub/sub), або за TTL, якщо підписка на Redis зараз не працює.
+    """
+    _ensure_listener()
+    engine = _engine
+    if engine is None or (
+        not _listener_ready and datetime.now(timezone.utc) - engine.built_at >= _ENGINE_TTL
+    ):
+        engine = await rebuild_engine()
+    return engine
+
+# ---
+# Перерахунок цін у БД після зміни правил
+# ---
+def _reprice_stmt(engine: PricingEngine, *conditions):
+    """UPDATE final_price за правилами `engine` для варіантів під `conditions` (лише там, де ціна інша)."""
+    base_price = cast(ProductVariant.base_price, Numeric)
+    new_price = engine.sql_final_price(base_price, Product.category_tag, Product.supplier_id)
+    repriced = select(
+        ProductVariant.id.label("variant_id"), new_price.label("new_price")
+    ).join(Product, ProductVariant.product_id == Product.id).where(*conditions).subquery()
+    return update(ProductVariant).where(
+        ProductVariant.id == repriced.c.variant_id,
+        ProductVariant.final_price.is_distinct_from(repriced.c.new_price)
+    ).values(
+        final_price=repriced.c.new_price, last_updated=func.now()
+    ).returning(ProductVariant.product_id).execution_options(synchronize_session=False)
+
+async def reprice_products(session: AsyncSessionLocal, engine: PricingEngine, product_ids: Iterable[int]) -> int:
+    """
+    Перераховує ціни варіантів цих товарів у транзакції `session` (без commit).
+    Для імпорту: правила змінились, поки він писав ціни за старим рушієм.
+    Повертає к-сть змінених варіантів.
+    """
+    ids = sorted(product_ids)
+    updated = 0
+    for i in range(0, len(ids), _REPRICE_CHUNK_SIZE):
+        stmt = _reprice_stmt(engine, ProductVariant.product_id.in_(ids[i:i + _REPRICE_CHUNK_SIZE]))
+        updated += len((await session.execute(stmt)).all())
+    return updated
+
+async def reprice_variants(engine: Optional[PricingEngine] = None) -> Dict[str, Any]:
+    """
+    Перераховує `ProductVariant.final_price` з `base_price` для всього каталогу
+    set-based UPDATE'ами (по діапазонах id), без завантаження рядків у Python.
+    Змінюються лише рядки, де ціна справді інша.
+    
+    Повертає {"updated": <к-сть рядків>, "duration_ms": <час>}.
+    """
+    engine = engine or await get_engine()
+    started = time.perf_counter()
+
+    updated = 0
+    async with AsyncSessionLocal() as db:
+        min_id, max_id = (await db.execute(
+            select(func.min(ProductVariant.id), func.max(ProductVariant.id))
+        )).one()
+        if min_id is not None:
+            for chunk_start in range(min_id, max_id + 1, _REPRICE_CHUNK_SIZE):
+                stmt = _reprice_stmt(
+                    engine,
+                    ProductVariant.id >= chunk_start,
+                    ProductVariant.id < chunk_start + _REPRICE_CHUNK_SIZE
+                )
+                product_ids = (await db.execute(stmt)).scalars().all()
+                await db.commit() # Короткі транзакції - не тримаємо блокування на весь каталог
+                updated += len(product_ids)
+                await catalog_events.publish_products_changed(product_ids)
+    if updated:
+        await catalog_snapshot.rebuild_snapshot_safe() # Мін. ціни у знімку каталогу
+
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    logger.info(f"Перерахунок цін завершено: змінено {updated} варіантів за {duration_ms} мс ({len(engine.rules)} правил).")
+    return {"updated": updated, "duration_ms": duration_ms}
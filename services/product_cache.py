@@ -0,0 +1,268 @@
+# services/product_cache.py
+import logging
+import asyncio
+import json
+import time
+import redis.asyncio as aioredis
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple, Iterable
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from config_reader import config
+from database.db import AsyncSessionLocal
+from database.models import Product, ProductOption, ProductVariant
+from api_models import ProductAPI
+from services import catalog_events, product_lookup
+from services.search_normalizer import normalize_sku_key
+
+logger = logging.getLogger(__name__)
+
+# Read-through кеш картки товару (відповідь ProductAPI) для get_product_by_sku.
+#   L1: LRU у процесі  (product_id -> payload), без мережі взагалі;
+#   L2: Redis          product_card:{id} -> JSON, product_card:sku:{sku} -> id.
+# Інвалідація - лише змінених товарів (catalog_events), а не всього кешу.
+# Кожна інвалідація піднімає product_card:generation; картка, прочитана з БД
+# до інвалідації, у кеш уже не пишеться (інакше жила б застаріла до TTL).
+_CARD_KEY = "product_card:{}"
+_SKU_KEY = "product_card:sku:{}"
+_GENERATION_KEY = "product_card:generation"
+_CARD_TTL_SECONDS = 3600 # Страховка, якщо подію зміни загубили
+_SKU_TTL_SECONDS = 86400 # SKU -> id майже не змінюється
+_LOCAL_MAX_SIZE = 2000
+_LOCAL_TTL_SECONDS = 60 # Без слухача (Redis впав) - стільки максимум бачимо застарілі дані
+
+try:
+    redis_client = aioredis.from_url(
+        str(config.redis_url),
+        encoding="utf-8",
+        decode_responses=True
+    )
+except Exception as e:
+    logger.error(f"Не вдалося підключитися до Redis (кеш карток товарів): {e}")
+    redis_client = None
+
+# KEYS: generation, картка, sku -> id; ARGV: очікувана generation, JSON, TTL картки, id, TTL sku
+_LUA_PUT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[5])
+return 1
+"""
+
+if redis_client:
+    _put_script = redis_client.register_script(_LUA_PUT)
+
+class _LocalCache:
+    """
+    LRU з TTL: product_id -> (sku, payload, expires_at) + індекс sku -> product_id.
+    `generation` росте з кожною інвалідацією: put з даними, прочитаними раніше, ігнорується.
+    """
+    __slots__ = ("_items", "_ids_by_sku", "generation")
+
+    def __init__(self):
+        self._items: "OrderedDict[int, Tuple[str, Dict[str, Any], float]]" = OrderedDict()
+        self._ids_by_sku: Dict[str, int] = {}
+        self.generation = 0
+
+    def get(self, sku: str) -> Optional[Dict[str, Any]]:
+        product_id = self._ids_by_sku.get(sku)
+        if product_id is None: return None
+        return self.get_by_id(product_id)
+
+    def get_by_id(self, product_id: int) -> Optional[Dict[str, Any]]:
+        item = self._items.get(product_id)
+        if item is None or item[2] < time.monotonic():
+            self._drop(product_id)
+            return None
+        self._items.move_to_end(product_id)
+        return item[1]
+
+    def put(self, sku: str, payload: Dict[str, Any], generation: int) -> None:
+        if generation != self.generation: return # Поки читали, була інвалідація - дані могли застаріти
+        product_id = payload["id"]
+        self._drop(product_id)
+        self._items[product_id] = (sku, payload, time.monotonic() + _LOCAL_TTL_SECONDS)
+        self._ids_by_sku[sku] = product_id
+        while len(self._items) > _LOCAL_MAX_SIZE:
+            self._drop(next(iter(self._items)))
+
+    def discard(self, *product_ids: int) -> None:
+        """Інвалідація (дані в БД змінились)."""
+        self.generation += 1
+        self._drop(*product_ids)
+
+    def _drop(self, *product_ids: int) -> None:
+        for product_id in product_ids:
+            item = self._items.pop(product_id, None)
+            if item is not None and self._ids_by_sku.get(item[0]) == product_id:
+                del self._ids_by_sku[item[0]]
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._items.clear()
+        self._ids_by_sku.clear()
+
+_local = _LocalCache()
+_listener_task: Optional[asyncio.Task] = None
+
+def _cache_sku(sku: str) -> str:
+    # Той самий ключ, що й пошук у БД (Product.sku_norm)
+    return normalize_sku_key(sku)
+
+# ---
+# Читання
+# ---
+def _card_load_options():
+    return (
+        selectinload(Product.options).selectinload(ProductOption.values),
+        selectinload(Product.variants).selectinload(ProductVariant.option_values)
+    )
+
+async def _load_from_db(sku: str) -> Optional[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        product_id = await product_lookup.find_product_id_by_sku(session, sku)
+        if product_id is None: return None
+        product = (await session.execute(
+            select(Product).where(Product.id == product_id).options(*_card_load_options())
+        )).scalar_one_or_none()
+        if product is None: return None
+        return ProductAPI.model_validate(product).model_dump(mode="json")
+
+async def _get_from_redis(sku: str) -> Optional[Dict[str, Any]]:
+    if not redis_client: return None
+    try:
+        product_id = await redis_client.get(_SKU_KEY.format(sku))
+        if product_id is None: return None
+        raw = await redis_client.get(_CARD_KEY.format(product_id))
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        logger.warning(f"Кеш карток: помилка читання з Redis ({sku}): {e}")
+        return None
+
+async def _get_generation() -> Optional[str]:
+    """Читати ДО запиту в БД; None - Redis недоступний (тоді й не пишемо)."""
+    if not redis_client: return None
+    try:
+        return await redis_client.get(_GENERATION_KEY) or "0"
+    except Exception as e:
+        logger.warning(f"Кеш карток: помилка читання generation з Redis: {e}")
+        return None
+
+async def _put_to_redis(sku: str, payload: Dict[str, Any], generation: Optional[str]) -> None:
+    """Запис, лише якщо з читання `generation` інвалідацій не було."""
+    if not redis_client or generation is None: return
+    try:
+        await _put_script(
+            keys=[_GENERATION_KEY, _CARD_KEY.format(payload["id"]), _SKU_KEY.format(sku)],
+            args=[generation, json.dumps(payload, ensure_ascii=False), _CARD_TTL_SECONDS, payload["id"], _SKU_TTL_SECONDS]
+        )
+    except Exception as e:
+        logger.warning(f"Кеш карток: помилка запису в Redis ({sku}): {e}")
+
+async def get_product_card(sku: str) -> Optional[ProductAPI]:
+    """
+    Картка товару за SKU: LRU процесу -> Redis -> БД (з записом в обидва кеші).
+    Гарячі товари не роблять жодного запиту до БД.
+    """
+    sku = _cache_sku(sku)
+    if not sku: return None
+    start_product_cache()
+
+    local_generation = _local.generation
+    payload = _local.get(sku)
+    if payload is None:
+        payload = await _get_from_redis(sku)
+        if payload is None:
+            generation = await _get_generation()
+            payload = await _load_from_db(sku)
+            if payload is None: return None
+            await _put_to_redis(sku, payload, generation)
+        _local.put(sku, payload, local_generation)
+    return ProductAPI.model_validate(payload)
+
+async def get_product_cards(product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Картки кількох товарів за id (напр. для кошика): {product_id: payload ProductAPI}.
+    LRU -> один MGET у Redis -> один запит у БД на всі промахи.
+    """
+    start_product_cache()
+    local_generation = _local.generation
+    result = {}
+    missing = []
+    for product_id in dict.fromkeys(product_ids):
+        payload = _local.get_by_id(product_id)
+        if payload is None:
+            missing.append(product_id)
+        else:
+            result[product_id] = payload
+    if not missing: return result
+
+    generation = None
+    if redis_client:
+        try:
+            *raw_cards, generation = await redis_client.mget(
+                [_CARD_KEY.format(product_id) for product_id in missing] + [_GENERATION_KEY]
+            )
+            generation = generation or "0"
+            for raw in raw_cards:
+                if raw:
+                    payload = json.loads(raw)
+                    result[payload["id"]] = payload
+                    _local.put(normalize_sku_key(payload["sku"]), payload, local_generation)
+        except Exception as e:
+            logger.warning(f"Кеш карток: помилка MGET з Redis ({len(missing)} товарів): {e}")
+            generation = None
+        missing = [product_id for product_id in missing if product_id not in result]
+    if not missing: return result
+
+    async with AsyncSessionLocal() as session:
+        products = (await session.execute(
+            select(Product).where(Product.id.in_(missing)).options(*_card_load_options())
+        )).scalars().all()
+        payloads = [ProductAPI.model_validate(product).model_dump(mode="json") for product in products]
+    for payload in payloads:
+        sku = normalize_sku_key(payload["sku"])
+        await _put_to_redis(sku, payload, generation)
+        _local.put(sku, payload, local_generation)
+        result[payload["id"]] = payload
+    return result
+
+# ---
+# Інвалідація
+# ---
+async def invalidate_products(product_ids: Set[int]) -> None:
+    """Прибирає картки цих товарів з LRU процесу та з Redis (SKU -> id лишаємо)."""
+    if not product_ids: return
+    _local.discard(*product_ids)
+    if not redis_client: return
+    try:
+        ids = sorted(product_ids)
+        for i in range(0, len(ids), 1000):
+            # Разом (MULTI): read-through, що читав БД до цієї зміни, вже не запише старе
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.incr(_GENERATION_KEY)
+                pipe.delete(*(_CARD_KEY.format(product_id) for product_id in ids[i:i + 1000]))
+                await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Кеш карток: не вдалося інвалідувати {len(product_ids)} товарів у Redis: {e}")
+
+async def _on_subscribed() -> None:
+    # Поки не були підписані, могли пропустити зміни - L1 скидаємо (Redis живе за TTL)
+    _local.clear()
+
+async def _run() -> None:
+    await catalog_events.listen_products_changed(invalidate_products, on_subscribed=_on_subscribed)
+
+def start_product_cache() -> None:
+    """
+    Підписка на зміни каталогу (один раз на процес). Викликається на старті
+    бота/web і ліниво з get_product_card.
+    """
+    global _listener_task
+    if not redis_client: return # Без Redis лише TTL локального кешу
+    if _listener_task is None or _listener_task.done():
+        try:
+            _listener_task = asyncio.get_running_loop().create_task(_run())
+        except RuntimeError:
+            pass
@@ -0,0 +1,26 @@
+# services/product_lookup.py
+from typing import Optional
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import Product
+from services.search_normalizer import normalize_sku_key
+
+async def find_product_id_by_sku(
+    session: AsyncSession,
+    sku: Optional[str],
+    supplier_id: Optional[int] = None
+) -> Optional[int]:
+    """
+    Єдина точка пошуку товару за артикулом: рівність по `sku_norm`
+    (index-only scan по uq_products_supplier_sku_norm / ix_products_sku_norm).
+
+    Без `supplier_id` один SKU може бути в кількох постачальників -
+    повертаємо найстарішу картку.
+    """
+    key = normalize_sku_key(sku)
+    if not key: return None
+    stmt = select(Product.id).where(Product.sku_norm == key)
+    if supplier_id is not None:
+        stmt = stmt.where(Product.supplier_id == supplier_id)
+    return (await session.execute(stmt.order_by(Product.id).limit(1))).scalar_one_or_none()
@@ -11,6 +11,7 @@ from sqlalchemy.orm import selectinload
 from config_reader import config
 from services import publisher_service
 from services import ai_agent_service # <-- НОВИЙ "МОЗОК"
+from services import catalog_service
 from database.db import AsyncSessionLocal
 from database.models import Supplier, Product, ProductVariant, SupplierStatus
 
@@ -124,6 +125,16 @@ async def check_new_suppliers_job(bot: Bot):
                 )
                 await db.commit()
 
+# ---
+# ЗАДАЧА 3: AI-атрибути для фільтрів каталогу
+# ---
+async def enrich_product_attributes_job():
+    """Потроху збагачує товари атрибутами від Gemini (Бренд, Матеріал...)."""
+    try:
+        await catalog_service.enrich_attributes_batch()
+    except Exception as e:
+        logger.error(f"Помилка AI-збагачення атрибутів (Job): {e}", exc_info=True)
+
 async def start_scheduler(bot: Bot):
     """Запускає обидва планувальники."""
     
@@ -151,6 +162,16 @@ async def start_scheduler(bot: Bot):
         misfire_grace_time=60
     )
     
+    # --- ЗАДАЧА 3 (Фільтри каталогу) ---
+    _scheduler.add_job(
+        enrich_product_attributes_job,
+        'interval',
+        minutes=10,
+        id="ai_product_attributes_job",
+        max_instances=1,
+        misfire_grace_time=120
+    )
+    
     try:
         if not _scheduler.running:
             _scheduler.start()
@@ -0,0 +1,275 @@
+# services/search_index.py
+import logging
+import asyncio
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Iterable, Set
+from sqlalchemy import exists
+from sqlalchemy.future import select
+
+from database.db import AsyncSessionLocal
+from database.models import Product, ProductVariant
+from services import catalog_events
+from services.search_service import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, CURSOR_INDEX, encode_cursor, decode_cursor
+)
+from services.search_normalizer import search_tokens, normalize_sku, build_product_search_text
+
+logger = logging.getLogger(__name__)
+
+_LOAD_BATCH_SIZE = 1000 # Товарів на один запит при (пере)побудові
+_COMPACT_MIN_DEAD = 1000 # Компактимо, коли "мертвих" слотів більше за це...
+_COMPACT_DEAD_RATIO = 0.3 # ...і вони становлять таку частку індексу
+_PREFIX_CACHE_MAX_SIZE = 5000
+
+# Бали релевантності
+_SCORE_SKU_EXACT = 100
+_SCORE_NAME_EXACT = 3
+_SCORE_EXACT = 2
+_SCORE_PREFIX = 1
+
+class _Doc:
+    """
+    Один товар в індексі - лише те, що потрібно для відбору й ранжування.
+    Картки для відповіді API дає `product_cache.get_product_cards`.
+    """
+    __slots__ = ("product_id", "sku_norm", "name_tokens", "tokens", "category_tag", "is_available")
+
+    def __init__(self, product_id: int, name: str, sku: str, category_tag: Optional[str], is_available: bool):
+        self.product_id = product_id
+        self.sku_norm = normalize_sku(sku)
+        self.name_tokens = frozenset(search_tokens(name))
+        self.tokens = tuple(dict.fromkeys(build_product_search_text(name, sku).split()))
+        self.category_tag = category_tag
+        self.is_available = bool(is_available)
+
+def _intersect(small: array, large: array) -> array:
+    """Перетин двох відсортованих масивів слотів (bisect по більшому)."""
+    result = array('I')
+    lo = 0
+    for slot in small:
+        lo = bisect_left(large, slot, lo)
+        if lo == len(large): break
+        if large[lo] == slot:
+            result.append(slot)
+    return result
+
+class SearchIndex:
+    """
+    In-memory інвертований індекс каталогу (назва + SKU).
+
+    - постинги: {токен: array('I') слотів} (слоти ростуть - масиви завжди відсортовані);
+    - відсортований словник токенів: префіксний пошук (автодоповнення) через bisect;
+    - кеш префіксів (LRU): відсортований array('I') живих слотів на префікс;
+    - категорія/наявність перевіряються на кандидатах після перетину.
+
+    Оновлення товару = "надгробок" на старому слоті + новий слот у кінці.
+    Коли надгробків багато - індекс компактиться (без походу в БД).
+    """
+    __slots__ = ("_docs", "_slot_by_product", "_postings", "_terms", "_dead", "_prefix_cache")
+
+    def __init__(self):
+        self._docs: List[Optional[_Doc]] = []
+        self._slot_by_product: Dict[int, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._terms: List[str] = []
+        self._dead = 0
+        self._prefix_cache: "OrderedDict[str, array]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._slot_by_product)
+
+    # --- Запис ---
+    def _add(self, doc: _Doc) -> None:
+        slot = len(self._docs)
+        self._docs.append(doc)
+        self._slot_by_product[doc.product_id] = slot
+        for token in doc.tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = array('I')
+                insort(self._terms, token)
+            posting.append(slot)
+
+    def _remove(self, product_id: int) -> None:
+        slot = self._slot_by_product.pop(product_id, None)
+        if slot is None: return
+        self._docs[slot] = None # Постинги й кеш не чистимо - слот просто "мертвий"
+        self._dead += 1
+
+    def _invalidate_prefixes(self, tokens: Iterable[str]) -> None:
+        """Новий слот потрапляє лише в префікси своїх токенів - інші записи кешу лишаються."""
+        cache = self._prefix_cache
+        if not cache: return
+        for token in tokens:
+            for end in range(1, len(token) + 1):
+                cache.pop(token[:end], None)
+
+    def upsert(self, docs: Iterable[_Doc], removed_ids: Iterable[int] = ()) -> None:
+        for product_id in removed_ids:
+            self._remove(product_id)
+        for doc in docs:
+            self._remove(doc.product_id)
+            self._add(doc)
+            self._invalidate_prefixes(doc.tokens)
+        if self._dead > _COMPACT_MIN_DEAD and self._dead > len(self._docs) * _COMPACT_DEAD_RATIO:
+            self._compact()
+
+    def _compact(self) -> None:
+        docs = [doc for doc in self._docs if doc is not None]
+        started = time.perf_counter()
+        SearchIndex.__init__(self) # Слоти перенумеровуються - кеш префіксів теж скидається
+        for doc in docs:
+            self._add(doc)
+        logger.info(f"Пошуковий індекс ущільнено: {len(docs)} товарів за {(time.perf_counter() - started) * 1000:.0f} мс.")
+
+    # --- Пошук ---
+    def _prefix_slots(self, prefix: str) -> array:
+        """Відсортовані слоти документів, що мають токен з цим префіксом (з кешем)."""
+        cache = self._prefix_cache
+        slots = cache.get(prefix)
+        if slots is not None:
+            cache.move_to_end(prefix)
+            return slots
+        terms = self._terms
+        i = bisect_left(terms, prefix)
+        matched = []
+        while i < len(terms) and terms[i].startswith(prefix):
+            matched.append(self._postings[terms[i]])
+            i += 1
+        docs = self._docs
+        if len(matched) == 1:
+            slots = array('I', (slot for slot in matched[0] if docs[slot] is not None))
+        else:
+            slots = array('I', sorted({slot for posting in matched for slot in posting if docs[slot] is not None}))
+        cache[prefix] = slots
+        if len(cache) > _PREFIX_CACHE_MAX_SIZE:
+            cache.popitem(last=False)
+        return slots
+
+    def _score(self, doc: _Doc, query_tokens: List[str], query_sku: str) -> int:
+        score = _SCORE_SKU_EXACT if query_sku and doc.sku_norm == query_sku else 0
+        doc_tokens = doc.tokens
+        for token in query_tokens:
+            if token in doc.name_tokens: score += _SCORE_NAME_EXACT
+            elif token in doc_tokens: score += _SCORE_EXACT
+            else: score += _SCORE_PREFIX
+        return score
+
+    def search(
+        self,
+        query: str,
+        category_tag: Optional[str] = None,
+        only_available: bool = False,
+        limit: int = DEFAULT_PAGE_SIZE,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[int], Optional[str]]:
+        """
+        Усі токени запиту мають збігтися (як префікси).
+        Повертає (id товарів сторінки, курсор наступної сторінки або None).
+        Курсор - формат `search_service` з позначкою CURSOR_INDEX.
+        """
+        query_tokens = search_tokens(query)
+        if not query_tokens: return [], None
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        after = decode_cursor(cursor, backend=CURSOR_INDEX) if cursor else None
+
+        # Перетин - від найкоротшого списку
+        candidates = None
+        for slots in sorted((self._prefix_slots(token) for token in query_tokens), key=len):
+            candidates = slots if candidates is None else _intersect(candidates, slots)
+            if not candidates: return [], None
+
+        query_sku = normalize_sku(query)
+        ranked = []
+        for slot in candidates:
+            doc = self._docs[slot]
+            if doc is None: continue # Видалено після того, як префікс потрапив у кеш
+            if category_tag and doc.category_tag != category_tag: continue
+            if only_available and not doc.is_available: continue
+            key = (self._score(doc, query_tokens, query_sku), doc.product_id)
+            if after is None or key < after:
+                ranked.append(key)
+        ranked.sort(reverse=True)
+
+        page = ranked[:limit]
+        next_cursor = None
+        if len(ranked) > limit:
+            score, product_id = page[-1]
+            next_cursor = encode_cursor(Decimal(score), product_id, backend=CURSOR_INDEX)
+        return [product_id for _, product_id in page], next_cursor
+
+# ---
+# Глобальний індекс процесу (для web_app)
+# ---
+_index: Optional[SearchIndex] = None
+_refresh_lock = asyncio.Lock()
+_listener_task: Optional[asyncio.Task] = None
+
+def get_index() -> Optional[SearchIndex]:
+    """Готовий індекс або None (ще будується / не запущено) - тоді шукаємо в БД."""
+    return _index
+
+def _doc_columns():
+    """Лише поля для ранжування/фільтрів - без опцій і варіантів."""
+    is_available = exists().where(
+        (ProductVariant.product_id == Product.id) & (ProductVariant.is_available == True)
+    )
+    return (Product.id, Product.name, Product.sku, Product.category_tag, is_available.label("is_available"))
+
+async def rebuild_index() -> SearchIndex:
+    """Повна побудова з БД (батчами по id) і атомарна підміна."""
+    global _index
+    started = time.perf_counter()
+    async with _refresh_lock:
+        index = SearchIndex()
+        last_id = 0
+        async with AsyncSessionLocal() as session:
+            while True:
+                rows = (await session.execute(
+                    select(*_doc_columns()).where(Product.id > last_id)
+                    .order_by(Product.id).limit(_LOAD_BATCH_SIZE)
+                )).all()
+                if not rows: break
+                index.upsert(_Doc(*row) for row in rows)
+                last_id = rows[-1].id
+        _index = index
+    logger.info(f"Пошуковий індекс побудовано: {len(index)} товарів за {time.perf_counter() - started:.1f} с.")
+    return index
+
+async def refresh_products(product_ids: Set[int]) -> None:
+    """Інкрементальне оновлення: перечитує з БД лише ці товари."""
+    if not product_ids: return
+    async with _refresh_lock:
+        index = _index # Під lock: rebuild_index міг щойно підмінити індекс
+        if index is None: return
+        docs = []
+        ids = sorted(product_ids)
+        async with AsyncSessionLocal() as session:
+            for i in range(0, len(ids), _LOAD_BATCH_SIZE):
+                rows = (await session.execute(
+                    select(*_doc_columns()).where(Product.id.in_(ids[i:i + _LOAD_BATCH_SIZE]))
+                )).all()
+                docs.extend(_Doc(*row) for row in rows)
+        found_ids = {doc.product_id for doc in docs}
+        index.upsert(docs, removed_ids=product_ids - found_ids)
+    logger.info(f"Пошуковий індекс: оновлено {len(docs)} товарів, видалено {len(product_ids) - len(found_ids)}.")
+
+async def _refresh_products_safe(product_ids: Set[int]) -> None:
+    try:
+        await refresh_products(product_ids)
+    except Exception as e:
+        logger.error(f"Помилка інкрементального оновлення пошукового індексу: {e}", exc_info=True)
+
+async def _run() -> None:
+    # Повна побудова - при кожній (пере)підписці: що пропустили, не знаємо
+    await catalog_events.listen_products_changed(_refresh_products_safe, on_subscribed=rebuild_index)
+
+def start_search_index() -> None:
+    """Запускає побудову індексу та підписку на зміни каталогу (один раз на процес)."""
+    global _listener_task
+    if _listener_task is None or _listener_task.done():
+        _listener_task = asyncio.create_task(_run())
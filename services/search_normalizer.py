@@ -0,0 +1,61 @@
+# services/search_normalizer.py
+import re
+import unicodedata
+from typing import List, Optional
+
+# Усі варіанти апострофа (в т.ч. "м'який" vs "м’який" vs "мʼякий") прибираємо повністю
+_APOSTROPHES = "'’ʼ‘`´′"
+_APOSTROPHE_TABLE = str.maketrans("", "", _APOSTROPHES)
+
+# Кириличні літери, які виглядають як латинські. У SKU їх часто плутають
+# ("АВ-123" набраний кирилицею vs "AB-123" латиницею) - зводимо до латиниці.
+_HOMOGLYPHS = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "є": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x",
+    "і": "i", "ї": "i", "ё": "e",
+})
+
+_TOKEN_RE = re.compile(r"[\w-]+")
+_LATIN_OR_DIGIT_RE = re.compile(r"[0-9a-z]")
+
+def _fold_sku_token(token: str) -> str:
+    """Токен, схожий на артикул (є цифри/латиниця), зводиться до латиниці."""
+    if _LATIN_OR_DIGIT_RE.search(token):
+        return token.translate(_HOMOGLYPHS)
+    return token
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    """
+    Нормалізовані токени для пошуку:
+    регістр, Unicode (NFKC), апострофи, кирилиця в артикулах.
+    """
+    if not text: return []
+    text = unicodedata.normalize("NFKC", text).lower().translate(_APOSTROPHE_TABLE)
+    text = text.replace("ё", "е")
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        token = token.strip("-_")
+        if token:
+            tokens.append(_fold_sku_token(token))
+    return tokens
+
+def normalize_search_text(*parts: Optional[str]) -> str:
+    """Один нормалізований рядок з кількох полів (назва, SKU, ...)."""
+    return " ".join(token for part in parts for token in search_tokens(part))
+
+def normalize_sku(sku: Optional[str]) -> str:
+    """Артикул без розділителів: 'АВ-123/1' і 'ab 123-1' -> 'ab1231'."""
+    return "".join(token.replace("-", "").replace("_", "") for token in search_tokens(sku))
+
+def normalize_sku_key(sku: Optional[str]) -> str:
+    """
+    Ключ точного пошуку артикула (`Product.sku_norm`): ' АВ-123 ' -> 'ab-123'.
+    На відміну від normalize_sku, розділювачі лишаються ('ab-12' != 'ab12').
+    """
+    if not sku: return ""
+    key = " ".join(unicodedata.normalize("NFKC", sku).lower().split())
+    return _fold_sku_token(key)
+
+def build_product_search_text(name: Optional[str], sku: Optional[str]) -> str:
+    """Рядок для `Product.search_text` (trigram-індекс): назва + SKU + SKU без розділителів."""
+    return normalize_search_text(name, sku, normalize_sku(sku))
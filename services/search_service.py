@@ -0,0 +1,126 @@
+# services/search_service.py
+import logging
+import re
+import json
+import base64
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional, Tuple
+from sqlalchemy import func, cast, case, or_, literal, tuple_, Numeric
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from database.db import AsyncSessionLocal
+from database.models import Product, ProductOption, ProductVariant
+from services.search_normalizer import search_tokens, normalize_sku
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+_TS_CONFIG = "simple" # Українського словника в Postgres немає - нормалізуємо самі
+
+class InvalidCursorError(ValueError):
+    """Курсор пагінації пошкоджений або не від цього API."""
+
+# Курсор знає, яким бекендом його видано: бали індексу і Postgres несумісні,
+# тож пагінація продовжується там, де почалась.
+CURSOR_INDEX = "i"
+CURSOR_DB = "d"
+
+def encode_cursor(rank: Decimal, product_id: int, backend: str = CURSOR_DB) -> str:
+    payload = json.dumps([backend, str(rank), product_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def _parse_cursor(cursor: str) -> Tuple[str, Decimal, int]:
+    try:
+        backend, rank, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if backend not in (CURSOR_INDEX, CURSOR_DB):
+            raise ValueError(backend)
+        return backend, Decimal(rank), int(product_id)
+    except (ValueError, TypeError, InvalidOperation, UnicodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor!r}") from e
+
+def cursor_backend(cursor: str) -> str:
+    """CURSOR_INDEX або CURSOR_DB. Некоректний курсор -> InvalidCursorError."""
+    return _parse_cursor(cursor)[0]
+
+def decode_cursor(cursor: str, backend: str = CURSOR_DB) -> Tuple[Decimal, int]:
+    issued_by, rank, product_id = _parse_cursor(cursor)
+    if issued_by != backend:
+        raise InvalidCursorError(f"Cursor from another search backend: {cursor!r}")
+    return rank, product_id
+
+def _build_tsquery(tokens: List[str]) -> Optional[str]:
+    """['ab-123', 'сорочк'] -> 'ab:* & 123:* & сорочк:*' (префіксний пошук)."""
+    parts = [part for token in tokens for part in re.split(r"[-_]", token) if part]
+    if not parts: return None
+    return " & ".join(f"{part}:*" for part in parts)
+
+async def search_products_page(
+    query: str,
+    category_tag: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    only_available: bool = False
+) -> Tuple[List[Product], Optional[str]]:
+    """
+    Ранжований пошук по назві/SKU/опису.
+    - `search_vector` (GIN, full-text) - слова з назви, SKU та опису (префіксно);
+    - `search_text` (GIN, pg_trgm) - підрядок і "схожі" слова (друкарські помилки, SKU).
+
+    Повертає (сторінка товарів, курсор наступної сторінки або None).
+    Некоректний курсор -> InvalidCursorError.
+    """
+    tokens = search_tokens(query)
+    if not tokens: return [], None
+    query_text = " ".join(tokens)
+    query_sku = normalize_sku(query)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    after = decode_cursor(cursor) if cursor else None
+
+    conditions = [
+        Product.search_text.contains(query_text, autoescape=True),
+        literal(query_text).op("<%")(Product.search_text), # word_similarity (pg_trgm)
+    ]
+    if query_sku and query_sku != query_text:
+        conditions.append(Product.search_text.contains(query_sku, autoescape=True))
+
+    rank = func.word_similarity(query_text, Product.search_text)
+    tsquery_text = _build_tsquery(tokens)
+    if tsquery_text:
+        tsquery = func.to_tsquery(_TS_CONFIG, tsquery_text)
+        conditions.append(Product.search_vector.op("@@")(tsquery))
+        rank = rank + func.ts_rank(Product.search_vector, tsquery)
+    if query_sku:
+        # Точний збіг артикула - завжди першим (SKU без розділителів - останній токен search_text)
+        sku_match = Product.search_text.endswith(f" {query_sku}", autoescape=True) | (Product.search_text == query_sku)
+        rank = rank + case((sku_match, 1), else_=0)
+    rank = cast(rank, Numeric(12, 6)) # Стабільне значення для курсора
+
+    ranked = select(Product.id.label("product_id"), rank.label("rank")).where(or_(*conditions))
+    if category_tag:
+        ranked = ranked.where(Product.category_tag == category_tag)
+    if only_available:
+        ranked = ranked.where(Product.variants.any(ProductVariant.is_available == True))
+    ranked = ranked.subquery()
+
+    stmt = select(Product, ranked.c.rank).join(
+        ranked, Product.id == ranked.c.product_id
+    ).options(
+        selectinload(Product.options).selectinload(ProductOption.values),
+        selectinload(Product.variants).selectinload(ProductVariant.option_values)
+    ).order_by(
+        ranked.c.rank.desc(), Product.id.desc()
+    ).limit(limit + 1)
+    if after:
+        stmt = stmt.where(tuple_(ranked.c.rank, Product.id) < tuple_(*after))
+
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(stmt)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_product, last_rank = rows[-1]
+        next_cursor = encode_cursor(last_rank, last_product.id)
+    return [product for product, _ in rows], next_cursor
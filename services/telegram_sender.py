@@ -0,0 +1,281 @@
+# services/telegram_sender.py
+import logging
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Hashable, List, Optional, Set, Union
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    Response, TelegramMethod,
+    SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendAudio, SendVoice,
+    SendMediaGroup, SendPoll, SendSticker, SendLocation, SendContact,
+    CopyMessage, CopyMessages, ForwardMessage, ForwardMessages,
+    EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia
+)
+
+from config_reader import config
+
+logger = logging.getLogger(__name__)
+
+# Єдиний планувальник відправок у Telegram для всього процесу.
+# Підключається як request-middleware сесії бота (install), тож покриває всі
+# bot.send_*/edit_*/message.answer без змін у сервісах:
+#   - token bucket на бота (глобальний) і на кожен чат;
+#   - пріоритетні смуги: клієнт > постачальник > адмін > канали;
+#   - 429 (retry_after) - чат ставиться на паузу, запит повторюється;
+#   - кілька редагувань одного повідомлення в черзі зливаються в одне (останнє).
+# Ліміти - на процес (бот і web_app мають кожен свій планувальник).
+LANE_CUSTOMER = 0
+LANE_SUPPLIER = 1
+LANE_ADMIN = 2
+LANE_CHANNEL = 3
+_LANES = 4
+
+_GLOBAL_RATE = 25.0 # повідомлень/с на бота (ліміт Telegram ~30)
+_GLOBAL_BURST = 25
+_PRIVATE_RATE = 1.0 # ~1 повідомлення/с в один приватний чат
+_PRIVATE_BURST = 3 # Текст + файл + кнопки не чекають одне одного
+_GROUP_RATE = 20 / 60 # 20 повідомлень/хв у групу/канал
+_GROUP_BURST = 5
+_MAX_RETRIES = 3 # Повторів після 429, далі помилка йде викликачу
+_PRUNE_INTERVAL_SECONDS = 60
+
+_SEND_METHODS = (
+    SendMessage, SendPhoto, SendDocument, SendVideo, SendAnimation, SendAudio, SendVoice,
+    SendMediaGroup, SendPoll, SendSticker, SendLocation, SendContact,
+    CopyMessage, CopyMessages, ForwardMessage, ForwardMessages,
+    EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia
+)
+_EDIT_METHODS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup, EditMessageMedia)
+
+_lane: ContextVar[Optional[int]] = ContextVar("telegram_send_lane", default=None)
+
+@contextmanager
+def lane(value: int):
+    """
+    Явна смуга для відправок усередині блоку (напр. приватний чат постачальника,
+    який інакше вважався б клієнтським):
+        with telegram_sender.lane(telegram_sender.LANE_SUPPLIER): ...
+    """
+    token = _lane.set(value)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+def _lane_for(chat_id: Union[int, str]) -> int:
+    explicit = _lane.get()
+    if explicit is not None: return explicit
+    if chat_id in (config.test_channel, config.admin_id): return LANE_ADMIN
+    if isinstance(chat_id, str) or chat_id < 0: return LANE_CHANNEL # @username або група/канал
+    return LANE_CUSTOMER
+
+class _TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Секунд до наступного токена (0 - можна відправляти)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class _ChatState:
+    """Ліміт чату + пауза після 429 + "зайнятий" (запити в один чат - строго по черзі)."""
+    __slots__ = ("bucket", "blocked_until", "busy", "queued")
+
+    def __init__(self, chat_id: Union[int, str]):
+        is_private = isinstance(chat_id, int) and chat_id > 0
+        self.bucket = _TokenBucket(*((_PRIVATE_RATE, _PRIVATE_BURST) if is_private else (_GROUP_RATE, _GROUP_BURST)))
+        self.blocked_until = 0.0
+        self.busy = False
+        self.queued = 0
+
+class _Job:
+    __slots__ = ("make_request", "bot", "method", "chat_id", "lane", "merge_key", "waiters", "attempts")
+
+    def __init__(self, make_request, bot: Bot, method: TelegramMethod, chat_id, lane_: int,
+                 merge_key: Optional[Hashable], waiter: asyncio.Future):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.chat_id = chat_id
+        self.lane = lane_
+        self.merge_key = merge_key
+        self.waiters: List[asyncio.Future] = [waiter]
+        self.attempts = 0
+
+class SendScheduler(BaseRequestMiddleware):
+    def __init__(self):
+        self._lanes: List[Deque[_Job]] = [deque() for _ in range(_LANES)]
+        self._global = _TokenBucket(_GLOBAL_RATE, _GLOBAL_BURST)
+        self._chats: Dict[Union[int, str], _ChatState] = {}
+        self._pending_edits: Dict[Hashable, _Job] = {}
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._pruned_at = time.monotonic()
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[Any],
+        bot: Bot,
+        method: TelegramMethod[Any],
+    ) -> Response[Any]:
+        chat_id = getattr(method, "chat_id", None)
+        if not isinstance(method, _SEND_METHODS) or chat_id is None:
+            return await make_request(bot, method) # getUpdates, answerCallbackQuery, inline-редагування...
+
+        waiter = asyncio.get_running_loop().create_future()
+        merge_key = (type(method), chat_id, method.message_id) if isinstance(method, _EDIT_METHODS) else None
+        pending = self._pending_edits.get(merge_key) if merge_key else None
+        if pending is not None:
+            # Попереднє редагування ще не відправлене - відправимо лише нове
+            pending.method, pending.make_request = method, make_request
+            pending.waiters.append(waiter)
+        else:
+            job = _Job(make_request, bot, method, chat_id, _lane_for(chat_id), merge_key, waiter)
+            self._enqueue(job)
+        self._ensure_worker()
+        return await waiter
+
+    def _enqueue(self, job: _Job, front: bool = False) -> None:
+        if front:
+            self._lanes[job.lane].appendleft(job)
+        else:
+            self._lanes[job.lane].append(job)
+        if job.merge_key:
+            self._pending_edits[job.merge_key] = job
+        self._chat(job.chat_id).queued += 1
+        self._wakeup.set()
+
+    def _chat(self, chat_id) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _ChatState(chat_id)
+        return state
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    # ---
+    # Worker
+    # ---
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch_ready()
+            if time.monotonic() - self._pruned_at > _PRUNE_INTERVAL_SECONDS:
+                self._prune()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch_ready(self) -> Optional[float]:
+        """
+        Запускає все, що дозволяють ліміти, у порядку пріоритету смуг.
+        Повертає, скільки чекати до наступної можливості (None - нічого не чекає).
+        """
+        now = time.monotonic()
+        next_delay = None
+        for queue in self._lanes:
+            waiting = deque()
+            while queue:
+                job = queue.popleft()
+                state = self._chats[job.chat_id]
+                if state.busy:
+                    # Попередній запит у цей чат ще виконується - завершення нас розбудить
+                    waiting.append(job)
+                    continue
+                delay = max(state.blocked_until - now, state.bucket.wait_time(now), self._global.wait_time(now))
+                if delay > 0:
+                    waiting.append(job)
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+                    continue
+                self._global.take(now)
+                state.bucket.take(now)
+                state.busy = True
+                state.queued -= 1
+                if job.merge_key:
+                    self._pending_edits.pop(job.merge_key, None)
+                task = asyncio.create_task(self._execute(job))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+            queue.extend(waiting)
+        return next_delay
+
+    async def _execute(self, job: _Job) -> None:
+        state = self._chats[job.chat_id]
+        try:
+            response = await job.make_request(job.bot, job.method)
+        except TelegramRetryAfter as e:
+            state.blocked_until = time.monotonic() + e.retry_after
+            job.attempts += 1
+            if job.attempts > _MAX_RETRIES:
+                self._resolve(job, exception=e)
+                return
+            logger.warning(
+                f"Telegram 429 ({type(job.method).__name__}, чат {job.chat_id}): "
+                f"пауза {e.retry_after} с, повтор {job.attempts}/{_MAX_RETRIES}."
+            )
+            newer = self._pending_edits.get(job.merge_key) if job.merge_key else None
+            if newer is not None:
+                newer.waiters.extend(job.waiters) # Поки чекали, прийшло новіше редагування
+            else:
+                self._enqueue(job, front=True)
+        except Exception as e:
+            self._resolve(job, exception=e)
+        else:
+            self._resolve(job, response=response)
+        finally:
+            state.busy = False
+            self._wakeup.set()
+
+    @staticmethod
+    def _resolve(job: _Job, response: Any = None, exception: Optional[BaseException] = None) -> None:
+        for waiter in job.waiters:
+            if waiter.done(): continue # Викликача скасували
+            if exception is not None:
+                waiter.set_exception(exception)
+            else:
+                waiter.set_result(response)
+
+    def _prune(self) -> None:
+        """Прибирає стан чатів, які простоюють (ліміт уже відновився повністю)."""
+        now = time.monotonic()
+        for chat_id in [
+            chat_id for chat_id, state in self._chats.items()
+            if not state.busy and not state.queued and state.blocked_until <= now and state.bucket.is_full(now)
+        ]:
+            del self._chats[chat_id]
+        self._pruned_at = now
+
+scheduler = SendScheduler()
+
+def install(bot: Bot) -> Bot:
+    """Підключає спільний планувальник до сесії бота (один раз на екземпляр Bot)."""
+    if scheduler not in bot.session.middleware:
+        bot.session.middleware(scheduler)
+    return bot
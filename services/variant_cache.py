@@ -0,0 +1,265 @@
+# services/variant_cache.py
+import logging
+import asyncio
+import json
+import time
+import redis.asyncio as aioredis
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Set, Tuple
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from config_reader import config
+from database.db import AsyncSessionLocal
+from database.models import ProductVariant, ProductOptionValue
+from services import catalog_events
+
+logger = logging.getLogger(__name__)
+
+# Кеш варіантів за supplier_offer_id для додавання в кошик.
+#   variant:{offer_id}          - JSON "статичних" полів (товар, постачальник, назва, ціни...);
+#   variant_stock:{offer_id}    - "quantity:is_available", оновлює кожен імпорт (TTL трохи довший за інтервал);
+#   variant:product:{id}        - SET offer_id товару (для інвалідації по подіях каталогу);
+#   variant:generation          - лічильник інвалідацій: read-through пише в кеш, лише якщо
+#                                 з моменту читання БД інвалідацій не було (інакше дані могли застаріти).
+# Перед Redis - LRU процесу (лише статичні поля; залишок завжди з Redis).
+_VARIANT_KEY = "variant:{}"
+_STOCK_KEY = "variant_stock:{}"
+_PRODUCT_OFFERS_KEY = "variant:product:{}"
+_GENERATION_KEY = "variant:generation"
+_VARIANT_TTL_SECONDS = 86400
+# Імпорт оновлює залишки кожні xml_cache_ttl_min; запас - на тривалість самого імпорту.
+# Старіший залишок (імпорт не пройшов / фід не змінився) - перечитуємо з БД.
+_STOCK_TTL_SECONDS = (config.xml_cache_ttl_min + 15) * 60
+_LOCAL_MAX_SIZE = 5000
+_LOCAL_TTL_SECONDS = 60
+_STOCK_WRITE_CHUNK = 1000
+
+try:
+    redis_client = aioredis.from_url(
+        str(config.redis_url),
+        encoding="utf-8",
+        decode_responses=True
+    )
+except Exception as e:
+    logger.error(f"Не вдалося підключитися до Redis (кеш варіантів): {e}")
+    redis_client = None
+
+# KEYS: generation, variant, stock, offers товару; ARGV: очікувана generation, static JSON,
+# TTL static, залишок, TTL залишку, offer_id. Залишок - NX: свіжіший від імпорту не перетираємо.
+_LUA_STORE = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[5], 'NX')
+redis.call('SADD', KEYS[4], ARGV[6])
+redis.call('EXPIRE', KEYS[4], ARGV[3])
+return 1
+"""
+
+if redis_client:
+    _store_script = redis_client.register_script(_LUA_STORE)
+
+class CachedVariant:
+    """Усе, що потрібно кошику про варіант, без ORM-сесії."""
+    __slots__ = ("offer_id", "id", "product_id", "supplier_id", "name", "sku", "picture",
+                 "options_text", "base_price", "final_price", "quantity", "is_available")
+
+    _STATIC_FIELDS = ("id", "product_id", "supplier_id", "name", "sku", "picture",
+                      "options_text", "base_price", "final_price")
+
+    def __init__(self, offer_id: str, static: Dict[str, Any], quantity: int, is_available: bool):
+        self.offer_id = offer_id
+        for field in self._STATIC_FIELDS:
+            setattr(self, field, static[field])
+        self.quantity = quantity
+        self.is_available = is_available
+
+def _encode_stock(quantity: int, is_available: bool) -> str:
+    return f"{int(quantity)}:{int(bool(is_available))}"
+
+def _decode_stock(raw: str) -> Tuple[int, bool]:
+    quantity, is_available = raw.split(":")
+    return int(quantity), is_available == "1"
+
+_local: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+_local_generation = 0 # Інвалідації в цьому процесі (захист LRU від запису застарілого)
+_listener_task: Optional[asyncio.Task] = None
+
+def _local_get(offer_id: str) -> Optional[Dict[str, Any]]:
+    item = _local.get(offer_id)
+    if item is None: return None
+    if item[1] < time.monotonic():
+        del _local[offer_id]
+        return None
+    _local.move_to_end(offer_id)
+    return item[0]
+
+def _local_put(offer_id: str, static: Dict[str, Any], generation: int) -> None:
+    if generation != _local_generation: return # Поки читали, була інвалідація - дані могли застаріти
+    _local[offer_id] = (static, time.monotonic() + _LOCAL_TTL_SECONDS)
+    _local.move_to_end(offer_id)
+    while len(_local) > _LOCAL_MAX_SIZE:
+        _local.popitem(last=False)
+
+# ---
+# Читання
+# ---
+async def _load_from_db(offer_id: str) -> Optional[Tuple[Dict[str, Any], int, bool]]:
+    stmt = select(ProductVariant).where(
+        ProductVariant.supplier_offer_id == offer_id
+    ).options(
+        joinedload(ProductVariant.product),
+        selectinload(ProductVariant.option_values).selectinload(ProductOptionValue.option)
+    )
+    async with AsyncSessionLocal() as session:
+        variant = (await session.execute(stmt)).scalar_one_or_none()
+        if variant is None or variant.product is None: return None
+        product = variant.product
+        static = {
+            "id": variant.id,
+            "product_id": variant.product_id,
+            "supplier_id": product.supplier_id,
+            "name": product.name,
+            "sku": product.sku,
+            "picture": product.pictures[0] if product.pictures else None,
+            "options_text": ", ".join(f"{ov.option.name}: {ov.value}" for ov in variant.option_values) or "N/A",
+            "base_price": int(variant.base_price),
+            "final_price": variant.final_price,
+        }
+        return static, variant.quantity, variant.is_available
+
+async def _load_stock_from_db(offer_id: str) -> Optional[Tuple[int, bool]]:
+    """Лише залишок (статичні поля вже є в кеші) - без join товару та опцій."""
+    stmt = select(ProductVariant.quantity, ProductVariant.is_available).where(
+        ProductVariant.supplier_offer_id == offer_id
+    )
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(stmt)).first()
+    return (row.quantity, row.is_available) if row else None
+
+async def _store_stock(offer_id: str, quantity: int, is_available: bool) -> None:
+    if not redis_client: return
+    try:
+        # NX: поки читали БД, імпорт міг уже записати свіжіший залишок
+        await redis_client.set(_STOCK_KEY.format(offer_id), _encode_stock(quantity, is_available), ex=_STOCK_TTL_SECONDS, nx=True)
+    except Exception as e:
+        logger.warning(f"Кеш варіантів: помилка запису залишку в Redis ({offer_id}): {e}")
+
+async def _store(offer_id: str, static: Dict[str, Any], quantity: int, is_available: bool, generation: Optional[str]) -> None:
+    """Запис у Redis, лише якщо з читання `generation` (до запиту в БД) інвалідацій не було."""
+    if not redis_client or generation is None: return
+    try:
+        stored = await _store_script(
+            keys=[_GENERATION_KEY, _VARIANT_KEY.format(offer_id), _STOCK_KEY.format(offer_id),
+                  _PRODUCT_OFFERS_KEY.format(static["product_id"])],
+            args=[generation, json.dumps(static, ensure_ascii=False), _VARIANT_TTL_SECONDS,
+                  _encode_stock(quantity, is_available), _STOCK_TTL_SECONDS, offer_id]
+        )
+        if not stored:
+            logger.debug(f"Кеш варіантів: {offer_id} не записано - каталог змінився під час читання.")
+    except Exception as e:
+        logger.warning(f"Кеш варіантів: помилка запису в Redis ({offer_id}): {e}")
+
+async def get_variant(offer_id: str) -> Optional[CachedVariant]:
+    """
+    Варіант за supplier_offer_id: статичні поля з LRU/Redis, залишок з Redis.
+    Звичайний випадок - один round trip у Redis і жодного запиту в БД.
+    """
+    if not offer_id: return None
+    start_variant_cache()
+
+    local_generation = _local_generation
+    static = _local_get(offer_id)
+    stock = None
+    generation = None
+    if redis_client:
+        try:
+            if static is not None:
+                stock = await redis_client.get(_STOCK_KEY.format(offer_id))
+            else:
+                raw_static, stock, generation = await redis_client.mget(
+                    [_VARIANT_KEY.format(offer_id), _STOCK_KEY.format(offer_id), _GENERATION_KEY]
+                )
+                generation = generation or "0"
+                static = json.loads(raw_static) if raw_static else None
+        except Exception as e:
+            logger.warning(f"Кеш варіантів: помилка читання з Redis ({offer_id}): {e}")
+            static, stock, generation = None, None, None
+
+    if static is not None and stock is not None:
+        _local_put(offer_id, static, local_generation)
+        return CachedVariant(offer_id, static, *_decode_stock(stock))
+
+    if static is not None:
+        # Протух лише залишок - вузький запит замість повного завантаження варіанта
+        stock_row = await _load_stock_from_db(offer_id)
+        if stock_row is None: return None
+        await _store_stock(offer_id, *stock_row)
+        _local_put(offer_id, static, local_generation)
+        return CachedVariant(offer_id, static, *stock_row)
+
+    loaded = await _load_from_db(offer_id)
+    if loaded is None: return None
+    static, quantity, is_available = loaded
+    await _store(offer_id, static, quantity, is_available, generation)
+    _local_put(offer_id, static, local_generation)
+    return CachedVariant(offer_id, static, quantity, is_available)
+
+# ---
+# Оновлення (імпорт) та інвалідація (події каталогу)
+# ---
+async def refresh_stock(stock_by_offer: Dict[str, Tuple[int, bool]]) -> None:
+    """Імпорт після commit: свіжі залишки всіх варіантів фіду (пакетами, без round trip на кожен)."""
+    if not redis_client or not stock_by_offer: return
+    try:
+        offers = sorted(stock_by_offer)
+        for i in range(0, len(offers), _STOCK_WRITE_CHUNK):
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for offer_id in offers[i:i + _STOCK_WRITE_CHUNK]:
+                    pipe.set(_STOCK_KEY.format(offer_id), _encode_stock(*stock_by_offer[offer_id]), ex=_STOCK_TTL_SECONDS)
+                await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Кеш варіантів: не вдалося оновити залишки ({len(stock_by_offer)} варіантів): {e}")
+
+async def invalidate_products(product_ids: Set[int]) -> None:
+    """Ціни/назви товарів змінились - прибираємо статичні поля їхніх варіантів."""
+    global _local_generation
+    if not product_ids: return
+    _local_generation += 1
+    for offer_id in [offer_id for offer_id, (static, _) in _local.items() if static["product_id"] in product_ids]:
+        del _local[offer_id]
+    if not redis_client: return
+    try:
+        ids = sorted(product_ids)
+        for i in range(0, len(ids), _STOCK_WRITE_CHUNK):
+            offers_keys = [_PRODUCT_OFFERS_KEY.format(product_id) for product_id in ids[i:i + _STOCK_WRITE_CHUNK]]
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for offers_key in offers_keys:
+                    pipe.smembers(offers_key)
+                offer_sets = await pipe.execute()
+            offer_keys = [_VARIANT_KEY.format(offer_id) for offers in offer_sets for offer_id in offers]
+            # Разом (MULTI): read-through, що читав БД до цієї зміни, вже не запише старе
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.incr(_GENERATION_KEY)
+                pipe.delete(*offer_keys, *offers_keys)
+                await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Кеш варіантів: не вдалося інвалідувати {len(product_ids)} товарів у Redis: {e}")
+
+async def _on_subscribed() -> None:
+    global _local_generation
+    _local_generation += 1
+    _local.clear()
+
+async def _run() -> None:
+    await catalog_events.listen_products_changed(invalidate_products, on_subscribed=_on_subscribed)
+
+def start_variant_cache() -> None:
+    """Підписка на зміни каталогу (один раз на процес); викликається і ліниво з get_variant."""
+    global _listener_task
+    if not redis_client: return # Без Redis лише TTL локального кешу
+    if _listener_task is None or _listener_task.done():
+        try:
+            _listener_task = asyncio.get_running_loop().create_task(_run())
+        except RuntimeError:
+            pass
@@ -1,11 +1,13 @@
 # services/xml_parser.py
 import logging
 import xml.etree.ElementTree as ET
-from decimal import Decimal, ROUND_UP, InvalidOperation
-import aiohttp
+from decimal import Decimal
 import asyncio
 import re
-from typing import Dict, Any, List, Optional, Set, Tuple
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Set, Tuple, AsyncIterator
 from collections import defaultdict
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.future import select
@@ -14,62 +16,17 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from config_reader import config
+from services import catalog_events, catalog_snapshot, catalog_writer, feed_cache_service, pricing_engine, product_cache, search_service, variant_cache
+from api_models import ProductAPI
 from database.db import AsyncSessionLocal
 from database.models import (
-    Supplier, Product, ProductVariant, 
-    ProductOption, ProductOptionValue, ProductVariantOptionValue,
-    PriceRule, PriceRuleType # <-- НОВИЙ ІМПОРТ
+    Supplier, SupplierType, SupplierStatus, Product, ProductVariant, 
+    ProductOption, ProductOptionValue
 )
 
 logger = logging.getLogger(__name__)
 _scheduler = AsyncIOScheduler(timezone="Europe/Kiev")
 
-# --- Глобальний Кеш для Правил Націнки (План 27G) ---
-# (Ми не хочемо питати БД про 100 правил на кожний з 1000 товарів)
-_price_rules_cache: List[PriceRule] = []
-_rules_cache_updated_at = None
-
-async def _load_price_rules() -> List[PriceRule]:
-    """
-    (Фаза 5.4.4 / План 27G)
-    Завантажує та кешує правила націнки з БД.
-    """
-    global _price_rules_cache, _rules_cache_updated_at
-    
-    # Кешуємо на 1 хвилину
-    if _price_rules_cache and _rules_cache_updated_at and \
-       (datetime.now(timezone.utc) - _rules_cache_updated_at < timedelta(minutes=1)):
-        return _price_rules_cache
-        
-    logger.info("Оновлюю кеш правил націнок (PriceRules) з БД...")
-    async with AsyncSessionLocal() as db:
-        stmt = select(PriceRule).where(
-            PriceRule.is_active == True
-        ).order_by(PriceRule.priority.asc())
-        
-        result = await db.execute(stmt)
-        _price_rules_cache = result.scalars().all()
-        _rules_cache_updated_at = datetime.now(timezone.utc)
-        
-        if not _price_rules_cache:
-            logger.warning("Не знайдено ЖОДНОГО 'PriceRule'. Буде використано націнку +33% за замовчуванням.")
-            
-        return _price_rules_cache
-
-def _aggressive_rounding(price: Decimal) -> int:
-    # ... (код без змін) ...
-    try:
-        price_int = int(price.to_integral_value(rounding=ROUND_UP))
-        if price_int < 100:
-            remainder = price_int % 5
-            return price_int + (5 - remainder) if remainder != 0 else price_int
-        remainder = price_int % 10
-        if remainder == 0: return price_int
-        return price_int + (10 - remainder)
-    except Exception:
-        logger.error(f"Помилка агресивного округлення для ціни {price}", exc_info=True)
-        return 0
-
 # ---
 # [ОНОВЛЕНО - ФАЗА 5.4.4] (План 23/27 "God Mode")
 # ---
@@ -82,50 +39,13 @@ async def calculate_final_price(
     (План 27G) "Розумний" калькулятор ціни.
     Бере дроп-ціну та шукає у `PriceRule` (з БД)
     правильну націнку (33% vs 30%...).
+    
+    Обгортка над `pricing_engine` для поодиноких викликів.
+    В циклах беріть рушій один раз і рахуйте синхронно (`price_batch`).
     """
-    if base_price_str is None: return 0
     try:
-        cleaned_price_str = base_price_str.strip().replace(' ', '').replace(',', '.')
-        if not cleaned_price_str: return 0
-        base_price = Decimal(cleaned_price_str)
-        if base_price <= 0: return 0
-        
-        # 1. Завантажуємо правила
-        rules = await _load_price_rules()
-        
-        final_price = None
-        
-        # 2. Шукаємо перше правило, що підходить
-        for rule in rules:
-            # Перевірка "ЯКЩО"
-            if rule.min_price is not None and base_price < rule.min_price:
-                continue # (Ціна нижча за мінімальну)
-            if rule.max_price is not None and base_price > rule.max_price:
-                continue # (Ціна вища за максимальну)
-            if rule.category_tag is not None and rule.category_tag != category_tag:
-                continue # (Інша категорія)
-            if rule.supplier_id is not None and rule.supplier_id != supplier_id:
-                continue # (Інший постачальник)
-                
-            # Успіх! Ми знайшли правило. Застосовуємо "ТОДІ"
-            if rule.rule_type == PriceRuleType.percentage:
-                # (План 23: 30%)
-                final_price = base_price * (Decimal('1.0') + (Decimal(rule.value) / Decimal('100.0')))
-            elif rule.rule_type == PriceRuleType.fixed_amount:
-                final_price = base_price + Decimal(rule.value)
-            
-            break # Зупиняємось на першому ж правилі (бо вони по пріоритету)
-
-        # 3. Якщо ЖОДНЕ правило не підійшло - ставимо +33% (План 23)
-        if final_price is None:
-            final_price = base_price * Decimal('1.33') # Націнка за замовчуванням
-        
-        # 4. Агресивне Округлення
-        return _aggressive_rounding(final_price)
-
-    except (InvalidOperation, ValueError, TypeError, AttributeError) as e:
-        logger.warning(f"Помилка розрахунку ціни для '{base_price_str}': {e}")
-        return 0
+        engine = await pricing_engine.get_engine()
+        return engine.price_from_str(base_price_str, category_tag, supplier_id)
     except Exception as e:
         logger.error(f"Неочікувана помилка розрахунку ціни для '{base_price_str}': {e}", exc_info=True)
         return 0
@@ -159,7 +79,7 @@ async def _get_or_create_supplier(session: AsyncSessionLocal, supplier_key: str,
         name=config.supplier_name, # Беремо з .env
         type=SupplierType.mydrop,
         xml_url=xml_url,
-        is_active=True # Активуємо одразу
+        status=SupplierStatus.active # Активуємо одразу
     ).on_conflict_do_nothing(index_elements=['key']).returning(Supplier.id)
     
     result = await session.execute(insert_stmt)
@@ -171,267 +91,383 @@ async def _get_or_create_supplier(session: AsyncSessionLocal, supplier_key: str,
     await session.commit()
     return supplier_id
 
-async def _get_or_create_options(
-    session: AsyncSessionLocal, 
-    product_id: int, 
-    options_map: Dict[str, Set[str]]
-) -> Dict[Tuple[str, str], int]:
+# ---
+# ПОТОКОВИЙ ПАРСИНГ XML (iterparse)
+# ---
+_GROUP_QUEUE_SIZE = 200 # Скільки готових груп може чекати на запис у БД
+_WRITE_BATCH_SIZE = 500 # Скільки груп пишемо в БД одним bulk-upsert'ом
+_synced_suppliers: Set[str] = set() # Постачальники, чия БД звірена з фідом після старту процесу
+
+def _el_text(elem: ET.Element, tag: str) -> Optional[str]:
+    """Повертає очищений текст дочірнього тегу (або None)."""
+    child = elem.find(tag)
+    if child is None or not child.text:
+        return None
+    return child.text.strip() or None
+
+def _parse_offer(offer: ET.Element) -> Dict[str, Any]:
     """
-    Створює ProductOption та ProductOptionValue в БД.
-    Повертає map: {('Розмір', 'S'): 123, ('Колір', 'Мультикам'): 124, ...}
+    Перетворює <offer> на легкий dict, щоб сам елемент можна було
+    одразу очистити і не тримати все дерево XML у пам'яті.
     """
-    db_value_map = {}
-    for option_name, values_set in options_map.items():
-        if not values_set: continue
-        
-        # 1. Get-or-create ProductOption (напр. "Розмір")
-        opt_stmt = pg_insert(ProductOption).values(
-            product_id=product_id,
-            name=option_name
-        ).on_conflict_do_update(
-            index_elements=['product_id', 'name'],
-            set_={'name': option_name} # Оновлюємо на випадок зміни регістру
-        ).returning(ProductOption.id)
-        
-        option_id = (await session.execute(opt_stmt)).scalar_one()
-        
-        # 2. Get-or-create ProductOptionValue (напр. "S", "M", "L")
-        for value_str in values_set:
-            if not value_str: continue
-            val_stmt = pg_insert(ProductOptionValue).values(
-                option_id=option_id,
-                value=value_str
-            ).on_conflict_do_nothing(
-                index_elements=['option_id', 'value']
-            ).returning(ProductOptionValue.id)
-            
-            value_id = (await session.execute(val_stmt)).scalar_one_or_none()
-            if not value_id: # Якщо on_conflict спрацював
-                s = select(ProductOptionValue.id).where(
-                    (ProductOptionValue.option_id == option_id) & (ProductOptionValue.value == value_str)
-                )
-                value_id = (await session.execute(s)).scalar_one()
+    params = []
+    for param in offer.findall('param'):
+        param_name = param.attrib.get('name')
+        if param_name and param.text and param.text.strip():
+            params.append((param_name.strip(), param.text.strip()))
+
+    return {
+        "id": offer.attrib.get('id'),
+        "group_id": offer.attrib.get('group_id'),
+        "available": offer.attrib.get('available') == 'true',
+        "vendor_code": _el_text(offer, 'vendorCode'),
+        "name": _el_text(offer, 'name'),
+        "description": _el_text(offer, 'description'),
+        "category_id": _el_text(offer, 'categoryId'),
+        "price": _el_text(offer, 'price'),
+        "quantity": _el_text(offer, 'quantity_in_stock'),
+        "pictures": [pic.text for pic in offer.findall('picture') if pic.text],
+        "params": params,
+    }
+
+async def _iter_offer_groups(
+    chunks: AsyncIterator[bytes], 
+    supplier_key: str
+) -> AsyncIterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Інкрементально парсить XML з потоку байтів (XMLPullParser) і віддає
+    готові групи (group_id або vendorCode) одразу, як вони завершились.
+    
+    MyDrop віддає варіанти однієї групи підряд, тому група вважається
+    завершеною, щойно зустрівся інший ключ.
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    open_elements: List[ET.Element] = [] # Стек відкритих тегів (щоб знати батька <offer>)
+    current_key: Optional[str] = None
+    current_offers: List[Dict[str, Any]] = []
+    flushed_keys: Set[str] = set()
+    offers_count = 0
+
+    async for chunk in chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                open_elements.append(elem)
+                continue
+
+            open_elements.pop()
+            if elem.tag != "offer":
+                continue
+
+            offer = _parse_offer(elem)
+            # Звільняємо пам'ять: чистимо <offer> і від'єднуємо його від батька
+            elem.clear()
+            if open_elements:
+                open_elements[-1].remove(elem)
+
+            offers_count += 1
+            # Ключ групування = group_id. Якщо його нема, використовуємо vendorCode.
+            group_key = offer["group_id"] or offer["vendor_code"]
+            if not group_key:
+                continue # Не можемо згрупувати товар
+
+            if group_key != current_key:
+                if current_offers:
+                    flushed_keys.add(current_key)
+                    yield current_key, current_offers
+                if group_key in flushed_keys:
+                    logger.warning(f"'{supplier_key}': група '{group_key}' розірвана у фіді, її варіанти будуть дописані окремо.")
+                current_key, current_offers = group_key, []
+            current_offers.append(offer)
+
+    parser.close()
+    if current_offers:
+        yield current_key, current_offers
+    logger.info(f"'{supplier_key}': Оброблено {offers_count} offers з потоку XML.")
+
+def _group_sku(group_key: str, offer_list: List[Dict[str, Any]]) -> str:
+    """Головний SKU картки = vendorCode першого offer (або ключ групи)."""
+    return offer_list[0]["vendor_code"] or group_key
+
+def _group_fingerprint(offer_list: List[Dict[str, Any]]) -> str:
+    """
+    Відбиток вмісту групи (назва, опис, фото, параметри, ціна, залишки).
+    Однаковий відбиток = у фіді для цієї картки нічого не змінилось.
+    """
+    payload = json.dumps(offer_list, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _is_valid_offer(offer: Dict[str, Any]) -> bool:
+    return bool(offer["id"] and offer["price"]) # Без id/ціни варіант не записується
+
+def _offer_stock(offer: Dict[str, Any]) -> Tuple[int, bool]:
+    """(залишок, наявність) варіанта, як їх пише імпорт."""
+    quantity = 0
+    if offer["quantity"]:
+        try: quantity = int(offer["quantity"])
+        except (ValueError, TypeError): quantity = 0
+    return quantity, offer["available"] and quantity > 0
+
+def _build_group_record(
+    engine: pricing_engine.PricingEngine,
+    supplier_id: int,
+    group_key: str,
+    offer_list: List[Dict[str, Any]],
+    content_hash: str
+) -> Dict[str, Any]:
+    """
+    "Розумно" аналізує одну групу offers і готує запис для
+    `catalog_writer.bulk_upsert_groups` (Product + Опції + Варіанти).
+    """
+    first_offer = offer_list[0]
+    
+    # --- A. Визначаємо базові дані Product ---
+    sku = _group_sku(group_key, offer_list)
+    all_names = [o["name"] for o in offer_list if o["name"]]
+    base_name = _find_common_prefix(all_names) or (all_names[0] if all_names else sku) # "Тактична сорочка (убакс)"
+    category_id = first_offer["category_id"]
+    
+    # --- B. "Розумний" аналіз Опцій (Твоя ідея!) ---
+    options_map = defaultdict(set)
+    name_options_values = set()
+    
+    for offer in offer_list:
+        # B.1: Аналіз <param>
+        for param_name, param_value in offer["params"]:
+            options_map[param_name].add(param_value)
                 
-            db_value_map[(option_name, value_str)] = value_id
-            
-    return db_value_map
+        # B.2: Аналіз кольору (захованого в назві)
+        if offer["name"]:
+            name_variant = offer["name"].replace(base_name, "").strip()
+            if name_variant:
+                name_options_values.add(name_variant)
+
+    # Якщо ми знайшли варіації в назві (напр. "мультикам", "койот"), додаємо їх
+    has_name_colors = len(name_options_values) > 1
+    if has_name_colors:
+        options_map["Колір"] = name_options_values # "Колір" - це наша "розумна" опція
+    
+    # --- C. Варіанти (ProductVariant) та їх опції ---
+    valid_offers = [o for o in offer_list if _is_valid_offer(o)] # Пропускаємо невалідні offer
+    # "Розумний" калькулятор: вся група одним викликом (Категорія + Постачальник)
+    final_prices = engine.price_batch((o["price"], category_id, supplier_id) for o in valid_offers)
+
+    variants = []
+    for offer, final_price_int in zip(valid_offers, final_prices):
+        # Якщо ціна некоректна, все одно запишемо 0
+        base_price_decimal = pricing_engine.parse_price(offer["price"]) or Decimal(0)
+
+        quantity, is_available = _offer_stock(offer)
+
+        # Опції *цього* offer: з <param> та з <name> (Колір)
+        option_keys = list(offer["params"])
+        if has_name_colors and offer["name"]:
+            option_keys.append(("Колір", offer["name"].replace(base_name, "").strip()))
+
+        variants.append({
+            "offer_id": offer["id"],
+            "base_price": base_price_decimal,
+            "final_price": final_price_int,
+            "quantity": quantity,
+            "is_available": is_available,
+            "option_keys": option_keys,
+        })
+
+    return {
+        "sku": sku,
+        "name": base_name,
+        "description": first_offer["description"] or "",
+        "pictures": first_offer["pictures"],
+        "category_tag": category_id,
+        "options": options_map,
+        # Фасети для фільтрів: усі <param> + "розумний" Колір (значення - списки)
+        "attributes": {
+            name: sorted(v for v in values if v)
+            for name, values in sorted(options_map.items()) if any(values)
+        },
+        "variants": variants,
+        "content_hash": content_hash,
+    }
+
+async def _produce_offer_groups(
+    chunks: AsyncIterator[bytes],
+    supplier_key: str,
+    queue: asyncio.Queue
+) -> None:
+    """Парсер-продюсер: кладе готові групи в чергу для DB-writer'а."""
+    try:
+        async for group in _iter_offer_groups(chunks, supplier_key):
+            await queue.put(group)
+    except asyncio.CancelledError:
+        raise # DB-writer сам нас зупинив, сигнал "кінець" вже не потрібен
+    except Exception:
+        await queue.put(None) # Сигнал "фід закінчився" (помилку прокине `await producer`)
+        raise
+    await queue.put(None) # Сигнал "фід закінчився"
 
 
 # ---
 # ГОЛОВНИЙ НОВИЙ ПАРСЕР (ФАЗА 2.5.3)
 # ---
-async def load_and_parse_xml_data(supplier_key: str = "landliz", xml_url: str | None = None):
+async def load_and_parse_xml_data(supplier_key: str = "landliz", xml_url: str | None = None, force: bool = False):
     """
     Завантажує XML, "розумно" парсить його у ГНУЧКУ СХЕМУ (з опціями/варіантами)
     та оновлює дані в БД.
+    
+    Фід качається умовним GET (ETag/Last-Modified) на диск. На 304 або
+    ідентичний вміст (sha256) весь парсинг/запис у БД пропускається.
+    `force=True` перебудовує БД з останнього фіду на диску навіть без змін.
     """
     url_to_load = xml_url or str(config.mydrop_export_url)
     if not url_to_load:
         logger.error(f"URL для '{supplier_key}' не вказано."); return
     logger.info(f"Оновлення ГНУЧКОЇ БД для '{supplier_key}' з {url_to_load[:50]}...")
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url_to_load, timeout=120) as response:
-                response.raise_for_status()
-                xml_content = await response.read()
-    except Exception as e:
-        logger.error(f"Помилка завантаження XML {supplier_key}: {e}"); return
 
-    # 1. Попередній аналіз: групуємо <offer> за `group_id` або `vendorCode`
-    # (Саме так, як ти проаналізував XML!)
-    products_to_process = defaultdict(list)
-    try:
-        root = ET.fromstring(xml_content.decode('utf-8'))
-        offers = root.findall('.//offer')
-        logger.info(f"'{supplier_key}': Знайдено {len(offers)} offers для парсингу.")
-        
-        for offer in offers:
-            group_id = offer.attrib.get('group_id')
-            vendor_code_el = offer.find('vendorCode')
-            vendor_code = vendor_code_el.text.strip() if vendor_code_el is not None and vendor_code_el.text else None
-            
-            # Ключ групування = group_id. Якщо його нема, використовуємо vendorCode.
-            group_key = group_id or vendor_code
-            if not group_key:
-                continue # Не можемо згрупувати товар
-                
-            products_to_process[group_key].append(offer)
-            
-    except ET.ParseError as e:
-        logger.error(f"Помилка парсингу XML {supplier_key}: {e}"); return
-    except Exception as e:
-        logger.error(f"Неочікувана помилка обробки XML {supplier_key}: {e}", exc_info=True); return
-        
-    if not products_to_process:
-        logger.warning(f"Не знайдено продуктів для '{supplier_key}'. Оновлення БД не відбувається.")
+    status, feed_path, feed_meta = await feed_cache_service.download_feed(supplier_key, url_to_load)
+    if status is None:
+        if supplier_key not in _synced_suppliers:
+            # Перший запуск після старту, а фід недоступний - звіряємо БД з останнім імпортованим фідом
+            await rebuild_from_cached_feed(supplier_key, url_to_load)
+        return # Помилку вже залоговано
+
+    if status != feed_cache_service.FEED_UPDATED and not force:
+        if status == feed_cache_service.FEED_UNCHANGED:
+            feed_cache_service.save_feed_meta(supplier_key, feed_meta) # (ETag міг змінитись)
+        _synced_suppliers.add(supplier_key)
+        logger.info(f"Фід '{supplier_key}' не змінився. Оновлення БД пропущено.")
         return
 
-    # 2. Обробка та запис у БД
+    chunks = feed_cache_service.iter_feed_chunks(feed_path)
+    imported = await _import_offer_stream(supplier_key, url_to_load, chunks)
+    if status == feed_cache_service.FEED_UPDATED:
+        if imported:
+            feed_cache_service.promote_feed(supplier_key, feed_path, feed_meta)
+        else:
+            feed_cache_service.discard_feed(feed_path)
+    elif imported:
+        feed_cache_service.save_feed_meta(supplier_key, feed_meta)
+    if imported:
+        _synced_suppliers.add(supplier_key)
+
+async def rebuild_from_cached_feed(supplier_key: str = "landliz", xml_url: str | None = None) -> bool:
+    """
+    Перебудовує БД з останнього успішно імпортованого фіду (без мережі).
+    Викликається, коли перше після старту завантаження фіду не вдалося
+    (напр. БД відновлено з бекапу, а постачальник недоступний).
+    """
+    feed_path = feed_cache_service.get_cached_feed_path(supplier_key)
+    if not feed_path.exists():
+        logger.warning(f"Немає збереженого фіду для '{supplier_key}'.")
+        return False
+    logger.info(f"Фід '{supplier_key}' недоступний. Перебудовую БД з останнього збереженого фіду...")
+    url = xml_url or str(config.mydrop_export_url)
+    imported = await _import_offer_stream(supplier_key, url, feed_cache_service.iter_feed_chunks(feed_path))
+    if imported:
+        _synced_suppliers.add(supplier_key)
+    return imported
+
+async def _import_offer_stream(supplier_key: str, url_to_load: str, chunks: AsyncIterator[bytes]) -> bool:
+    """
+    DB-writer: споживає групи з черги парсера і пише їх в одній транзакції.
+    Якщо XML битий - відкатуємо все, як і раніше. Повертає True при успіху.
+    
+    Інкрементальний режим: групи з незміненим відбитком (`Product.content_hash`)
+    не переписуються, а варіанти, яких немає у фіді, гасяться одним UPDATE
+    в кінці (замість скидання всього каталогу на старті).
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=_GROUP_QUEUE_SIZE)
+    producer = asyncio.create_task(_produce_offer_groups(chunks, supplier_key, queue))
+
     async with AsyncSessionLocal() as session:
         try:
             # Отримуємо ID постачальника
             supplier_id = await _get_or_create_supplier(session, supplier_key, url_to_load)
+            known_hashes = await catalog_writer.load_content_hashes(session, supplier_id)
+            engine = await pricing_engine.get_engine() # Один знімок правил на весь імпорт
             
+            seen_groups = 0
+            unchanged_groups = 0
             processed_products = 0
             processed_variants = 0
-            
-            # Позначаємо всі товари/варіанти цього постачальника як "недоступні"
-            # Новий парсинг оновить ті, що є в наявності.
-            await session.execute(
-                update(ProductVariant).join(Product)
-                .where(Product.supplier_id == supplier_id)
-                .values(is_available=False, quantity=0)
+            seen_offer_ids: Set[str] = set()
+            touched_product_ids: Set[int] = set() # Для інкрементального оновлення кешів/індексів
+            feed_stock: Dict[str, Tuple[int, bool]] = {} # offer_id -> (залишок, наявність) для кешу варіантів
+
+            batch: List[Dict[str, Any]] = []
+            while True:
+                group = await queue.get()
+                if group is not None:
+                    group_key, offer_list = group
+                    seen_groups += 1
+                    # Offer без ціни у фіді лишається, але не записується - має погаснути як відсутній
+                    seen_offer_ids.update(o["id"] for o in offer_list if _is_valid_offer(o))
+                    # Залишки - для всіх варіантів, і тих, що пропускаємо за відбитком
+                    feed_stock.update((o["id"], _offer_stock(o)) for o in offer_list if _is_valid_offer(o))
+
+                    content_hash = _group_fingerprint(offer_list)
+                    if known_hashes.get(_group_sku(group_key, offer_list)) == content_hash:
+                        unchanged_groups += 1
+                        continue # Нічого не змінилось - не пишемо
+
+                    batch.append(_build_group_record(engine, supplier_id, group_key, offer_list, content_hash))
+                    if len(batch) < _WRITE_BATCH_SIZE:
+                        continue
+                if batch:
+                    id_maps = await catalog_writer.bulk_upsert_groups(session, supplier_id, batch)
+                    processed_products += len(id_maps["products"])
+                    touched_product_ids.update(id_maps["products"].values())
+                    processed_variants += len(id_maps["variants"])
+                    batch = []
+                if group is None:
+                    break
+
+            await producer # Прокидуємо помилку парсингу (якщо була)
+
+            if not seen_groups:
+                await session.rollback()
+                logger.warning(f"Не знайдено продуктів для '{supplier_key}'. Оновлення БД не відбувається.")
+                return False
+
+            # Фід прочитано повністю - гасимо варіанти, яких у ньому більше немає
+            missing_variants, missing_product_ids = await catalog_writer.mark_missing_variants(
+                session, supplier_id, seen_offer_ids
             )
+            touched_product_ids.update(missing_product_ids)
 
-            for group_key, offer_list in products_to_process.items():
-                first_offer = offer_list[0]
-                
-                # --- A. Визначаємо базові дані Product ---
-                sku = (first_offer.find('vendorCode').text or group_key).strip()
-                all_names = [o.find('name').text.strip() for o in offer_list if o.find('name') is not None and o.find('name').text]
-                base_name = _find_common_prefix(all_names) or all_names[0] # "Тактична сорочка (убакс)"
-                description_el = first_offer.find('description')
-                description = description_el.text.strip() if description_el is not None and description_el.text else ""
-                pictures = [pic.text for pic in first_offer.findall('picture') if pic.text]
-                category_id = first_offer.find('categoryId').text if first_offer.find('categoryId') is not None else None
-                
-                # --- B. "Розумний" аналіз Опцій (Твоя ідея!) ---
-                options_map = defaultdict(set)
-                name_options_values = set()
-                
-                for offer in offer_list:
-                    # B.1: Аналіз <param>
-                    for param in offer.findall('param'):
-                        param_name = param.attrib.get('name')
-                        param_value = param.text
-                        if param_name and param_value:
-                            options_map[param_name.strip()].add(param_value.strip())
-                            
-                    # B.2: Аналіз кольору (захованого в назві)
-                    name_el = offer.find('name')
-                    if name_el is not None and name_el.text:
-                        name_variant = name_el.text.strip().replace(base_name, "").strip()
-                        if name_variant:
-                            name_options_values.add(name_variant)
-
-                # Якщо ми знайшли варіації в назві (напр. "мультикам", "койот"), додаємо їх
-                if len(name_options_values) > 1:
-                    options_map["Колір"] = name_options_values # "Колір" - це наша "розумна" опція
-                
-                # --- C. Запис Product в БД ---
-                product_stmt = pg_insert(Product).values(
-                    supplier_id=supplier_id,
-                    sku=sku,
-                    name=base_name,
-                    description=description,
-                    pictures=pictures,
-                    category_tag=category_id,
-                    attributes={} # TODO: Заповнити атрибути для фільтрів (Бренд, Рік...)
-                ).on_conflict_do_update(
-                    index_elements=['supplier_id', 'sku'],
-                    set_={
-                        'name': base_name, 'description': description, 'pictures': pictures,
-                        'category_tag': category_id, 'last_updated': func.now()
-                    }
-                ).returning(Product.id)
-                
-                product_id = (await session.execute(product_stmt)).scalar_one()
-                
-                # --- D. Запис Опцій (Розмір, Колір) в БД ---
-                # value_db_map = {('Розмір', 'S'): 123, ('Колір', 'Мультикам'): 124}
-                value_db_map = await _get_or_create_options(session, product_id, options_map)
-
-                # --- E. Запис/Оновлення Варіантів (ProductVariant) ---
-                for offer in offer_list:
-                    offer_id = offer.attrib.get('id')
-                    price_el = offer.find('price')
-                    if not offer_id or price_el is None or not price_el.text:
-                        continue # Пропускаємо невалідний offer
-
-                # Викликаємо "розумний" калькулятор
-                    final_price_int = await calculate_final_price(
-                        base_price_str=price_el.text,
-                        category_tag=category_id, # <-- Передаємо Категорію
-                        supplier_id=supplier_id  # <-- Передаємо Постачальника
-                    )
-
-                    try:
-                        base_price_decimal = Decimal(price_el.text.strip().replace(' ', '').replace(',', '.'))
-                    except (InvalidOperation, ValueError, TypeError):
-                        base_price_decimal = Decimal(0) # Якщо ціна некоректна, все одно запишемо 0
-
-                    quantity_el = offer.find('quantity_in_stock')
-                    quantity = 0
-                    if quantity_el is not None and quantity_el.text:
-                         try: quantity = int(quantity_el.text)
-                         except (ValueError, TypeError): quantity = 0
-                    
-                    is_available = offer.attrib.get('available') == 'true' and quantity > 0
-                    
-                    var_stmt = pg_insert(ProductVariant).values(
-                        product_id=product_id,
-                        supplier_offer_id=offer_id,
-                        base_price=base_price_decimal,
-                        final_price=final_price_int,
-                        quantity=quantity,
-                        is_available=is_available,
-                        last_updated=func.now()
-                    ).on_conflict_do_update(
-                        index_elements=['supplier_offer_id'],
-                        set_={
-                            'base_price': base_price_decimal, 'final_price': final_price_int,
-                            'quantity': quantity, 'is_available': is_available,
-                            'last_updated': func.now()
-                        }
-                    ).returning(ProductVariant.id)
-                    
-                    variant_id = (await session.execute(var_stmt)).scalar_one()
-                    processed_variants += 1
-                    
-                    # --- F. Зв'язування Варіанту з Опціями (Найважливіший крок) ---
-                    # 1. Знаходимо ID опцій для *цього* offer
-                    value_ids_to_link = []
-                    # З <param>
-                    for param in offer.findall('param'):
-                        key = (param.attrib.get('name', '').strip(), param.text.strip())
-                        if key in value_db_map:
-                            value_ids_to_link.append(value_db_map[key])
-                    # З <name> (Колір)
-                    if len(name_options_values) > 1:
-                        name_el = offer.find('name')
-                        if name_el is not None and name_el.text:
-                            name_variant = name_el.text.strip().replace(base_name, "").strip()
-                            key = ("Колір", name_variant)
-                            if key in value_db_map:
-                                value_ids_to_link.append(value_db_map[key])
-                    
-                    # 2. Видаляємо старі зв'язки для цього variant_id
-                    await session.execute(
-                        delete(ProductVariantOptionValue).where(ProductVariantOptionValue.variant_id == variant_id)
-                    )
-                    
-                    # 3. Вставляємо нові зв'язки
-                    if value_ids_to_link:
-                        link_values = [
-                            {'variant_id': variant_id, 'value_id': val_id} 
-                            for val_id in set(value_ids_to_link) # Унікальні ID
-                        ]
-                        await session.execute(insert(ProductVariantOptionValue).values(link_values))
-                
-                processed_products += 1
+            # Правила націнок змінились посеред імпорту - записані за старим рушієм ціни
+            # перераховуємо тут же (фоновий reprice_variants наших незакомічених рядків не бачив)
+            current_engine = await pricing_engine.get_engine()
+            if current_engine is not engine and touched_product_ids:
+                repriced = await pricing_engine.reprice_products(session, current_engine, touched_product_ids)
+                logger.info(f"'{supplier_key}': правила націнок змінились під час імпорту, перераховано {repriced} варіантів.")
 
             # Коммітимо всі зміни в кінці
             await session.commit()
+            await catalog_events.publish_products_changed(touched_product_ids)
+            await variant_cache.refresh_stock(feed_stock)
+            if touched_product_ids:
+                await catalog_snapshot.rebuild_snapshot_safe()
             logger.info(f"Оновлення БД для '{supplier_key}' успішно завершено.")
-            logger.info(f"Оброблено {processed_products} продуктів (груп) та {processed_variants} варіантів.")
+            logger.info(
+                f"Груп у фіді: {seen_groups}. Записано {processed_products} продуктів (груп) "
+                f"та {processed_variants} варіантів, без змін: {unchanged_groups}, "
+                f"знято з наявності: {missing_variants}."
+            )
+            return True
             
+        except ET.ParseError as e:
+            await session.rollback()
+            logger.error(f"Помилка парсингу XML {supplier_key}: {e}")
         except SQLAlchemyError as e:
             await session.rollback()
             logger.error(f"Помилка транзакції БД під час оновлення {supplier_key}: {e}", exc_info=True)
         except Exception as e:
             await session.rollback()
             logger.error(f"Неочікувана помилка під час транзакції БД {supplier_key}: {e}", exc_info=True)
+        finally:
+            if not producer.done():
+                producer.cancel()
+    return False
 
 # ---
 # ОНОВЛЕНІ ФУНКЦІЇ ПОШУКУ (ДЛЯ ГНУЧКОЇ СХЕМИ)
@@ -440,66 +476,32 @@ async def load_and_parse_xml_data(supplier_key: str = "landliz", xml_url: str |
 async def force_reload_products():
     """Примусово перезавантажує дані з XML у БД."""
     logger.info("Примусове оновлення БД з XML...")
-    await load_and_parse_xml_data(supplier_key="landliz", xml_url=str(config.mydrop_export_url))
+    await run_supplier_import(_DEFAULT_SUPPLIER_KEY, str(config.mydrop_export_url), force=True)
     logger.info("Примусове оновлення БД завершено.")
 
-async def get_product_by_sku(sku: str) -> Optional[Product]:
+async def get_product_by_sku(sku: str) -> Optional[ProductAPI]:
     """
-    Шукає товар за SKU у БАЗІ ДАНИХ та повертає модель Product 
-    з усіма завантаженими ОПЦІЯМИ та ВАРІАНТАМИ.
+    Шукає товар за SKU та повертає картку ProductAPI (опції + варіанти).
+    Читає через кеш карток (services.product_cache): гарячі товари - без походу в БД.
     """
-    if not sku: return None
-    normalized_sku = sku.strip().lower()
-    
-    async with AsyncSessionLocal() as session:
-        try:
-            stmt = select(Product).where(
-                Product.sku.ilike(normalized_sku)
-            ).options(
-                # Завантажуємо ВСІ пов'язані гнучкі дані
-                selectinload(Product.options).selectinload(ProductOption.values),
-                selectinload(Product.variants).selectinload(ProductVariant.option_values)
-            )
-            
-            result = await session.execute(stmt)
-            product = result.scalar_one_or_none()
-            return product
-            
-        except Exception as e:
-            logger.error(f"Неочікувана помилка get_product_by_sku: {e}", exc_info=True)
-            return None
+    try:
+        return await product_cache.get_product_card(sku)
+    except Exception as e:
+        logger.error(f"Неочікувана помилка get_product_by_sku: {e}", exc_info=True)
+        return None
 
 async def search_products(query: str, category_tag: Optional[str] = None) -> List[Product]:
     """
-    Шукає товари у БД за входженням у назву/SKU, 
+    Шукає товари у БД (ранжовано, по назві/SKU/опису),
     з можливістю фільтрації по КАТЕГОРІЇ (для MiniApp).
+    Перша сторінка `search_service.search_products_page`.
     """
-    if not query: return []
-    search_query = f"%{query.lower().strip()}%"
-    
-    async with AsyncSessionLocal() as session:
-        try:
-            stmt = select(Product).where(
-                (Product.name.ilike(search_query)) |
-                (Product.sku.ilike(search_query))
-            ).options(
-                # Важливо: завантажуємо варіанти, щоб показати ціну в каталозі
-                selectinload(Product.variants)
-            )
-            
-            # --- Гнучкий Фільтр Категорій (з Глобального Плану 12) ---
-            if category_tag:
-                stmt = stmt.where(Product.category_tag == category_tag)
-                
-            stmt = stmt.limit(20) # Обмежуємо кількість результатів
-            
-            result = await session.execute(stmt)
-            products = result.scalars().unique().all() # .unique() для уникнення дублів
-            return list(products)
-            
-        except Exception as e:
-            logger.error(f"Неочікувана помилка search_products: {e}", exc_info=True)
-            return []
+    try:
+        products, _ = await search_service.search_products_page(query, category_tag=category_tag)
+        return products
+    except Exception as e:
+        logger.error(f"Неочікувана помилка search_products: {e}", exc_info=True)
+        return []
 
 async def get_variant_by_offer_id(offer_id: str) -> Optional[ProductVariant]:
     """
@@ -521,19 +523,106 @@ async def get_variant_by_offer_id(offer_id: str) -> Optional[ProductVariant]:
             logger.error(f"Помилка пошуку в БД за offer_id '{offer_id}': {e}", exc_info=True)
             return None
 
+# ---
+# МУЛЬТИ-ПОСТАЧАЛЬНИЦЬКИЙ ПЛАНУВАЛЬНИК ІМПОРТУ
+# ---
+_DEFAULT_SUPPLIER_KEY = "landliz" # MyDrop-фід з .env (працює, навіть якщо його ще немає в БД)
+_IMPORT_JOB_PREFIX = "xml_import_"
+_SUPPLIER_SYNC_JOB_ID = "xml_import_sync_suppliers"
+_SUPPLIER_SYNC_INTERVAL_MIN = 10
+
+# Скільки фідів качаємо/парсимо одночасно (решта чекає в черзі)
+_import_semaphore = asyncio.Semaphore(max(1, config.xml_import_concurrency))
+# Імпорт одного постачальника ніколи не йде паралельно сам з собою
+_supplier_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+async def run_supplier_import(supplier_key: str, xml_url: str, force: bool = False):
+    """
+    Запускає імпорт одного постачальника через спільний пул:
+    - не більше `xml_import_concurrency` імпортів одночасно;
+    - записи в БД одного постачальника завжди послідовні (per-supplier lock).
+    """
+    lock = _supplier_locks[supplier_key]
+    if lock.locked() and not force:
+        logger.info(f"Імпорт '{supplier_key}' ще триває. Пропускаю цей запуск.")
+        return
+    async with lock:
+        async with _import_semaphore:
+            await load_and_parse_xml_data(supplier_key=supplier_key, xml_url=xml_url, force=force)
+
+async def _load_import_targets() -> Dict[str, str]:
+    """{supplier_key: xml_url} для всіх активних постачальників з XML-фідом."""
+    targets = {_DEFAULT_SUPPLIER_KEY: str(config.mydrop_export_url)}
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Supplier.key, Supplier.xml_url).where(
+                (Supplier.status == SupplierStatus.active) &
+                Supplier.xml_url.is_not(None) & (Supplier.xml_url != "")
+            ).order_by(Supplier.id)
+        )
+        for key, xml_url in result.all():
+            targets[key] = xml_url
+    return targets
+
+async def sync_supplier_import_jobs():
+    """
+    Синхронізує задачі планувальника з таблицею `suppliers`:
+    нові активні постачальники отримують свою задачу, вимкнені - втрачають.
+    Старти рознесені рівномірно по інтервалу, щоб фіди не оновлювались разом.
+    """
+    try:
+        targets = await _load_import_targets()
+    except SQLAlchemyError as e:
+        logger.error(f"Планувальник XML->БД: не вдалося отримати постачальників: {e}")
+        return
+
+    interval_sec = config.xml_cache_ttl_min * 60
+    now = datetime.now(timezone.utc)
+    wanted_job_ids = set()
+    for index, (supplier_key, xml_url) in enumerate(targets.items()):
+        job_id = f"{_IMPORT_JOB_PREFIX}{supplier_key}"
+        wanted_job_ids.add(job_id)
+        job = _scheduler.get_job(job_id)
+        if job:
+            if job.args != (supplier_key, xml_url):
+                job.modify(args=[supplier_key, xml_url])
+                logger.info(f"Планувальник XML->БД: оновлено URL для '{supplier_key}'.")
+            continue
+        _scheduler.add_job(
+            run_supplier_import,
+            'interval',
+            minutes=config.xml_cache_ttl_min,
+            jitter=min(60, interval_sec // 10), # Щоб задачі не "злипались" з часом
+            next_run_time=now + timedelta(seconds=index * interval_sec / len(targets)),
+            args=[supplier_key, xml_url],
+            id=job_id,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=120
+        )
+        logger.info(f"Планувальник XML->БД: додано задачу для '{supplier_key}'.")
+
+    for job in _scheduler.get_jobs():
+        if job.id.startswith(_IMPORT_JOB_PREFIX) and job.id != _SUPPLIER_SYNC_JOB_ID and job.id not in wanted_job_ids:
+            job.remove()
+            logger.info(f"Планувальник XML->БД: знято задачу '{job.id}' (постачальник неактивний).")
+
 def start_xml_parsing_scheduler():
-    """Запускає APScheduler для регулярного оновлення БД з XML."""
+    """Запускає APScheduler для регулярного оновлення БД з XML (всі постачальники)."""
     try:
-        if _scheduler.get_job('db_update_landliz'):
+        if _scheduler.get_job(_SUPPLIER_SYNC_JOB_ID):
             logger.info("Планувальник XML->БД вже запущено.")
             return
 
+        # Задачі імпорту створює/прибирає ця задача (одразу при старті і далі періодично)
         _scheduler.add_job(
-            load_and_parse_xml_data, 
-            'interval', 
-            minutes=config.xml_cache_ttl_min,
-            args=["landliz", str(config.mydrop_export_url)], 
-            id='db_update_landliz', 
+            sync_supplier_import_jobs,
+            'interval',
+            minutes=_SUPPLIER_SYNC_INTERVAL_MIN,
+            next_run_time=datetime.now(timezone.utc),
+            id=_SUPPLIER_SYNC_JOB_ID,
+            max_instances=1,
+            coalesce=True,
             misfire_grace_time=120
         )
         
@@ -8,7 +8,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Optional, Dict, Any
 
-from fastapi import FastAPI, HTTPException, Depends, Query, Request, Form
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Form, Response
 from fastapi.responses import JSONResponse, HTMLResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -25,14 +25,15 @@ from aiogram.types import Update, BotCommand
 
 from api_models import (
     ProductAPI, SecureCreateOrderRequest, SecureAddItemRequest, 
-    SecureUpdateItemRequest, SecureRemoveItemRequest
+    SecureUpdateItemRequest, SecureRemoveItemRequest, CatalogPageAPI
 )
 
 from services import (
     xml_parser, cart_service, order_service, 
     payment_service, delivery_service,
     payout_service, publisher_service,
-    omnichannel_service
+    omnichannel_service, search_service, search_index, catalog_service, product_cache,
+    catalog_snapshot, variant_cache, telegram_sender
 )
 from database.db import Base, engine, AsyncSessionLocal, get_db
 from database.models import (
@@ -50,6 +51,7 @@ bot = Bot(
     token=config.bot_token.get_secret_value(),
     default=DefaultBotProperties(parse_mode=ParseMode.HTML),
 )
+telegram_sender.install(bot) # Спільні ліміти Telegram для всіх відправок web_app
 
 dp = Dispatcher()
     
@@ -62,6 +64,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 @app.on_event("startup")
 async def startup_event():
@@ -69,6 +72,11 @@ async def startup_event():
     app.state.bot = bot
     logger.info("FastAPI startup: Bot instance ready (webhook mode).")
 
+    # In-memory пошуковий індекс (будується у фоні, далі оновлюється інкрементально)
+    search_index.start_search_index()
+    product_cache.start_product_cache()
+    variant_cache.start_variant_cache()
+
     # Ставимо webhook (Telegram має бачити публічний URL)
     webhook_url = f"{config.webhook_base_url}/webhook/webhook"
     try:
@@ -106,6 +114,15 @@ async def telegram_webhook(update: Dict[str, Any], request: Request):
 # --- Отримуємо юзера з JWT (який ми створили у Фазі 3.8) ---
 from services.auth_service import get_current_user
 
+def _cart_changed_response(cart_items: List[Dict[str, Any]], total_price: int, changes: List[Dict[str, Any]]) -> JSONResponse:
+    """409: ціни/наявність змінились після додавання в кошик - клієнт має підтвердити новий кошик."""
+    return JSONResponse(status_code=409, content={
+        "success": False,
+        "message": "Cart changed",
+        "changes": changes,
+        "cart": {"items": cart_items, "total_price": total_price}
+    })
+
 # ---
 # [НОВИЙ РОУТЕР - ФАЗА 4.1] (Платежі)
 # ---
@@ -129,8 +146,11 @@ async def create_payment_checkout(
     fsm_data = order_request.customer_data.dict()
     
     try:
-        # 1. Отримуємо кошик з Redis
-        cart_items, total_price = await cart_service.get_cart_contents(user_id)
+        # 1. Отримуємо кошик з Redis і звіряємо ціни/залишки з БД
+        cart_items, total_price, cart_changes = await cart_service.revalidate_cart(user_id)
+        if cart_changes:
+            # Спершу зміни: навіть якщо все розкупили, клієнт має побачити, що саме зникло
+            return _cart_changed_response(cart_items, total_price, cart_changes)
         if not cart_items:
             raise HTTPException(status_code=400, detail="Cart is empty")
         
@@ -334,14 +354,98 @@ app.include_router(delivery_router) # <-- ДОДАЄМО РОУТЕР
 
 # --- API Endpoints (Оновлено для Безпеки) ---
 @app.get("/api/v1/search", response_model=List[ProductAPI])
-async def api_search_products(query: str = Query(..., min_length=2, max_length=50)):
-    # ... (код без змін) ...
+async def api_search_products(
+    response: Response,
+    query: str = Query(..., min_length=2, max_length=50),
+    category: Optional[str] = Query(None, max_length=100),
+    only_available: bool = False,
+    cursor: Optional[str] = Query(None, max_length=200),
+    limit: int = Query(search_service.DEFAULT_PAGE_SIZE, ge=1, le=search_service.MAX_PAGE_SIZE)
+):
+    """
+    Ранжований пошук (фільтри: `category`, `only_available`). Наступна сторінка:
+    той самий запит з `cursor` із заголовка `X-Next-Cursor` (заголовка немає = це остання сторінка).
+    """
     try:
-        products_db = await xml_parser.search_products(query) 
+        index = search_index.get_index()
+        backend = search_service.cursor_backend(cursor) if cursor else None
+        if backend == search_service.CURSOR_DB:
+            index = None # Пагінацію почали в Postgres - там і продовжуємо
+        elif backend == search_service.CURSOR_INDEX and index is None:
+            # Курсор від індексу іншого процесу, а цей індекс ще будується
+            return JSONResponse(status_code=503, content={"detail": "Search index is warming up"}, headers={"Retry-After": "1"})
+
+        if index is not None:
+            # In-memory індекс віддає id, картки - з кешу карток (LRU/Redis), без повторної валідації
+            product_ids, next_cursor = index.search(
+                query, category_tag=category, only_available=only_available, limit=limit, cursor=cursor
+            )
+            cards = await product_cache.get_product_cards(product_ids)
+            payloads = [cards[product_id] for product_id in product_ids if product_id in cards]
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+            return JSONResponse(content=payloads, headers=headers)
+
+        # Індекс ще будується - шукаємо в Postgres
+        products_db, next_cursor = await search_service.search_products_page(
+            query, category_tag=category, limit=limit, cursor=cursor, only_available=only_available
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return products_db
+    except search_service.InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         logger.error(f"Помилка в API /search: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
+@app.get("/api/v1/catalog", response_model=CatalogPageAPI)
+async def api_catalog(
+    category: Optional[str] = Query(None, max_length=100),
+    raw_filters: List[str] = Query([], alias="filter"), # ?filter=Розмір:M&filter=Розмір:L&filter=Колір:чорний
+    only_available: bool = True,
+    cursor: Optional[int] = None,
+    limit: int = Query(catalog_service.DEFAULT_PAGE_SIZE, ge=1, le=catalog_service.MAX_PAGE_SIZE)
+):
+    """
+    Каталог з фільтрами (атрибути + опції) і лічильниками для панелі фільтрів.
+    Значення одного фасету - АБО, різних фасетів - І.
+    """
+    filters: Dict[str, List[str]] = {}
+    for item in raw_filters:
+        name, sep, value = item.partition(":")
+        if not sep or not name.strip() or not value.strip():
+            raise HTTPException(status_code=400, detail=f"Invalid filter '{item}', expected 'Name:value'")
+        filters.setdefault(name.strip(), []).append(value.strip())
+    try:
+        return await catalog_service.get_catalog_page(
+            category_tag=category, filters=filters, only_available=only_available,
+            limit=limit, cursor=cursor
+        )
+    except Exception as e:
+        logger.error(f"Помилка в API /catalog: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.get("/api/v1/catalog/snapshot")
+async def api_catalog_snapshot(request: Request):
+    """
+    Увесь каталог (товари в наявності, мін. ціна, мініатюра) одним документом.
+    Клієнт шле If-None-Match і перекачує лише після зміни каталогу (304 інакше).
+    """
+    try:
+        snapshot = await catalog_snapshot.get_snapshot()
+    except Exception as e:
+        logger.error(f"Помилка в API /catalog/snapshot: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Catalog snapshot is not ready")
+
+    encoding = snapshot.choose_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": snapshot.etag(encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if snapshot.is_not_modified(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    if encoding != catalog_snapshot.IDENTITY:
+        headers["Content-Encoding"] = encoding
+    return Response(content=snapshot.bodies[encoding], media_type="application/json", headers=headers)
+
 @app.get("/api/v1/product/{sku}", response_model=ProductAPI)
 async def api_get_product_by_sku(sku: str):
     # ... (код без змін) ...
@@ -431,7 +535,10 @@ async def api_create_cod_order(
     
     try:
         user_id = current_user.id # <-- БЕЗПЕЧНО
-        cart_items, total_price = await cart_service.get_cart_contents(user_id)
+        cart_items, total_price, cart_changes = await cart_service.revalidate_cart(user_id)
+        if cart_changes:
+            # Спершу зміни: навіть якщо все розкупили, клієнт має побачити, що саме зникло
+            return _cart_changed_response(cart_items, total_price, cart_changes)
         if not cart_items:
             raise HTTPException(status_code=400, detail="Cart is empty")
         